@@ -1,15 +1,30 @@
 import os
+import queue
+import re
 import threading
 import time
+import uuid
 import wave
 
-import pyaudio
+# pyaudio, vad y voice_codec (numpy) se importan al usarse: abrir la ventana
+# no espera a cargarlos ni a que PortAudio sondee los dispositivos
 
 # Audio recording parameters
-FORMAT = pyaudio.paInt16
+SAMPWIDTH = 2  # bytes por muestra (paInt16)
 CHANNELS = 1
 RATE = 44100
 CHUNK = 512
+REC_BUFFER_CHUNKS = 64  # chunks acumulados en memoria antes de volcarlos al WAV
+LIVE_CHUNKS = 8  # chunks por frame de audio en vivo (~93 ms)
+JITTER_MS = 200  # audio en vivo acumulado antes de empezar a reproducir
+LIVE_TIMEOUT = 5.0  # segundos sin trozos para dar por cortado un audio en vivo
+MAX_STREAMS_VIVO = 8  # audios en vivo recibiéndose a la vez; el más viejo se cierra
+STREAM_ID_VALIDO = re.compile(r"[0-9a-f]{12}")  # uuid4().hex[:12] del emisor
+PLAY_CHUNK = 4096  # frames por escritura al reproducir (menos overhead por bloque)
+
+# Sonido de notificación de mensajes nuevos
+NOTIF_WAV = "notif.wav"
+NOTIF_INTERVALO_MIN = 3.0  # segundos mínimos entre dos campanas
 
 
 class AudioManager:
@@ -23,31 +38,77 @@ class AudioManager:
         self.folder_sent = "audios_enviados"
         self.folder_received = "audios_recibidos"
 
-        # PyAudio
-        self.p = pyaudio.PyAudio()
+        # PyAudio: se crea al primer uso (ver la propiedad p) o en precalentar()
+        self._p = None
+        self._p_lock = threading.Lock()
 
         # Estado de grabación
         self.recording = False
-        self.audio_frames = []
         self.stream = None
         self.recording_thread = None
+        self.ruta_grabacion = None  # WAV que se escribe mientras se graba
+        self.chunks_grabados = 0
+        self._wav_grabacion = None
+        self.recortar_silencios = True  # quitar silencio inicial/final antes de enviar
+        self.comprimir_pausas = True  # acortar también las pausas largas internas
+
+        # Audio en vivo: envío mientras se graba y recepción con búfer de jitter
+        self.en_vivo = None  # datos del envío en vivo en curso
+        self._cola_vivo = None
+        self._streams_vivo = {}  # (remitente, stream_id) -> recepción en curso
+
+        # Motor de reproducción: un hilo, una cola y un stream abierto por formato
+        self._cola_reproduccion = queue.Queue()
+        self._hilo_motor = None
+        self._streams_salida = {}  # (sampwidth, canales, tasa) -> stream
+        self._detener_actual = threading.Event()
+        self._seek_pendiente = None
+        self.reproduciendo = None  # ruta del audio que suena ahora
+
+        # Notificaciones: un único hilo reproduce el PCM ya cargado en memoria
+        self._notif_evento = threading.Event()
+        self._notif_hilo = None
+        self._hilos_lock = threading.Lock()
+        self._cerrando = threading.Event()
+
+    @property
+    def p(self):
+        """Instancia de PyAudio. Crearla sondea todos los dispositivos de audio
+        (puede tardar), así que no se hace hasta que hace falta."""
+        with self._p_lock:
+            if self._p is None:
+                import pyaudio
+
+                self._p = pyaudio.PyAudio()
+            return self._p
+
+    def precalentar(self):
+        """Carga en segundo plano lo que el primer audio necesitará."""
+        import vad  # noqa: F401
+        import voice_codec  # noqa: F401
+
+        self.p  # abre PyAudio
 
     def _get_temp_filename(self, username):
         return f"audio_{username}_{int(time.time())}.wav"  # Returna un nombre de archivo temporal único
 
-    def start_recording(self):
+    def start_recording(self, destino=None, sender_username=None, send_frame_func=None, codec=None):
+        """Empieza a grabar. Si se pasan destino y send_frame_func el audio se
+        transmite en vivo (frames "audio_chunk") mientras se graba."""
         if self.recording:
             if self.master:
                 self.master._log_local("Ya está grabando!\n")
             return
 
-        # Reiniciar buffer
-        self.audio_frames = []
+        # La grabación se escribe directamente al WAV definitivo
+        usuario = getattr(self.master, "username", None) or "local"
+        self.ruta_grabacion = os.path.join(self.folder_sent, self._get_temp_filename(usuario))
+        self.chunks_grabados = 0
 
         # Abrir stream de entrada
         try:
             self.stream = self.p.open(
-                format=FORMAT,
+                format=self.p.get_format_from_width(SAMPWIDTH),
                 channels=CHANNELS,
                 rate=RATE,
                 input=True,
@@ -58,6 +119,33 @@ class AudioManager:
                 self.master._log_local(f"[ERROR] No se pudo abrir el micrófono: {e}\n")
             return
 
+        try:
+            os.makedirs(self.folder_sent, exist_ok=True)
+            self._wav_grabacion = wave.open(self.ruta_grabacion, "wb")
+            self._wav_grabacion.setnchannels(CHANNELS)
+            self._wav_grabacion.setsampwidth(SAMPWIDTH)
+            self._wav_grabacion.setframerate(RATE)
+        except Exception as e:
+            self.stream.close()
+            if self.master:
+                self.master._log_local(f"[ERROR] No se pudo crear el archivo de audio: {e}\n")
+            return
+
+        self.en_vivo = None
+        if destino and send_frame_func:
+            self.en_vivo = {
+                "destino": destino,
+                "from": sender_username,
+                "stream_id": uuid.uuid4().hex[:12],
+                "codec": codec,
+            }
+            self._cola_vivo = queue.Queue()
+            threading.Thread(
+                target=self._hilo_envio_vivo,
+                args=(self.en_vivo, self._cola_vivo, send_frame_func),
+                daemon=True,
+            ).start()
+
         self.recording = True
         # iniciar stream de grabación en un hilo separado
         self.recording_thread = threading.Thread(target=self._record, daemon=True)
@@ -71,13 +159,46 @@ class AudioManager:
                 pass
 
     def _record(self):
+        """Lee el micrófono a un buffer preasignado y lo vuelca al WAV por bloques."""
+        tam_chunk = CHUNK * CHANNELS * SAMPWIDTH
+        buffer = bytearray(tam_chunk * REC_BUFFER_CHUNKS)
+        vista = memoryview(buffer)
+        pos = 0
+        vivo_desde = 0  # inicio de lo que aún no se transmitió en vivo
+        cola_vivo = self._cola_vivo if self.en_vivo else None
+
         while self.recording:
             try:
                 data = self.stream.read(CHUNK, exception_on_overflow=False)
-                self.audio_frames.append(data)
             except Exception:
                 # Ignorar errores menores de overflow
-                pass
+                continue
+            if pos + len(data) > len(buffer):
+                if cola_vivo and pos > vivo_desde:
+                    cola_vivo.put(bytes(vista[vivo_desde:pos]))
+                self._wav_grabacion.writeframesraw(vista[:pos])
+                pos = vivo_desde = 0
+            vista[pos : pos + len(data)] = data
+            pos += len(data)
+            self.chunks_grabados += 1
+            if cola_vivo and pos - vivo_desde >= tam_chunk * LIVE_CHUNKS:
+                cola_vivo.put(bytes(vista[vivo_desde:pos]))
+                vivo_desde = pos
+
+        if cola_vivo:
+            if pos > vivo_desde:
+                cola_vivo.put(bytes(vista[vivo_desde:pos]))
+            cola_vivo.put(None)
+
+        try:
+            if pos:
+                self._wav_grabacion.writeframesraw(vista[:pos])
+            # close() corrige la cabecera con la longitud final
+            self._wav_grabacion.close()
+        except Exception as e:
+            print(f"[AUDIO] Error al escribir la grabación: {e}")
+        finally:
+            self._wav_grabacion = None
 
         try:
             if self.stream is not None:
@@ -94,6 +215,17 @@ class AudioManager:
         self.recording = False
         if self.recording_thread:
             self.recording_thread.join()
+
+        if self.en_vivo:
+            # Ya se transmitió mientras se grababa; _hilo_envio_vivo cierra el envío
+            self.en_vivo = None
+            if self.master:
+                try:
+                    self.master.master.after(0, self.master.actualizar_botones_audio, False)
+                except Exception:
+                    pass
+            return
+
         log_local_func("[PROCESANDO] Guardando y enviando nota de voz...\n")
 
         hilo_envio = threading.Thread(
@@ -111,23 +243,30 @@ class AudioManager:
 
     def _hilo_guardar_enviar(
         self, destino, sender_username, send_frame_func, log_local_func
-    ):  # Guarda el audio y lo envía
-        nombre_archivo = self._get_temp_filename(sender_username)
-        ruta_temporal = os.path.join(self.folder_sent, nombre_archivo)
+    ):  # Valida el WAV ya escrito y lo envía leyéndolo por partes
+        ruta_temporal = self.ruta_grabacion
+        nombre_archivo = os.path.basename(ruta_temporal)
 
-        # Guardar el archivo WAV
         try:
-            if len(self.audio_frames) < 5:
+            if self.chunks_grabados < 5:
                 log_local_func(
                     "[ERROR] La grabación fue demasiado corta o falló. No se enviará audio.\n"
                 )
                 return
-            os.makedirs(self.folder_sent, exist_ok=True)
-            with wave.open(ruta_temporal, "wb") as wf:
-                wf.setnchannels(CHANNELS)
-                wf.setsampwidth(self.p.get_sample_size(FORMAT))
-                wf.setframerate(RATE)
-                wf.writeframes(b"".join(self.audio_frames))
+            if self.recortar_silencios:
+                import vad
+
+                recortado = ruta_temporal + ".vad"
+                duraciones = vad.recortar_wav(ruta_temporal, recortado, self.comprimir_pausas)
+                if duraciones is None:
+                    log_local_func(
+                        "[ERROR] La grabación solo contiene silencio. No se enviará audio.\n"
+                    )
+                    return
+                os.replace(recortado, ruta_temporal)
+                antes, despues = duraciones
+                if despues < antes:
+                    log_local_func(f"[AUDIO] Silencios recortados: {antes:.1f} s -> {despues:.1f} s\n")
             tam = os.path.getsize(ruta_temporal)
             if tam < 1000:
                 log_local_func(
@@ -137,14 +276,9 @@ class AudioManager:
         except Exception as e:
             log_local_func(f"[ERROR] Fallo al guardar audio: {e}\n")
             return
-        finally:
-            # Limpiar buffer local
-            self.audio_frames = []
 
         # Enviar como frame con tipo "audio"
         try:
-            tam = os.path.getsize(ruta_temporal)
-
             header = {
                 "type": "audio",
                 "from": sender_username,
@@ -153,56 +287,313 @@ class AudioManager:
                 "filesize": tam,
             }
 
-            with open(ruta_temporal, "rb") as f:
-                datos = f.read()
-
-            send_frame_func(header, datos)
+            # Comprimir si todos los receptores entienden algún codec de voz
+            ruta_envio = ruta_temporal
+            codec = self.master.codec_para(destino) if self.master else None
+            if codec:
+                import voice_codec
+
+                ruta_envio = os.path.splitext(ruta_temporal)[0] + f".{codec}"
+                tam = voice_codec.codificar_archivo(ruta_temporal, ruta_envio, codec)
+                header["codec"] = codec
+                header["filesize"] = tam
+
+            # send_frame acepta un archivo abierto y lo envía sin cargarlo entero
+            with open(ruta_envio, "rb") as f:
+                send_frame_func(header, f)
+            if codec:
+                os.remove(ruta_envio)
             log_local_func(
-                f"[AUDIO] Yo -> {destino}: '{nombre_archivo}' ({tam} bytes)\n"
+                f"[AUDIO] Yo -> {destino}: '{nombre_archivo}' ({tam} bytes{', ' + codec if codec else ''})\n"
             )
 
         except Exception as e:
             log_local_func(f"[ERROR] No se pudo enviar el audio: {e}\n")
 
+    def _hilo_envio_vivo(self, en_vivo, cola, send_frame_func):
+        """Envía como "audio_chunk" lo que _record va dejando en la cola."""
+        import voice_codec
+
+        codificador = voice_codec.CodificadorStream(RATE, en_vivo["codec"]) if en_vivo["codec"] else None
+        base = {
+            "from": en_vivo["from"],
+            "to": en_vivo["destino"],
+            "stream_id": en_vivo["stream_id"],
+        }
+        parte = 0
+        enviado = 0
+        fallo = None
+        while True:
+            pcm = cola.get()
+            if fallo:
+                if pcm is None:
+                    break
+                continue  # descartar hasta que termine la grabación
+            try:
+                if pcm is None:
+                    datos = codificador.finalizar() if codificador else b""
+                else:
+                    datos = codificador.codificar(pcm) if codificador else pcm
+                if datos:
+                    header = dict(base, type="audio_chunk", parte=parte, filesize=len(datos), rate=RATE)
+                    if codificador:
+                        header["codec"] = en_vivo["codec"]
+                    send_frame_func(header, datos)
+                    parte += 1
+                    enviado += len(datos)
+                if pcm is None:
+                    send_frame_func(dict(base, type="audio_fin", parte=parte))
+                    break
+            except Exception as e:
+                fallo = e
+
+        log = self.master._log_local if self.master else print
+        if fallo:
+            log(f"[ERROR] Se cortó el audio en vivo: {fallo}\n")
+        else:
+            log(f"[AUDIO] Yo -> {en_vivo['destino']}: audio en vivo ({enviado} bytes)\n")
+
+    def recibir_chunk(self, header, payload):
+        """Recibe un trozo de audio en vivo: lo encola para sonar y lo añade al WAV
+        que se está ensamblando. Devuelve True si es el primero de ese audio."""
+        import voice_codec
+
+        remitente, stream_id = header.get("from"), header.get("stream_id")
+        if not (isinstance(stream_id, str) and STREAM_ID_VALIDO.fullmatch(stream_id)):
+            print(f"[AUDIO] Audio en vivo de {remitente} con stream_id no válido: descartado")
+            return False
+        clave = (remitente, stream_id)
+        recepcion = self._streams_vivo.get(clave)
+        nuevo = recepcion is None
+        if nuevo:
+            if len(self._streams_vivo) >= MAX_STREAMS_VIVO:
+                # Uno que nunca mandó audio_fin no puede dejar archivos abiertos sin límite
+                viejo = next(iter(self._streams_vivo))
+                self.finalizar_stream({"from": viejo[0], "stream_id": viejo[1]})
+            codec = header.get("codec")
+            tasa = voice_codec.RATE_CODEC if codec else header.get("rate", RATE)
+            os.makedirs(self.folder_received, exist_ok=True)
+            # El nombre del remitente llega por la red: solo letras, dígitos, _ y -
+            nombre = re.sub(r"[^\w-]", "_", str(remitente))[:40]
+            ruta = os.path.join(self.folder_received, f"vivo_{nombre}_{stream_id}.wav")
+            wf = wave.open(ruta, "wb")
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(tasa)
+            recepcion = {"ruta": ruta, "wav": wf, "cola": queue.Queue(), "codec": codec}
+            self._streams_vivo[clave] = recepcion
+            log = self.master._log_local if self.master else print
+            self._encolar_reproduccion(("vivo", recepcion["cola"], tasa, log))
+
+        if recepcion["codec"]:
+            pcm = voice_codec.mulaw_decodificar(payload).tobytes()
+        else:
+            pcm = payload
+        recepcion["wav"].writeframesraw(pcm)
+        recepcion["cola"].put(pcm)
+        return nuevo
+
+    def finalizar_stream(self, header):
+        """Cierra un audio en vivo. Devuelve la ruta del WAV ensamblado (o None)."""
+        recepcion = self._streams_vivo.pop((header.get("from"), header.get("stream_id")), None)
+        if recepcion is None:
+            return None
+        recepcion["cola"].put(None)
+        recepcion["wav"].close()
+        return recepcion["ruta"]
+
+    def cerrar_streams_vivo(self):
+        """Cierra los audios en vivo a medias (p. ej. al perder la conexión)."""
+        for clave in list(self._streams_vivo):
+            self.finalizar_stream({"from": clave[0], "stream_id": clave[1]})
+
     def reproducir_audio(self, ruta_audio, log_local_func):
-        """Inicia la reproducción de un archivo WAV en un nuevo hilo."""
-        hilo = threading.Thread(
-            target=self._hilo_reproductor,
-            args=(ruta_audio, log_local_func),
-            daemon=True,
-        )
-        hilo.start()
+        """Encola un archivo WAV en el motor de reproducción."""
+        self._encolar_reproduccion(("archivo", ruta_audio, log_local_func))
+
+    def _encolar_reproduccion(self, pedido):
+        with self._hilos_lock:
+            if self._hilo_motor is None:
+                self._hilo_motor = threading.Thread(target=self._hilo_reproductor, daemon=True)
+                self._hilo_motor.start()
+        self._cola_reproduccion.put(pedido)
+
+    def detener_reproduccion(self):
+        """Corta el audio que suena y descarta los que estaban en cola."""
+        try:
+            while True:
+                self._cola_reproduccion.get_nowait()
+        except queue.Empty:
+            pass
+        self._detener_actual.set()
+
+    def siguiente_audio(self):
+        """Corta el audio que suena y pasa al siguiente de la cola."""
+        self._detener_actual.set()
+
+    def buscar(self, segundos):
+        """Mueve la reproducción actual a `segundos` desde el inicio."""
+        self._seek_pendiente = max(0.0, float(segundos))
+
+    def _stream_salida(self, sampwidth, canales, tasa):
+        """Devuelve el stream de salida de ese formato, abriéndolo solo la primera vez."""
+        clave = (sampwidth, canales, tasa)
+        stream = self._streams_salida.get(clave)
+        if stream is None:
+            stream = self.p.open(
+                format=self.p.get_format_from_width(sampwidth),
+                channels=canales,
+                rate=tasa,
+                output=True,
+                frames_per_buffer=PLAY_CHUNK,
+            )
+            self._streams_salida[clave] = stream
+        return stream
+
+    def _hilo_reproductor(self):
+        """Único hilo de reproducción: atiende la cola hasta recibir None."""
+        while True:
+            pedido = self._cola_reproduccion.get()
+            if pedido is None:
+                break
+            self._detener_actual.clear()
+            self._seek_pendiente = None
+            if pedido[0] == "vivo":
+                self._reproducir_vivo(*pedido[1:])
+            else:
+                self._reproducir_wav(*pedido[1:])
+
+        for stream in self._streams_salida.values():
+            try:
+                stream.stop_stream()
+                stream.close()
+            except Exception:
+                pass
+        self._streams_salida.clear()
 
-    def _hilo_reproductor(self, ruta_audio, log_local_func):
+    def _reproducir_wav(self, ruta_audio, log_local_func):
         """Ejecuta la reproducción real del archivo WAV."""
         try:
             if not os.path.exists(ruta_audio):
                 raise FileNotFoundError(f"archivo no encontrado: {ruta_audio}")
             with wave.open(ruta_audio, "rb") as wf:
-                # Abrir stream de reproducción
-                stream = self.p.open(
-                    format=self.p.get_format_from_width(wf.getsampwidth()),
-                    channels=wf.getnchannels(),
-                    rate=wf.getframerate(),
-                    output=True,
+                stream = self._stream_salida(
+                    wf.getsampwidth(), wf.getnchannels(), wf.getframerate()
                 )
-
-                data = wf.readframes(CHUNK)
-                while data:
+                self.reproduciendo = ruta_audio
+
+                while not self._detener_actual.is_set():
+                    if self._seek_pendiente is not None:
+                        frame = int(self._seek_pendiente * wf.getframerate())
+                        self._seek_pendiente = None
+                        wf.setpos(min(frame, wf.getnframes()))
+                    data = wf.readframes(PLAY_CHUNK)
+                    if not data:
+                        break
                     stream.write(data)
-                    data = wf.readframes(CHUNK)
 
-                stream.stop_stream()
-                stream.close()
-                log_local_func(
-                    f"[AUDIO] Reproducción de '{os.path.basename(ruta_audio)}' finalizada.\n"
-                )
+            estado = "detenida" if self._detener_actual.is_set() else "finalizada"
+            log_local_func(
+                f"[AUDIO] Reproducción de '{os.path.basename(ruta_audio)}' {estado}.\n"
+            )
 
         except Exception as e:
             log_local_func(f"[ERROR] Fallo al reproducir audio con PyAudio: {e}\n")
+        finally:
+            self.reproduciendo = None
+
+    def _reproducir_vivo(self, cola, tasa, log_local_func):
+        """Reproduce un audio en vivo tras acumular JITTER_MS en el búfer."""
+        try:
+            stream = self._stream_salida(2, 1, tasa)
+            umbral = tasa * 2 * JITTER_MS // 1000
+            inicial = []
+            acumulado = 0
+            fin = False
+
+            # Búfer de jitter: no empezar hasta tener margen (o hasta que termine)
+            while acumulado < umbral:
+                pcm = cola.get(timeout=LIVE_TIMEOUT)
+                if pcm is None:
+                    fin = True
+                    break
+                inicial.append(pcm)
+                acumulado += len(pcm)
+
+            for pcm in inicial:
+                if self._detener_actual.is_set():
+                    return
+                stream.write(pcm)
+
+            while not fin and not self._detener_actual.is_set():
+                pcm = cola.get(timeout=LIVE_TIMEOUT)
+                if pcm is None:
+                    break
+                stream.write(pcm)
+
+        except queue.Empty:
+            log_local_func("[AUDIO] El audio en vivo dejó de llegar.\n")
+        except Exception as e:
+            log_local_func(f"[ERROR] Fallo al reproducir audio en vivo: {e}\n")
+
+    def notificar(self):
+        """Pide que suene la notificación. Una ráfaga de mensajes produce una sola campana."""
+        with self._hilos_lock:
+            if self._notif_hilo is None:
+                self._notif_hilo = threading.Thread(
+                    target=self._hilo_notificaciones, daemon=True
+                )
+                self._notif_hilo.start()
+        self._notif_evento.set()
+
+    def _hilo_notificaciones(self):
+        """Carga notif.wav una vez y lo reproduce por un stream que queda abierto."""
+        try:
+            with wave.open(NOTIF_WAV, "rb") as wf:
+                sampwidth = wf.getsampwidth()
+                canales = wf.getnchannels()
+                tasa = wf.getframerate()
+                pcm = wf.readframes(wf.getnframes())
+            stream = self.p.open(
+                format=self.p.get_format_from_width(sampwidth),
+                channels=canales,
+                rate=tasa,
+                output=True,
+            )
+        except Exception as e:
+            print(f"[AUDIO] Notificaciones desactivadas: {e}")
+            return
+
+        try:
+            while not self._cerrando.is_set():
+                self._notif_evento.wait()
+                if self._cerrando.is_set():
+                    break
+                inicio = time.monotonic()
+                stream.write(pcm)
+                # Los avisos que lleguen durante la campana y la pausa se descartan
+                self._cerrando.wait(max(0.0, NOTIF_INTERVALO_MIN - (time.monotonic() - inicio)))
+                self._notif_evento.clear()
+        except Exception as e:
+            print(f"[AUDIO] Error en notificaciones: {e}")
+        finally:
+            try:
+                stream.stop_stream()
+                stream.close()
+            except Exception:
+                pass
 
     def terminate(self):
+        self._cerrando.set()
+        self._notif_evento.set()
+        if self._notif_hilo is not None:
+            self._notif_hilo.join(timeout=NOTIF_INTERVALO_MIN)
+        if self._hilo_motor is not None:
+            self.detener_reproduccion()
+            self._cola_reproduccion.put(None)
+            self._hilo_motor.join(timeout=1.0)
         try:
-            self.p.terminate()
+            if self._p is not None:
+                self._p.terminate()
         except Exception:
             pass
@@ -0,0 +1,112 @@
+"""Benchmark: tiempo de arranque del cliente GUI.
+
+Arranca --repeticiones veces un proceso nuevo que importa chat_client_gui,
+crea la ventana y la dibuja, y mide desde que se lanza el proceso:
+
+- importación de chat_client_gui,
+- primera pintura de la ventana (todo lo de __init__ más un update()),
+- precalentado terminado (numpy, PIL y PyAudio listos en segundo plano).
+
+Muestra además los módulos que más tardan en importarse (python -X importtime).
+Necesita una pantalla (o Xvfb) para crear la ventana.
+
+Uso:
+    python benchmarks/bench_arranque.py [--repeticiones 5] [--top 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se ejecuta en el proceso hijo; los tiempos son desde que empieza el intérprete
+HIJO = """
+import json, os, sys, time
+inicio = time.perf_counter() - (time.time() - {lanzado})
+sys.path.insert(0, {raiz!r})
+import historial
+historial.RUTA_DB = {db!r}
+import chat_client_gui
+t_import = time.perf_counter()
+import tkinter as tk
+root = tk.Tk()
+app = chat_client_gui.ChatClientGUI(root)
+root.update()
+t_pintura = time.perf_counter()
+while not app.precalentado.is_set():
+    root.update()
+    time.sleep(0.005)
+t_listo = time.perf_counter()
+print(json.dumps({{
+    "importación": (t_import - inicio) * 1000,
+    "primera pintura": (t_pintura - inicio) * 1000,
+    "precalentado": (t_listo - inicio) * 1000,
+}}))
+sys.stdout.flush()
+os._exit(0)
+"""
+
+
+def medir_arranque(db):
+    codigo = HIJO.format(lanzado=time.time(), raiz=RAIZ, db=db)
+    salida = subprocess.run(
+        [sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, timeout=60
+    )
+    if salida.returncode != 0:
+        raise RuntimeError(salida.stderr.strip().splitlines()[-1] if salida.stderr else "falló")
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def modulos_lentos(top):
+    """[(ms acumulados, módulo)] de los imports directos más lentos."""
+    salida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import chat_client_gui"],
+        cwd=RAIZ, capture_output=True, text=True, timeout=60,
+    )
+    total, directos = 0.0, []
+    for linea in salida.stderr.splitlines():
+        if not linea.startswith("import time:") or "|" not in linea:
+            continue
+        _, acumulado, nombre = linea.split("|")
+        if not acumulado.strip().isdigit():
+            continue  # cabecera
+        profundidad = len(nombre) - len(nombre.lstrip())
+        nombre = nombre.strip()
+        if nombre == "chat_client_gui":
+            total = int(acumulado) / 1000
+        elif profundidad <= 3:  # importados directamente por chat_client_gui
+            directos.append((int(acumulado) / 1000, nombre))
+    return total, sorted(directos, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="módulos más lentos a mostrar")
+    args = parser.parse_args()
+
+    total, lentos = modulos_lentos(args.top)
+    print(f"import chat_client_gui: {total:.0f} ms (python -X importtime)")
+    for ms, nombre in lentos:
+        print(f"  {ms:7.1f} ms  {nombre}")
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        db = os.path.join(carpeta, "historial.db")
+        try:
+            medidas = [medir_arranque(db) for _ in range(args.repeticiones)]
+        except RuntimeError as e:
+            print(f"No se pudo abrir la ventana: {e}")
+            return
+    print(f"Desde que arranca el proceso (mediana de {args.repeticiones}):")
+    for clave in medidas[0]:
+        valores = [m[clave] for m in medidas]
+        print(f"  {clave:>16}: {statistics.median(valores):7.1f} ms (mín {min(valores):.1f}, máx {max(valores):.1f})")
+
+
+if __name__ == "__main__":
+    main()
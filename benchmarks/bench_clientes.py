@@ -0,0 +1,110 @@
+"""Benchmark: muchos clientes sin interfaz (chat_client.ChatClient) en un proceso.
+
+Arranca un servidor en otro proceso (o usa uno existente con --port), conecta N
+clientes en el mismo event loop y cada uno envía mensajes directos a otro
+cliente al azar. Mide tiempo de conexión, mensajes/segundo, latencia y memoria.
+
+Cada login reenvía la lista de usuarios a todos los conectados, así que conectar
+N clientes cuesta O(N²) frames en el servidor; por eso el valor por defecto es
+moderado.
+
+Uso:
+    python benchmarks/bench_clientes.py [--clientes 200] [--mensajes 20] [--port 0]
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_client import ChatClient  # noqa: E402
+from metricas import Metricas  # noqa: E402
+
+PORT_BENCH = 65480
+
+
+async def ejecutar(args, port):
+    metricas = Metricas()
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+
+    esperados = args.clientes * args.mensajes
+    recibidos = 0
+    todos_recibidos = asyncio.Event()
+
+    async def leer(cliente):
+        nonlocal recibidos
+        async for header, _ in cliente:
+            if header.get("type") == "text":
+                recibidos += 1
+                if recibidos == esperados:
+                    todos_recibidos.set()
+
+    # Los lectores se arrancan junto a cada conexión: un cliente que no consume
+    # deja de leer del socket y frena al servidor
+    t0 = time.perf_counter()
+    clientes = []
+    lectores = []
+    for i in range(args.clientes):
+        cliente = ChatClient(f"bot{i}", "127.0.0.1", port, reconectar=False, metricas=metricas)
+        await cliente.conectar()
+        clientes.append(cliente)
+        lectores.append(asyncio.create_task(leer(cliente)))
+    t_conexion = time.perf_counter() - t0
+    memoria = (tracemalloc.get_traced_memory()[0] - antes) / args.clientes
+    tracemalloc.stop()
+
+    async def hablar(cliente):
+        for n in range(args.mensajes):
+            destino = random.choice(clientes).username
+            await cliente.enviar_texto(destino, f"mensaje {n}")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(hablar(c) for c in clientes))
+    await asyncio.wait_for(todos_recibidos.wait(), 60)
+    t_mensajes = time.perf_counter() - t0
+
+    for cliente in clientes:
+        await cliente.cerrar()
+    await asyncio.gather(*lectores, return_exceptions=True)
+
+    print(f"{args.clientes} clientes conectados en {t_conexion:.2f} s "
+          f"(~{memoria / 1024:.1f} KiB por cliente)")
+    print(f"{esperados} mensajes en {t_mensajes:.2f} s = {esperados / t_mensajes:,.0f} mensajes/s")
+    print("latencia", metricas.histogramas["extremo a extremo text"].resumen())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--mensajes", type=int, default=20, help="mensajes por cliente")
+    parser.add_argument("--port", type=int, default=0,
+                        help="servidor ya arrancado (0 = arrancar uno en este proceso)")
+    args = parser.parse_args()
+
+    port = args.port
+    servidor = None
+    if not port:
+        port = PORT_BENCH
+        raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        servidor = subprocess.Popen(
+            [sys.executable, "-c", f"import chat_server; chat_server.PORT = {port}; chat_server.main()"],
+            cwd=raiz,
+            stdout=subprocess.DEVNULL,
+        )
+        time.sleep(0.5)
+
+    try:
+        asyncio.run(ejecutar(args, port))
+    finally:
+        if servidor:
+            servidor.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark: caché de descargas por contenido frente a un archivo por recepción.
+
+Simula la recepción de --archivos archivos distintos (memes de --kb KB) que
+llegan --repeticiones veces cada uno, reenviados por distintos usuarios, y los
+guarda como antes (un archivo nuevo nombre_1, nombre_2... por recepción) y con
+descargas.CacheDescargas. Compara el tiempo por recepción, los archivos
+visibles y el espacio que ocupan de verdad en disco (contando una sola vez los
+enlaces duros).
+
+Mide también lo que cuesta calcular el hash mientras llega un archivo grande
+en partes (Ensamblador con hashear=True) frente a no calcularlo.
+
+Uso:
+    python benchmarks/bench_descargas.py [--archivos 50] [--repeticiones 10] [--kb 300] [--mb 100]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from descargas import CacheDescargas  # noqa: E402
+from multiplexado import TAM_PARTE, Ensamblador  # noqa: E402
+
+
+def guardar_antes(carpeta, nombre, datos):
+    """Lo que hacía la GUI: buscar un nombre libre y escribir siempre."""
+    ruta = os.path.join(carpeta, nombre)
+    base, ext = os.path.splitext(ruta)
+    i = 1
+    while os.path.exists(ruta):
+        ruta = f"{base}_{i}{ext}"
+        i += 1
+    with open(ruta, "wb") as f:
+        f.write(datos)
+    return ruta
+
+
+def ocupado(carpetas):
+    """(archivos visibles, bytes en disco contando cada inodo una vez)."""
+    visibles, inodos = 0, {}
+    for carpeta, ocultas in carpetas:
+        for entrada in os.scandir(carpeta):
+            if not entrada.is_file():
+                continue
+            st = entrada.stat()
+            inodos[(st.st_dev, st.st_ino)] = st.st_size
+            visibles += not ocultas
+    return visibles, sum(inodos.values())
+
+
+def recepciones(args):
+    rng = random.Random(0)
+    memes = [(f"meme{i}.jpg", rng.randbytes(args.kb * 1024)) for i in range(args.archivos)]
+    lista = [(f"usuario{rng.randrange(8)}", nombre, datos) for nombre, datos in memes for _ in range(args.repeticiones)]
+    rng.shuffle(lista)
+    return lista
+
+
+def medir_guardado(args):
+    lista = recepciones(args)
+    with tempfile.TemporaryDirectory() as raiz:
+        antes = os.path.join(raiz, "antes")
+        os.makedirs(antes)
+        t0 = time.perf_counter()
+        for _, nombre, datos in lista:
+            guardar_antes(antes, nombre, datos)
+        t_antes = time.perf_counter() - t0
+        visibles_antes, disco_antes = ocupado([(antes, False)])
+
+        visibles = os.path.join(raiz, "descargas")
+        cache = CacheDescargas(os.path.join(raiz, "cache"))
+        t0 = time.perf_counter()
+        for remitente, nombre, datos in lista:
+            cache.guardar(visibles, nombre, datos, remitente=remitente)
+        t_cache = time.perf_counter() - t0
+        cache.cerrar()
+        visibles_cache, disco_cache = ocupado([(visibles, False), (os.path.join(raiz, "cache"), True)])
+
+    n = len(lista)
+    print(f"{n} recepciones de {args.archivos} archivos distintos de {args.kb} KB")
+    print(f"  antes: {t_antes / n * 1000:.2f} ms por recepción, {visibles_antes} archivos, "
+          f"{disco_antes / 1e6:.1f} MB en disco")
+    print(f"  caché: {t_cache / n * 1000:.2f} ms por recepción, {visibles_cache} archivos, "
+          f"{disco_cache / 1e6:.1f} MB en disco")
+
+
+def recibir_en_partes(datos, hashear):
+    entrada = Ensamblador(hashear=hashear)
+    inicio = time.perf_counter()
+    entrada.recibir({"type": "file", "stream": 1, "filesize": len(datos)})
+    vista = memoryview(datos)
+    for i in range(0, len(datos), TAM_PARTE):
+        completo = entrada.recibir({"type": "parte", "stream": 1}, vista[i:i + TAM_PARTE])
+    return time.perf_counter() - inicio, completo[0].get("contenido")
+
+
+def medir_hash(args):
+    datos = random.Random(1).randbytes(args.mb * 1024 * 1024)
+    sin, _ = min(recibir_en_partes(datos, False) for _ in range(3))
+    con, clave = min(recibir_en_partes(datos, True) for _ in range(3))
+    print(f"Archivo de {args.mb} MB en partes de {TAM_PARTE // 1024} KB: ensamblar {sin * 1000:.0f} ms, "
+          f"con hash {con * 1000:.0f} ms (+{(con - sin) / args.mb * 1000:.2f} ms/MB, clave {clave[:8]}...)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--archivos", type=int, default=50)
+    parser.add_argument("--repeticiones", type=int, default=10, help="veces que llega cada archivo")
+    parser.add_argument("--kb", type=int, default=300, help="tamaño de cada archivo")
+    parser.add_argument("--mb", type=int, default=100, help="archivo grande para medir el hash al recibir")
+    args = parser.parse_args()
+    medir_guardado(args)
+    medir_hash(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Benchmark: carga del catálogo de emojis y búsquedas de autocompletado.
+
+Uso:
+    python benchmarks/bench_emoji.py [--busquedas 100000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emoji_manager  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--busquedas", type=int, default=100000)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    catalogo = emoji_manager.cargar_catalogo()
+    t_carga = time.perf_counter() - t0
+
+    # Prefijos tal como se van escribiendo códigos reales del catálogo
+    prefijos = [codigo[:n] for codigo, _ in catalogo[::7] for n in (1, 2, 4, 8)]
+    prefijos = (prefijos * (args.busquedas // len(prefijos) + 1))[: args.busquedas]
+
+    t0 = time.perf_counter()
+    for p in prefijos:
+        emoji_manager.buscar_codigos(p)
+    t_busqueda = (time.perf_counter() - t0) / len(prefijos)
+
+    print(f"catálogo: {len(catalogo)} emojis cargados en {t_carga * 1000:.1f} ms (solo la primera vez)")
+    print(f"autocompletado: {t_busqueda * 1e6:.2f} µs por búsqueda ({len(prefijos):,} búsquedas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Benchmark: varios servidores federados (chat_server.py --nodo/--par) en local.
+
+Arranca --nodos servidores en puertos seguidos, cada uno enlazado con los
+anteriores (malla completa), y reparte --clientes usuarios entre ellos. Mide
+cuánto tarda en converger la presencia (todos ven a todos), y después cada
+usuario envía --mensajes textos a "Todos" y otros tantos a un usuario al azar.
+Comprueba que cada texto llega exactamente una vez a cada destinatario, esté
+en el nodo que esté, y muestra mensajes entregados por segundo y latencia.
+
+Los clientes leen los frames tal cual llegan (sin ChatClient, que descarta
+duplicados), para que un frame repetido por la federación se vea.
+
+Uso:
+    python benchmarks/bench_federacion.py [--nodos 3] [--clientes 30] [--mensajes 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_client import leer_frame  # noqa: E402
+from metricas import Metricas  # noqa: E402
+from multiplexado import Ensamblador, codificar_frame  # noqa: E402
+
+PORT_BENCH = 65490
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Cliente:
+    def __init__(self, nombre, port):
+        self.nombre = nombre
+        self.port = port
+        self.usuarios = set()
+        self.recibidos = Counter()  # (remitente, número) -> veces
+        self.cambio = asyncio.Event()
+
+    async def conectar(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        await self.enviar({"type": "login", "from": self.nombre, "codecs": []})
+
+    async def enviar(self, header):
+        self.writer.write(codificar_frame(header))
+        await self.writer.drain()
+
+    async def leer(self, metricas):
+        entrada = Ensamblador()
+        while True:
+            try:
+                completo = entrada.recibir(*await leer_frame(self.reader))
+            except (ConnectionError, OSError, ValueError):
+                return
+            if completo is None:
+                continue
+            header, _ = completo
+            mtype = header.get("type")
+            if mtype == "userlist":
+                self.usuarios = set(header.get("users", []))
+                self.cambio.set()
+            elif mtype == "system" and "en uso" in header.get("message", ""):
+                raise RuntimeError(f"{self.nombre}: {header['message']}")
+            elif mtype == "text":
+                self.recibidos[(header["from"], header["n"])] += 1
+                metricas.registrar("extremo a extremo text", (time.time() - header["t_envio"]) * 1000)
+
+    async def esperar_usuarios(self, todos):
+        while not todos <= self.usuarios:
+            self.cambio.clear()
+            await self.cambio.wait()
+
+    def cerrar(self):
+        self.writer.close()
+
+
+def esperar_puerto(port, limite=10.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"El servidor del puerto {port} no arrancó")
+
+
+def arrancar_nodos(n):
+    servidores = []
+    for i in range(n):
+        port = PORT_BENCH + i
+        argv = ["--nodo", f"n{i}", "--clave-federacion", "bench", "--medios-workers", "0"]
+        for j in range(i):
+            argv += ["--par", f"127.0.0.1:{PORT_BENCH + j}"]
+        servidores.append(subprocess.Popen(
+            [sys.executable, "chat_server.py", "--puerto", str(port)] + argv,
+            cwd=RAIZ,
+            stdout=subprocess.DEVNULL,
+        ))
+    for i in range(n):
+        esperar_puerto(PORT_BENCH + i)
+    return servidores
+
+
+async def ejecutar(args):
+    metricas = Metricas()
+    clientes = [Cliente(f"u{k}", PORT_BENCH + k % args.nodos) for k in range(args.clientes)]
+    nombres = {c.nombre for c in clientes}
+
+    t0 = time.perf_counter()
+    for c in clientes:
+        await c.conectar()
+    lectores = [asyncio.create_task(c.leer(metricas)) for c in clientes]
+    esperas = asyncio.gather(*(c.esperar_usuarios(nombres) for c in clientes))
+    await asyncio.wait_for(asyncio.wait({esperas, *lectores}, return_when=asyncio.FIRST_COMPLETED), 30)
+    if not esperas.done():
+        for tarea in lectores:
+            if tarea.done() and tarea.exception():
+                raise tarea.exception()
+    t_presencia = time.perf_counter() - t0
+
+    # Qué tiene que recibir cada uno: los "Todos" de los demás y sus directos
+    rng = random.Random(0)
+    esperado = {c.nombre: Counter() for c in clientes}
+    plan = []
+    for c in clientes:
+        for n in range(args.mensajes):
+            plan.append((c, "Todos", 2 * n))
+            for otro in nombres - {c.nombre}:
+                esperado[otro][(c.nombre, 2 * n)] += 1
+            destino = rng.choice(sorted(nombres - {c.nombre}))
+            plan.append((c, destino, 2 * n + 1))
+            esperado[destino][(c.nombre, 2 * n + 1)] += 1
+    total = sum(sum(e.values()) for e in esperado.values())
+
+    async def hablar(c):
+        for cliente, destino, n in plan:
+            if cliente is c:
+                await c.enviar({
+                    "type": "text", "from": c.nombre, "to": destino, "message": f"mensaje {n}",
+                    "n": n, "t_envio": time.time(),
+                })
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(hablar(c) for c in clientes))
+    fin = time.monotonic() + 60
+    while sum(sum(c.recibidos.values()) for c in clientes) < total and time.monotonic() < fin:
+        await asyncio.sleep(0.01)
+    t_mensajes = time.perf_counter() - t0
+    await asyncio.sleep(0.5)  # por si llega algún duplicado tarde
+
+    for c in clientes:
+        c.cerrar()
+    await asyncio.gather(*lectores, return_exceptions=True)
+
+    faltan = sum(sum((esperado[c.nombre] - c.recibidos).values()) for c in clientes)
+    sobran = sum(sum((c.recibidos - esperado[c.nombre]).values()) for c in clientes)
+    print(f"{args.clientes} usuarios en {args.nodos} nodos: presencia completa en {t_presencia:.2f} s")
+    print(f"{total} entregas en {t_mensajes:.2f} s = {total / t_mensajes:,.0f} mensajes/s")
+    print(f"perdidos: {faltan}, duplicados o de más: {sobran}")
+    print("latencia", metricas.histogramas["extremo a extremo text"].resumen())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodos", type=int, default=3)
+    parser.add_argument("--clientes", type=int, default=30)
+    parser.add_argument("--mensajes", type=int, default=20, help="textos a Todos (y otros tantos directos) por usuario")
+    args = parser.parse_args()
+
+    servidores = arrancar_nodos(args.nodos)
+    try:
+        asyncio.run(ejecutar(args))
+    finally:
+        for servidor in servidores:
+            servidor.terminate()
+        for servidor in servidores:
+            servidor.wait()
+
+
+if __name__ == "__main__":
+    main()
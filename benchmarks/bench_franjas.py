@@ -0,0 +1,133 @@
+"""Benchmark: MB/s de un archivo grande según el número de franjas.
+
+Envía un archivo de --mb megas de un cliente a otro por la conexión de chat
+(0 franjas) y en paralelo por 1, 2, 4... conexiones de datos auxiliares. Con
+--latencia el emisor pasa por un proxy que deja pasar como mucho --ventana KiB
+por conexión cada --latencia ms, como una conexión TCP con la ventana llena
+en un enlace con ese RTT: ahí es donde las franjas ayudan. Por loopback sin
+latencia el límite es la CPU.
+
+Uso:
+    python benchmarks/bench_franjas.py [--mb 200] [--franjas 0,1,2,4,8] [--latencia 50] [--ventana 256]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_client import ChatClient  # noqa: E402
+
+PORT_BENCH = 65482
+
+
+async def arrancar_proxy(port_destino, latencia, ventana):
+    """Proxy TCP que reenvía como mucho `ventana` bytes por conexión y sentido
+    cada `latencia` segundos."""
+
+    async def copiar(origen, destino):
+        try:
+            while True:
+                datos = await origen.read(ventana)
+                if not datos:
+                    break
+                await asyncio.sleep(latencia)
+                destino.write(datos)
+                await destino.drain()
+        except OSError:
+            pass
+        finally:
+            destino.close()
+
+    async def atender(reader_cliente, writer_cliente):
+        reader_servidor, writer_servidor = await asyncio.open_connection("127.0.0.1", port_destino)
+        await asyncio.gather(
+            copiar(reader_cliente, writer_servidor),
+            copiar(reader_servidor, writer_cliente),
+        )
+
+    servidor = await asyncio.start_server(atender, "127.0.0.1", 0)
+    return servidor, servidor.sockets[0].getsockname()[1]
+
+
+async def ejecutar(args, port):
+    port_emisor = port
+    if args.latencia:
+        proxy, port_emisor = await arrancar_proxy(port, args.latencia / 1000, args.ventana * 1024)
+
+    emisor = ChatClient("emisor", "127.0.0.1", port_emisor, reconectar=False)
+    receptor = ChatClient("receptor", "127.0.0.1", port, reconectar=False)
+    await emisor.conectar()
+    await receptor.conectar()
+
+    recibido = asyncio.Event()
+
+    async def leer():
+        async for header, payload in receptor:
+            if header.get("type") == "file":
+                assert len(payload) == header["filesize"]
+                recibido.set()
+
+    async def consumir_emisor():
+        async for _ in emisor:
+            pass
+
+    lectores = [asyncio.create_task(leer()), asyncio.create_task(consumir_emisor())]
+
+    with tempfile.NamedTemporaryFile(suffix=".bin", delete=False) as f:
+        bloque = os.urandom(1024 * 1024)
+        for _ in range(args.mb):
+            f.write(bloque)
+        ruta = f.name
+
+    enlace = f"{args.latencia:g} ms, ventana {args.ventana} KiB" if args.latencia else "loopback"
+    print(f"Archivo de {args.mb} MB ({enlace})")
+    try:
+        for franjas in args.franjas:
+            recibido.clear()
+            t0 = time.perf_counter()
+            await emisor.enviar_archivo("receptor", ruta, franjas=franjas)
+            t_subida = time.perf_counter() - t0
+            await asyncio.wait_for(recibido.wait(), 600)
+            t_total = time.perf_counter() - t0
+            nombre = f"{franjas} franjas" if franjas else "conexión de chat"
+            print(f"  {nombre:>17}: subida {args.mb / t_subida:7.1f} MB/s, "
+                  f"hasta el receptor {args.mb / t_total:7.1f} MB/s")
+    finally:
+        os.remove(ruta)
+        for cliente in (emisor, receptor):
+            await cliente.cerrar()
+        await asyncio.gather(*lectores, return_exceptions=True)
+        if args.latencia:
+            proxy.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=int, default=200, help="tamaño del archivo")
+    parser.add_argument("--franjas", default="0,1,2,4,8",
+                        type=lambda texto: [int(n) for n in texto.split(",")],
+                        help="números de franjas a probar (0 = conexión de chat)")
+    parser.add_argument("--latencia", type=float, default=0, help="ms por ventana en el proxy (0 = sin proxy)")
+    parser.add_argument("--ventana", type=int, default=256, help="KiB por ventana en el proxy")
+    args = parser.parse_args()
+
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    servidor = subprocess.Popen(
+        [sys.executable, "-c", f"import chat_server; chat_server.PORT = {PORT_BENCH}; chat_server.main()"],
+        cwd=raiz,
+        stdout=subprocess.DEVNULL,
+    )
+    time.sleep(0.5)
+    try:
+        asyncio.run(ejecutar(args, PORT_BENCH))
+    finally:
+        servidor.terminate()
+
+
+if __name__ == "__main__":
+    main()
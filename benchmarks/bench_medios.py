@@ -0,0 +1,160 @@
+"""Benchmark: vistas previas calculadas en el servidor frente a en cada cliente.
+
+Un cliente envía --imagenes fotos y --audios notas de voz a "Todos" con
+--receptores clientes conectados. Cada receptor hace lo que haría la GUI para
+mostrarlos (miniatura de la foto, forma de onda del audio), usando el resumen
+"medios" del header cuando llega. Se compara el servidor con el pool de medios
+y con --medios-workers 0: tiempo de CPU de los receptores en total y latencia
+de extremo a extremo de cada archivo.
+
+Uso:
+    python benchmarks/bench_medios.py [--receptores 10] [--imagenes 5] [--audios 5]
+"""
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import waveform  # noqa: E402
+from chat_client import ChatClient  # noqa: E402
+from image_manager import generar_miniatura  # noqa: E402
+from medios import guardar_miniatura, guardar_onda  # noqa: E402
+from metricas import Metricas  # noqa: E402
+
+PORT_BENCH = 65483
+
+
+def crear_foto(semilla):
+    """Foto de 4000x3000 con degradado y ruido, como la de una cámara (~3 MB en JPEG)."""
+    rng = np.random.default_rng(semilla)
+    y, x = np.mgrid[0:3000, 0:4000]
+    base = np.stack(((x / 16) % 256, (y / 12) % 256, ((x + y) / 28) % 256), axis=-1)
+    ruido = rng.normal(0, 12, base.shape)
+    salida = io.BytesIO()
+    Image.fromarray(np.clip(base + ruido, 0, 255).astype(np.uint8)).save(salida, format="JPEG", quality=90)
+    return salida.getvalue()
+
+
+def crear_audio(segundos):
+    t = np.arange(int(44100 * segundos)) / 44100
+    pcm = (np.sin(2 * np.pi * 220 * t) * np.sin(2 * np.pi * 0.5 * t) * 20000).astype(np.int16)
+    salida = io.BytesIO()
+    with wave.open(salida, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(44100)
+        wf.writeframes(pcm.tobytes())
+    return salida.getvalue()
+
+
+def mostrar(header, payload, carpeta):
+    """Lo que hace la GUI al recibir el archivo. Devuelve los segundos de CPU."""
+    inicio = time.process_time()
+    ruta = os.path.join(carpeta, f"{time.perf_counter_ns()}_{header['filename']}")
+    with open(ruta, "wb") as f:
+        f.write(payload)
+    medios = header.get("medios") or {}
+    if header["type"] == "audio":
+        if medios.get("onda"):
+            guardar_onda(medios, ruta)
+        waveform.generar_preview(ruta)
+    else:
+        cache = os.path.join(carpeta, "miniaturas")
+        clave = guardar_miniatura(medios, cache) if medios.get("miniatura") else None
+        generar_miniatura(ruta, cache, clave=clave)
+    return time.process_time() - inicio
+
+
+async def ejecutar(args, port, archivos):
+    metricas = Metricas()
+    emisor = ChatClient("emisor", "127.0.0.1", port, reconectar=False)
+    receptores = [
+        ChatClient(f"receptor{i}", "127.0.0.1", port, reconectar=False, metricas=metricas)
+        for i in range(args.receptores)
+    ]
+    for cliente in [emisor] + receptores:
+        await cliente.conectar()
+
+    carpeta = tempfile.mkdtemp(prefix="bench_medios_")
+    cpu = {"file": 0.0, "audio": 0.0}
+    con_medios = 0
+    pendientes = args.receptores * len(archivos)
+    terminado = asyncio.Event()
+
+    async def leer(receptor):
+        nonlocal pendientes, con_medios
+        async for header, payload in receptor:
+            if header.get("type") not in cpu:
+                continue
+            cpu[header["type"]] += mostrar(header, payload, carpeta)
+            con_medios += "medios" in header
+            pendientes -= 1
+            if pendientes == 0:
+                terminado.set()
+
+    async def consumir_emisor():
+        async for _ in emisor:
+            pass
+
+    lectores = [asyncio.create_task(leer(r)) for r in receptores]
+    lectores.append(asyncio.create_task(consumir_emisor()))
+    try:
+        for tipo, nombre, datos in archivos:
+            header = {"type": tipo, "from": "emisor", "to": "Todos", "filename": nombre, "filesize": len(datos)}
+            await emisor.enviar_frame(header, datos)
+        await asyncio.wait_for(terminado.wait(), 300)
+    finally:
+        for cliente in [emisor] + receptores:
+            await cliente.cerrar()
+        await asyncio.gather(*lectores, return_exceptions=True)
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    recibidos = args.receptores * len(archivos)
+    print(f"  {con_medios}/{recibidos} con vista previa del servidor")
+    print(f"  CPU de los receptores: fotos {cpu['file'] * 1000:.0f} ms, audios {cpu['audio'] * 1000:.0f} ms")
+    for clave in ("extremo a extremo file", "extremo a extremo audio"):
+        if clave in metricas.histogramas:
+            print(f"  latencia {clave.split()[-1]}: {metricas.histogramas[clave].resumen()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--receptores", type=int, default=10)
+    parser.add_argument("--imagenes", type=int, default=5)
+    parser.add_argument("--audios", type=int, default=5)
+    parser.add_argument("--segundos", type=float, default=60, help="duración de cada nota de voz")
+    args = parser.parse_args()
+
+    archivos = [("file", f"foto{i}.jpg", crear_foto(i)) for i in range(args.imagenes)]
+    archivos += [("audio", f"nota{i}.wav", crear_audio(args.segundos)) for i in range(args.audios)]
+
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for workers, nombre in ((0, "sin pool de medios"), (None, "con pool de medios")):
+        argv = [] if workers is None else ["--medios-workers", str(workers)]
+        servidor = subprocess.Popen(
+            [sys.executable, "-c", f"import chat_server; chat_server.PORT = {PORT_BENCH}; chat_server.main({argv!r})"],
+            cwd=raiz,
+            stdout=subprocess.DEVNULL,
+        )
+        time.sleep(1.5)  # el pool arranca sus procesos
+        print(f"[{nombre}] {args.imagenes} fotos y {args.audios} audios a {args.receptores} receptores")
+        try:
+            asyncio.run(ejecutar(args, PORT_BENCH, archivos))
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+
+if __name__ == "__main__":
+    main()
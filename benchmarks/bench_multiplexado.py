@@ -0,0 +1,108 @@
+"""Benchmark: latencia de los textos mientras se envía un archivo grande.
+
+Un cliente envía un archivo de --mb megas a otro y, a la vez, un texto cada
+--intervalo ms al mismo destino. Mide la latencia de esos textos y la
+velocidad del archivo. Con --sin-partes el payload viaja entero (como antes
+del multiplexado) y los textos esperan detrás de él.
+
+Uso:
+    python benchmarks/bench_multiplexado.py [--mb 100] [--intervalo 20] [--sin-partes]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat_client  # noqa: E402
+import multiplexado  # noqa: E402
+from chat_client import ChatClient  # noqa: E402
+from metricas import Metricas  # noqa: E402
+
+PORT_BENCH = 65481
+SIN_PARTES = 2 ** 62
+
+
+async def ejecutar(args, port):
+    metricas = Metricas()
+    emisor = ChatClient("emisor", "127.0.0.1", port, reconectar=False)
+    receptor = ChatClient("receptor", "127.0.0.1", port, reconectar=False, metricas=metricas)
+    await emisor.conectar()
+    await receptor.conectar()
+
+    archivo_recibido = asyncio.Event()
+    textos = 0
+
+    async def leer():
+        nonlocal textos
+        async for header, _ in receptor:
+            if header.get("type") == "text":
+                textos += 1
+            elif header.get("type") == "file":
+                archivo_recibido.set()
+
+    async def consumir_emisor():
+        async for _ in emisor:
+            pass
+
+    lectores = [asyncio.create_task(leer()), asyncio.create_task(consumir_emisor())]
+
+    async def charlar():
+        n = 0
+        while not archivo_recibido.is_set():
+            await emisor.enviar_texto("receptor", f"mensaje {n}")
+            n += 1
+            await asyncio.sleep(args.intervalo / 1000)
+
+    datos = os.urandom(1024 * 1024) * args.mb
+    header = {"type": "file", "from": "emisor", "to": "receptor", "filename": "bench.bin", "filesize": len(datos)}
+    t0 = time.perf_counter()
+    charla = asyncio.create_task(charlar())
+    await emisor.enviar_frame(header, datos)
+    await asyncio.wait_for(archivo_recibido.wait(), 300)
+    t_archivo = time.perf_counter() - t0
+    await charla
+
+    for cliente in (emisor, receptor):
+        await cliente.cerrar()
+    await asyncio.gather(*lectores, return_exceptions=True)
+
+    modo = "sin partes" if args.sin_partes else f"partes de {multiplexado.TAM_PARTE // 1024} KiB"
+    print(f"[{modo}] archivo de {args.mb} MB en {t_archivo:.2f} s = {args.mb / t_archivo:.1f} MB/s")
+    print(f"{textos} textos durante la transferencia")
+    print("latencia de los textos", metricas.histogramas["extremo a extremo text"].resumen())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=int, default=100, help="tamaño del archivo")
+    parser.add_argument("--intervalo", type=float, default=20, help="ms entre textos")
+    parser.add_argument("--sin-partes", action="store_true", help="enviar el payload entero")
+    args = parser.parse_args()
+
+    tam_parte = SIN_PARTES if args.sin_partes else multiplexado.TAM_PARTE
+    multiplexado.TAM_PARTE = chat_client.TAM_PARTE = tam_parte
+
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    servidor = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            f"import multiplexado; multiplexado.TAM_PARTE = {tam_parte}; "
+            f"import chat_server; chat_server.PORT = {PORT_BENCH}; chat_server.main()",
+        ],
+        cwd=raiz,
+        stdout=subprocess.DEVNULL,
+    )
+    time.sleep(0.5)
+    try:
+        asyncio.run(ejecutar(args, PORT_BENCH))
+    finally:
+        servidor.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark: cuántos mensajes por segundo puede absorber la GUI.
+
+Compara dibujar cada mensaje con su propia actualización del widget (como
+hacía antes _log_local) contra el renderizado por lotes de procesar_colas, y
+mide además el flujo completo hilo productor -> despertar -> render.
+
+Uso:
+    python benchmarks/bench_render.py [--mensajes 5000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import tkinter as tk
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_client_gui import ChatClientGUI  # noqa: E402
+import historial  # noqa: E402
+
+
+def generar_mensajes(n):
+    usuarios = ["Pedro", "Cesar", "Jorge", "Lenin", "Emiliano", "Villa"]
+    return [
+        f"[12:00:{i % 60:02d}] {usuarios[i % len(usuarios)]} -> Todos: mensaje número {i}\n"
+        for i in range(n)
+    ]
+
+
+def medir_por_mensaje(app, mensajes):
+    app.limpiar_chat()
+    t0 = time.perf_counter()
+    for m in mensajes:
+        app._renderizar_lote([m])
+    app.master.update_idletasks()
+    return time.perf_counter() - t0
+
+
+def medir_por_lote(app, mensajes):
+    app.limpiar_chat()
+    for m in mensajes:
+        app.cola_mensajes.put(m)
+    t0 = time.perf_counter()
+    app.procesar_colas()
+    app.master.update_idletasks()
+    return time.perf_counter() - t0
+
+
+def medir_con_productor(app, mensajes):
+    """Un hilo encola como hilo_receptor; el mainloop los dibuja al despertar."""
+    app.limpiar_chat()
+    terminado = threading.Event()
+
+    def productor():
+        for m in mensajes:
+            app.cola_mensajes.put(m)
+            app._notificar_ui()
+        terminado.set()
+
+    t0 = time.perf_counter()
+    threading.Thread(target=productor, daemon=True).start()
+    while not (terminado.is_set() and app.cola_mensajes.empty()):
+        app.master.update()
+    app.master.update_idletasks()
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mensajes", type=int, default=5000)
+    args = parser.parse_args()
+
+    # Los mensajes de prueba van a un historial temporal, no al del usuario
+    historial.RUTA_DB = os.path.join(tempfile.mkdtemp(), "bench_historial.db")
+
+    root = tk.Tk()
+    app = ChatClientGUI(root)
+    root.update()
+    mensajes = generar_mensajes(args.mensajes)
+
+    for nombre, medir in (
+        ("un insert por mensaje", medir_por_mensaje),
+        ("lote en procesar_colas", medir_por_lote),
+        ("hilo productor + despertar", medir_con_productor),
+    ):
+        segundos = medir(app, mensajes)
+        print(
+            f"{nombre:<28} {len(mensajes):>7} msgs  {segundos * 1000:9.1f} ms  "
+            f"{len(mensajes) / segundos:12,.0f} msgs/s"
+        )
+
+    app.cerrar()
+
+
+if __name__ == "__main__":
+    main()
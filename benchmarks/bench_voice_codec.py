@@ -0,0 +1,63 @@
+"""Benchmark: reducción de payload y tiempo de codificar/decodificar notas de voz.
+
+Genera una señal parecida a voz (armónicos con envolvente y ruido) con el
+formato de grabación de audio_manager (16 bits, mono, 44.1 kHz) y la pasa por
+cada codec de voice_codec.
+
+Uso:
+    python benchmarks/bench_voice_codec.py [--segundos 60]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import voice_codec  # noqa: E402
+
+RATE = 44100  # mismo valor que audio_manager.RATE
+
+
+def senal_voz(segundos, rate=RATE, semilla=0):
+    rng = np.random.default_rng(semilla)
+    t = np.arange(int(segundos * rate)) / rate
+    f0 = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)  # tono que varía lentamente
+    fase = 2 * np.pi * np.cumsum(f0) / rate
+    voz = sum(np.sin(k * fase) / k for k in range(1, 12))
+    envolvente = np.clip(np.sin(2 * np.pi * 1.5 * t), 0, None)  # sílabas y pausas
+    senal = voz * envolvente * 6000 + rng.normal(0, 200, len(t))
+    return np.clip(senal, -32768, 32767).astype(np.int16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--segundos", type=float, default=60.0)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    pcm = senal_voz(args.segundos)
+    bytes_wav = pcm.nbytes
+    print(f"WAV original: {args.segundos:.0f} s, {bytes_wav / 1024:,.0f} KB")
+
+    for codec in voice_codec.CODECS:
+        t_cod = t_dec = float("inf")
+        for _ in range(args.repeticiones):
+            t0 = time.perf_counter()
+            datos = voice_codec.codificar(pcm, RATE, codec)
+            t1 = time.perf_counter()
+            voice_codec.decodificar(datos, codec)
+            t2 = time.perf_counter()
+            t_cod, t_dec = min(t_cod, t1 - t0), min(t_dec, t2 - t1)
+
+        print(
+            f"{codec:<10} {len(datos) / 1024:9,.0f} KB  x{bytes_wav / len(datos):4.1f} menos  "
+            f"codificar {t_cod * 1000:7.1f} ms  decodificar {t_dec * 1000:6.1f} ms  "
+            f"({args.segundos / t_cod:,.0f}x tiempo real)"
+        )
+
+
+if __name__ == "__main__":
+    main()
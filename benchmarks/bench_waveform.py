@@ -0,0 +1,45 @@
+"""Benchmark: tiempo de calcular la forma de onda de una nota de voz.
+
+Uso:
+    python benchmarks/bench_waveform.py [--minutos 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import waveform  # noqa: E402
+
+RATE = 44100  # mismo valor que audio_manager.RATE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutos", type=float, default=5.0)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pcm = (rng.normal(0, 3000, int(args.minutos * 60 * RATE))).astype(np.int16)
+
+    t_resumen = t_dibujo = float("inf")
+    for _ in range(args.repeticiones):
+        t0 = time.perf_counter()
+        resumen = waveform.resumen_onda(pcm)
+        t1 = time.perf_counter()
+        waveform.dibujar_onda(resumen)
+        t2 = time.perf_counter()
+        t_resumen, t_dibujo = min(t_resumen, t1 - t0), min(t_dibujo, t2 - t1)
+
+    print(
+        f"{args.minutos:.0f} min ({len(pcm):,} muestras): resumen {t_resumen * 1000:.1f} ms, "
+        f"imagen {t_dibujo * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
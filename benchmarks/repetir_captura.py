@@ -0,0 +1,240 @@
+"""Repite una captura del servidor (chat_server.py --captura) contra un servidor local.
+
+Cada conexión capturada se vuelve a abrir en el mismo instante (dividido por
+--velocidad) y envía los mismos frames en el mismo orden: los textos con su
+longitud original y los payloads con bytes de relleno del mismo tamaño. El
+relleno y los textos son siempre los mismos, así que dos ejecuciones envían
+exactamente el mismo tráfico.
+
+Con varias --raiz (copias del proyecto, p. ej. otra rama en un git worktree)
+la captura se repite contra el servidor de cada una y se comparan la
+velocidad de entrega y las latencias de extremo a extremo.
+
+Uso:
+    python benchmarks/repetir_captura.py captura.jsonl.gz [--velocidad 1] [--raiz . --raiz ../otra]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import captura  # noqa: E402
+from chat_client import leer_frame  # noqa: E402
+from metricas import Metricas  # noqa: E402
+from multiplexado import Ensamblador, codificar_frame  # noqa: E402
+
+PORT_BENCH = 65484
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIPOS_CON_LATENCIA = ("text", "file", "audio", "audio_chunk")
+ESPERA_FINAL = 2.0  # segundos sin recibir nada para dar la repetición por terminada
+
+
+class Conexion:
+    def __init__(self, numero):
+        self.numero = numero
+        self.abre = 0.0
+        self.cierra = None
+        self.frames = []  # (t, header, tamaño del payload)
+
+
+def cargar(ruta):
+    conexiones = {}
+    for registro in captura.leer(ruta):
+        c = conexiones.setdefault(registro["c"], Conexion(registro["c"]))
+        if registro["e"] == "abre":
+            c.abre = registro["t"]
+        elif registro["e"] == "cierra":
+            c.cierra = registro["t"]
+        else:
+            c.frames.append((registro["t"], registro["h"], registro["n"]))
+    conexiones = sorted(conexiones.values(), key=lambda c: c.abre)
+    # Empezar con la primera conexión, no con el arranque del servidor capturado
+    origen = conexiones[0].abre if conexiones else 0.0
+    for c in conexiones:
+        c.abre -= origen
+        c.cierra = None if c.cierra is None else c.cierra - origen
+        c.frames = [(t - origen, h, n) for t, h, n in c.frames]
+    return conexiones
+
+
+class Repeticion:
+    """Estado de una repetición contra un servidor."""
+
+    def __init__(self, port, velocidad):
+        self.port = port
+        self.velocidad = velocidad
+        self.metricas = Metricas()
+        self.relleno = random.Random(0).randbytes(1024 * 1024)
+        self.tokens = {}  # usuario -> token de sesión en este servidor
+        self.hay_token = {}  # usuario -> asyncio.Event
+        self.enviados = 0
+        self.recibidos = 0
+        self.bytes_recibidos = 0
+        self.errores = 0
+        self.retraso_max = 0.0  # s que el envío fue por detrás del calendario
+        self.ultimo_recibido = 0.0
+
+    async def dormir_hasta(self, t):
+        espera = self.inicio + t / self.velocidad - time.perf_counter()
+        if espera > 0:
+            await asyncio.sleep(espera)
+        else:
+            self.retraso_max = max(self.retraso_max, -espera)
+
+    def payload(self, n):
+        if n <= len(self.relleno):
+            return self.relleno[:n]
+        return (self.relleno * (n // len(self.relleno) + 1))[:n]
+
+    def preparar(self, header, n):
+        h = dict(header)
+        if isinstance(h.get("message"), int):
+            h["message"] = "x" * h["message"]
+        if h.get("type") == "login":
+            h.pop("last_seq", None)
+        if h.get("type") in TIPOS_CON_LATENCIA:
+            h["t_envio"] = time.time()
+        return h
+
+    async def token(self, usuario):
+        evento = self.hay_token.setdefault(usuario, asyncio.Event())
+        await asyncio.wait_for(evento.wait(), 10)
+        return self.tokens[usuario]
+
+    async def leer(self, reader):
+        entrada = Ensamblador()
+        while True:
+            try:
+                completo = entrada.recibir(*await leer_frame(reader))
+            except (ConnectionError, OSError, ValueError):
+                return
+            self.ultimo_recibido = time.perf_counter()
+            if completo is None:
+                continue
+            header, payload = completo
+            self.recibidos += 1
+            self.bytes_recibidos += len(payload)
+            mtype = header.get("type")
+            if mtype == "sesion":
+                self.tokens[header.get("to")] = header.get("session")
+                self.hay_token.setdefault(header.get("to"), asyncio.Event()).set()
+            elif mtype == "system" and "en uso" in header.get("message", ""):
+                self.errores += 1
+            elif mtype in TIPOS_CON_LATENCIA and "t_envio" in header:
+                self.metricas.registrar(f"extremo a extremo {mtype}", (time.time() - header["t_envio"]) * 1000)
+
+    async def conexion(self, c):
+        await self.dormir_hasta(c.abre)
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        except OSError:
+            self.errores += 1
+            return
+        lector = asyncio.create_task(self.leer(reader))
+        try:
+            for t, header, n in c.frames:
+                await self.dormir_hasta(t)
+                h = self.preparar(header, n)
+                if h.get("type") == "datos":
+                    h["session"] = await self.token(h.get("from"))
+                writer.write(codificar_frame(h) + self.payload(n))
+                await writer.drain()
+                self.enviados += 1
+            if c.cierra is not None:
+                await self.dormir_hasta(c.cierra)
+            else:
+                await asyncio.sleep(ESPERA_FINAL)
+        except (ConnectionError, OSError, asyncio.TimeoutError):
+            self.errores += 1
+        finally:
+            writer.close()
+            await asyncio.gather(lector, return_exceptions=True)
+
+    async def ejecutar(self, conexiones):
+        self.inicio = time.perf_counter()
+        self.ultimo_recibido = self.inicio
+        await asyncio.gather(*(self.conexion(c) for c in conexiones))
+        return self.ultimo_recibido - self.inicio
+
+
+def esperar_puerto(port, limite=10.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("El servidor no arrancó")
+
+
+def repetir(raiz, conexiones, velocidad):
+    servidor = subprocess.Popen(
+        [sys.executable, "-c",
+         f"import sys; sys.argv = ['chat_server']; import chat_server; "
+         f"chat_server.PORT = {PORT_BENCH}; chat_server.main()"],
+        cwd=raiz,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        esperar_puerto(PORT_BENCH)
+        repeticion = Repeticion(PORT_BENCH, velocidad)
+        duracion = asyncio.run(repeticion.ejecutar(conexiones))
+    finally:
+        servidor.terminate()
+        servidor.wait()
+    return repeticion, duracion
+
+
+def media(metricas, nombre):
+    h = metricas.histogramas.get(nombre)
+    return h.suma / h.n if h and h.n else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("captura", help="archivo de chat_server.py --captura")
+    parser.add_argument("--velocidad", type=float, default=1.0, help="1 = tiempo real, 4 = cuatro veces más rápido")
+    parser.add_argument("--raiz", action="append", help="copia del proyecto cuyo servidor se prueba (repetible)")
+    args = parser.parse_args()
+    if args.velocidad <= 0:
+        parser.error("--velocidad tiene que ser mayor que 0")
+
+    conexiones = cargar(args.captura)
+    frames = sum(len(c.frames) for c in conexiones)
+    duracion = max([c.cierra or (c.frames[-1][0] if c.frames else c.abre) for c in conexiones] or [0])
+    print(f"Captura: {len(conexiones)} conexiones, {frames} frames, {duracion:.1f} s (repetida a {args.velocidad:g}x)")
+
+    resultados = []
+    for raiz in args.raiz or [RAIZ]:
+        repeticion, segundos = repetir(os.path.abspath(raiz), conexiones, args.velocidad)
+        resultados.append((raiz, repeticion, segundos))
+        print(f"\n[{raiz}]")
+        print(f"  {repeticion.enviados} frames enviados, {repeticion.recibidos} recibidos en {segundos:.2f} s "
+              f"= {repeticion.recibidos / segundos:.0f} frames/s, "
+              f"{repeticion.bytes_recibidos / segundos / 1e6:.1f} MB/s")
+        print(f"  retraso máximo respecto a la captura: {repeticion.retraso_max * 1000:.0f} ms, "
+              f"errores: {repeticion.errores}")
+        for linea in repeticion.metricas.resumen():
+            print(f"  {linea}")
+
+    if len(resultados) > 1:
+        base_raiz, base, base_s = resultados[0]
+        print(f"\nDiferencias respecto a {base_raiz}:")
+        for raiz, repeticion, segundos in resultados[1:]:
+            cambio = (repeticion.recibidos / segundos) / (base.recibidos / base_s) - 1
+            print(f"  [{raiz}] frames/s {cambio:+.0%}")
+            for nombre in sorted(base.metricas.histogramas):
+                antes, despues = media(base.metricas, nombre), media(repeticion.metricas, nombre)
+                if antes and despues is not None:
+                    print(f"    {nombre}: {antes:.1f} -> {despues:.1f} ms ({despues / antes - 1:+.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Captura del tráfico que recibe el servidor, para repetirlo después.
+
+Con --captura RUTA el servidor guarda, por conexión, cada frame que llega: el
+header, el tamaño del payload (y su hash con --captura-hash) y el instante de
+llegada. El archivo es JSON por líneas comprimido con gzip:
+
+    {"t": 0.0123, "c": 4, "e": "abre"}
+    {"t": 0.0150, "c": 4, "e": "frame", "h": {...}, "n": 0}
+    {"t": 9.8000, "c": 4, "e": "cierra"}
+
+"t" son segundos desde que empezó la captura y "c" el número de conexión. Los
+textos no se guardan, solo su longitud (en "m"), ni los tokens de sesión.
+benchmarks/repetir_captura.py reproduce la captura contra un servidor local.
+"""
+import gzip
+import hashlib
+import json
+import queue
+import threading
+import time
+
+ESPERA_LOTE = 0.2  # segundos que el hilo escritor junta registros antes de escribir
+CAMPOS_PRIVADOS = ("session",)
+
+
+def limpiar_header(header: dict) -> dict:
+    """Copia del header sin el texto de los mensajes ni los tokens."""
+    h = {k: v for k, v in header.items() if k not in CAMPOS_PRIVADOS}
+    if isinstance(h.get("message"), str):
+        h["message"] = len(h["message"])
+    return h
+
+
+class Captura:
+    """Escribe la captura desde un hilo propio: registrar() solo encola."""
+
+    def __init__(self, ruta, con_hash=False):
+        self.ruta = ruta
+        self.con_hash = con_hash
+        self.inicio = time.monotonic()
+        self._cola = queue.Queue()
+        self._conexiones = 0
+        self._lock = threading.Lock()
+        self._hilo = threading.Thread(target=self._hilo_escritor, name="captura", daemon=True)
+        self._hilo.start()
+
+    def nueva_conexion(self) -> int:
+        with self._lock:
+            self._conexiones += 1
+            conexion = self._conexiones
+        self._registrar(conexion, "abre")
+        return conexion
+
+    def frame(self, conexion: int, header: dict, payload=b""):
+        registro = {"h": limpiar_header(header), "n": len(payload)}
+        if self.con_hash and payload:
+            registro["x"] = hashlib.blake2b(payload, digest_size=8).hexdigest()
+        self._registrar(conexion, "frame", registro)
+
+    def cerrar_conexion(self, conexion: int):
+        self._registrar(conexion, "cierra")
+
+    def _registrar(self, conexion, evento, extra=None):
+        registro = {"t": round(time.monotonic() - self.inicio, 5), "c": conexion, "e": evento}
+        if extra:
+            registro.update(extra)
+        self._cola.put(registro)
+
+    def _hilo_escritor(self):
+        with gzip.open(self.ruta, "wt", encoding="utf-8") as f:
+            fin = False
+            while not fin:
+                registro = self._cola.get()
+                if registro is None:
+                    break
+                lote = [registro]
+                limite = time.monotonic() + ESPERA_LOTE
+                while True:
+                    try:
+                        registro = self._cola.get(timeout=max(0.0, limite - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if registro is None:
+                        fin = True
+                        break
+                    lote.append(registro)
+                f.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in lote))
+                f.flush()
+
+    def cerrar(self):
+        """Escribe lo pendiente y cierra el archivo."""
+        self._cola.put(None)
+        self._hilo.join(timeout=5)
+
+
+def leer(ruta):
+    """Registros de una captura, en orden. Una captura cortada (servidor
+    terminado sin cerrarla) se lee hasta el último lote escrito."""
+    with gzip.open(ruta, "rt", encoding="utf-8") as f:
+        try:
+            for linea in f:
+                if linea.endswith("\n"):
+                    yield json.loads(linea)
+        except EOFError:
+            return
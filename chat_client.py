@@ -0,0 +1,619 @@
+"""Cliente de chat sin interfaz gráfica, sobre asyncio.
+
+Lo usan la GUI (chat_client_gui.py), los bots, las pruebas y las herramientas
+de carga. No crea hilos: miles de instancias caben en un mismo event loop.
+
+Uso básico:
+
+    cliente = ChatClient("bot", "127.0.0.1", 65436)
+    await cliente.conectar()
+    await cliente.enviar_texto("Todos", "hola")
+    async for header, payload in cliente:
+        ...
+"""
+import asyncio
+import json
+import os
+import random
+import struct
+import time
+import uuid
+from collections import deque
+
+from metricas import Metricas
+from multiplexado import TAM_PARTE, Ensamblador, Planificador, codificar_frame, lleva_payload
+
+HOST_DEFECTO = "127.0.0.1"
+PORT_DEFECTO = 65436
+
+# Reconexión automática (backoff exponencial con jitter)
+RECONEXION_BASE = 0.5  # segundos
+RECONEXION_MAX = 30.0
+RECONEXION_INTENTOS = 10
+
+TIMEOUT_CONEXION = 10  # segundos para conectar y recibir la respuesta al login
+MAX_IDS_VISTOS = 5000  # IDs de mensajes recordados para descartar duplicados
+MAX_COLA_ENTRADA = 256  # frames sin consumir antes de dejar de leer del socket
+MAX_COLA_SALIDA = 256  # frames esperando a salir; enviar_frame() espera si se llena
+
+# Envío en paralelo (enviar_archivo(..., franjas=N)): N conexiones de datos
+# auxiliares, cada una con un rango del archivo
+MIN_TAM_FRANJAS = 8 * 1024 * 1024  # por debajo no compensa abrir conexiones
+BLOQUE_FRANJA = 1024 * 1024
+
+MAX_ORIGINALES = 500  # fotos enviadas reducidas cuyo original se puede pedir
+
+
+# ==== Utilidades de framing ====
+
+
+async def leer_frame(reader: asyncio.StreamReader):
+    try:
+        raw_len = await reader.readexactly(4)
+        (header_len,) = struct.unpack("!I", raw_len)
+        header = json.loads((await reader.readexactly(header_len)).decode("utf-8"))
+
+        payload = b""
+        if lleva_payload(header):
+            payload = await reader.readexactly(header["filesize"])
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Socket cerrado mientras se recibían datos")
+    return header, payload
+
+
+class ChatClient:
+    """Conexión de un usuario con el servidor.
+
+    - Los frames recibidos se consumen con `async for header, payload in cliente`.
+      Además de los del servidor llegan frames locales {"type": "estado"} con
+      los cambios de conexión ("message" y "conectado").
+    - al_presencia(usuarios, codecs) se llama con cada lista de usuarios nueva.
+    - Todo lo que se envía pasa por una cola de salida acotada y con prioridad
+      (textos y control antes que las partes de los archivos) que vacía una
+      única tarea escritora, juntando los frames cortos en una sola escritura.
+      encolar() no espera; enviar_frame() espera a que el frame esté escrito,
+      así que un receptor lento frena al emisor en vez de llenar la memoria.
+    - Si se cae la conexión se reconecta solo y reanuda la sesión; los textos
+      enviados mientras tanto se guardan y salen al reconectar.
+    - Con hashear=True los archivos y audios recibidos traen en "contenido" el
+      hash de su payload, calculado mientras llegan las partes.
+    """
+
+    def __init__(
+        self,
+        username,
+        host=HOST_DEFECTO,
+        port=PORT_DEFECTO,
+        codecs=(),
+        reconectar=True,
+        al_presencia=None,
+        metricas=None,
+        hashear=False,
+    ):
+        self.username = username
+        self.host = host
+        self.port = port
+        self.codecs = list(codecs)
+        self.reconectar = reconectar
+        self.al_presencia = al_presencia
+        self.metricas = metricas or Metricas()
+        self.hashear = hashear
+
+        self.usuarios = []
+        self.codecs_usuarios = {}  # username -> codecs de voz que entiende
+        self.sesion_token = None  # lo asigna el servidor; permite reanudar
+        self.ultimo_seq = 0  # último frame numerado recibido
+        self.conectado = False
+        self.reconectando = False
+
+        self._reader = None
+        self._writer = None
+        self._salida = Planificador()  # cola de salida de la conexión actual
+        self._hay_salida = asyncio.Event()
+        self._hay_espacio = asyncio.Event()
+        self._tarea_escritura = None
+        self._escritor_libre = False  # la tarea escritora espera trabajo
+        self._entrada = asyncio.Queue(MAX_COLA_ENTRADA)
+        self._salida_pendiente = []  # textos escritos mientras se reconectaba
+        self._ids_vistos = set()
+        self._orden_ids = deque()
+        self._intentos_reconexion = 0  # seguidos sin llegar a reanudar la sesión
+        self._tarea_lectura = None
+        self._tareas = set()  # acks y envíos automáticos en curso (referencia para que no se pierdan)
+        self.originales = {}  # ref -> ruta del original de una foto enviada reducida
+        self._cerrado = False
+
+    # ========= Conexión =========
+
+    async def conectar(self):
+        """Conecta e inicia sesión.
+
+        Lanza ConnectionRefusedError si el servidor rechaza el login (p. ej.
+        nombre en uso) y OSError / TimeoutError si no se puede conectar.
+        """
+        self.sesion_token = None
+        self.ultimo_seq = 0
+        self._cerrado = False
+        await self._abrir_sesion()
+        self._tarea_lectura = asyncio.create_task(self._bucle_lectura())
+
+    async def cerrar(self):
+        self._cerrado = True
+        self.conectado = False
+        if self._writer:
+            self._writer.close()
+        if self._tarea_lectura:
+            self._tarea_lectura.cancel()
+            await asyncio.gather(self._tarea_lectura, return_exceptions=True)
+        # Despertar a quien esté iterando
+        if self._entrada.full():
+            self._entrada.get_nowait()
+        self._entrada.put_nowait(None)
+
+    async def _abrir_sesion(self):
+        """Conecta y envía el login (con el token de sesión si hay que reanudar)."""
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), TIMEOUT_CONEXION
+        )
+        try:
+            header = {
+                "type": "login",
+                "from": self.username,
+                "to": "SERVER",
+                "timestamp": time.strftime("%H:%M:%S"),
+                "codecs": self.codecs,
+            }
+            if self.sesion_token:
+                header["session"] = self.sesion_token
+                header["last_seq"] = self.ultimo_seq
+            writer.write(codificar_frame(self._sellar(header)))
+            await writer.drain()
+
+            # La primera respuesta dice si se aceptó el login
+            respuesta, _ = await asyncio.wait_for(leer_frame(reader), TIMEOUT_CONEXION)
+            if respuesta.get("type") != "sesion":
+                raise ConnectionRefusedError(respuesta.get("message", "Login rechazado"))
+        except BaseException:
+            writer.close()
+            raise
+
+        resumed = respuesta.get("resumed")
+        if self.sesion_token and not resumed:
+            await self._estado("No se pudo reanudar la sesión; pueden faltar mensajes.")
+        elif resumed:
+            await self._estado("Reconectado; sesión reanudada.")
+        self.sesion_token = respuesta.get("session")
+        self._intentos_reconexion = 0
+        if not resumed:
+            self.ultimo_seq = respuesta.get("last_seq", 0)
+
+        self._reader, self._writer = reader, writer
+        self.conectado = True
+        self._salida = Planificador()
+        self._tarea_escritura = asyncio.create_task(self._bucle_escritura(writer))
+
+    async def _reconectar(self):
+        """Reintenta la conexión con backoff exponencial. Devuelve True si lo logra."""
+        self.reconectando = True
+        try:
+            while self._intentos_reconexion < RECONEXION_INTENTOS:
+                intento = self._intentos_reconexion
+                self._intentos_reconexion += 1
+                espera = min(RECONEXION_MAX, RECONEXION_BASE * 2 ** intento)
+                espera *= random.uniform(0.5, 1.5)  # evita que todos reintenten a la vez
+                await self._estado(
+                    f"Reconectando en {espera:.1f} s (intento {intento + 1}/{RECONEXION_INTENTOS})..."
+                )
+                await asyncio.sleep(espera)
+                try:
+                    await self._abrir_sesion()
+                except (OSError, asyncio.TimeoutError):
+                    continue
+
+                # Enviar lo que se escribió mientras no había conexión
+                pendientes, self._salida_pendiente = self._salida_pendiente, []
+                try:
+                    for header in pendientes:
+                        await self.enviar_frame(header)
+                except OSError:
+                    self._salida_pendiente = pendientes
+                    continue
+                return True
+            return False
+        finally:
+            self.reconectando = False
+
+    async def _estado(self, mensaje, conectado=None):
+        """Avisa a la aplicación de un cambio de conexión por la cola de entrada."""
+        conectado = self.conectado if conectado is None else conectado
+        await self._entrada.put(({"type": "estado", "message": mensaje, "conectado": conectado}, b""))
+
+    # ========= Recepción =========
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self._entrada.get()
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+    async def _bucle_lectura(self):
+        while True:
+            entrada = Ensamblador(hashear=self.hashear)
+            en_curso = {}  # stream -> seq del frame cuyo payload aún llega en partes
+            descartados = set()  # streams de frames repetidos
+            try:
+                while True:
+                    header, payload = await leer_frame(self._reader)
+                    stream = header.get("stream")
+                    if header.get("type") != "parte":
+                        # Los headers llegan en orden de seq aunque los frames
+                        # en partes terminen después de otros posteriores
+                        nuevo = self._seq_nuevo(header.get("seq"))
+                        if stream is None and not nuevo:
+                            continue
+                        if stream is not None and nuevo:
+                            en_curso[stream] = header.get("seq")
+                        elif stream is not None:
+                            descartados.add(stream)
+                    completo = entrada.recibir(header, payload)
+                    if completo is None:
+                        continue
+                    en_curso.pop(stream, None)
+                    if stream in descartados:
+                        descartados.discard(stream)
+                        continue
+                    await self._recibir(*completo)
+            except (ConnectionError, OSError, ValueError):
+                pass
+            finally:
+                self.conectado = False
+                self._writer.close()
+                self._cortar_salida()
+                # Los flujos a medias se pierden con la conexión: al reanudar,
+                # el servidor los repite (lo ya entregado se descarta por id)
+                pendientes = [seq for seq in en_curso.values() if seq is not None]
+                if pendientes:
+                    self.ultimo_seq = min(pendientes) - 1
+
+            if self._cerrado:
+                return
+            await self._estado("Conexión con el servidor perdida.", conectado=False)
+            if not self.reconectar or not self.sesion_token or not await self._reconectar():
+                break
+
+        await self._estado("Desconectado.", conectado=False)
+        await self._entrada.put(None)
+
+    def _seq_nuevo(self, seq):
+        """Avanza ultimo_seq; False si el frame ya se recibió antes de reconectar."""
+        if seq is None:
+            return True
+        if seq <= self.ultimo_seq:
+            return False
+        if seq > self.ultimo_seq + 1 and self.ultimo_seq:
+            self.metricas.contar("perdidos", seq - self.ultimo_seq - 1)
+        self.ultimo_seq = seq
+        return True
+
+    async def _recibir(self, header, payload):
+        t_rx = time.time()
+        mtype = header.get("type")
+        if self._ya_visto(header.get("id")):
+            self.metricas.contar("duplicados")
+            return
+        self._medir_latencia(header, t_rx)
+
+        if mtype == "userlist":
+            self.usuarios = header.get("users", [])
+            self.codecs_usuarios = header.get("codecs", {})
+            if self.al_presencia:
+                self.al_presencia(self.usuarios, self.codecs_usuarios)
+
+        elif mtype == "ack":
+            rtt = (t_rx - header.get("t_original", t_rx)) * 1000
+            self.metricas.registrar("confirmación (ida y vuelta)", rtt)
+            header["rtt_ms"] = rtt
+
+        elif mtype == "pedir_original":
+            # Otro usuario quiere el original de una foto que se le envió reducida
+            self._en_segundo_plano(self._enviar_original(header))
+            return
+
+        if header.get("ack") and mtype in ("text", "file", "audio"):
+            self._en_segundo_plano(self._enviar_ack(header))
+
+        await self._entrada.put((header, payload))
+
+    def _ya_visto(self, id_msg):
+        """Recuerda los últimos MAX_IDS_VISTOS ids; True si `id_msg` ya llegó."""
+        if not id_msg:
+            return False
+        if id_msg in self._ids_vistos:
+            return True
+        self._ids_vistos.add(id_msg)
+        self._orden_ids.append(id_msg)
+        if len(self._orden_ids) > MAX_IDS_VISTOS:
+            self._ids_vistos.discard(self._orden_ids.popleft())
+        return False
+
+    def _medir_latencia(self, header, t_rx):
+        """Registra la latencia total y la de cada salto (los relojes de distintas
+        máquinas pueden estar desfasados; el tiempo en el servidor no depende de eso)."""
+        t_envio = header.get("t_envio")
+        if t_envio is None or header.get("reenvio"):
+            return  # los frames repetidos al reanudar falsearían las medidas
+        mtype = header.get("type")
+        self.metricas.registrar(f"extremo a extremo {mtype}", (t_rx - t_envio) * 1000)
+        t_srv_rx = header.get("t_srv_rx")
+        t_srv_tx = header.get("t_srv_tx")
+        if t_srv_rx and t_srv_tx:
+            self.metricas.registrar("cliente->servidor", (t_srv_rx - t_envio) * 1000)
+            self.metricas.registrar("en el servidor", (t_srv_tx - t_srv_rx) * 1000)
+            self.metricas.registrar("servidor->cliente", (t_rx - t_srv_tx) * 1000)
+
+    def _en_segundo_plano(self, coro):
+        tarea = asyncio.create_task(coro)
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+
+    async def _enviar_original(self, header):
+        ruta = self.originales.get(header.get("ref"))
+        if not ruta or not os.path.exists(ruta):
+            return
+        try:
+            await self.enviar_archivo(header.get("from"), ruta, ref=header.get("ref"), es_original=True)
+        except OSError:
+            pass  # sin conexión: podrá volver a pedirlo
+
+    async def _enviar_ack(self, header):
+        """Confirma al remitente que el mensaje llegó."""
+        ack = {
+            "type": "ack",
+            "from": self.username,
+            "to": header.get("from"),
+            "ref": header.get("id"),
+            "t_original": header.get("t_envio"),
+            "destino_original": header.get("to"),
+        }
+        try:
+            await self.enviar_frame(ack)
+        except OSError:
+            pass  # sin conexión: el remitente simplemente no verá la confirmación
+
+    # ========= Envío =========
+
+    @staticmethod
+    def _sellar(header):
+        """Copia del header con la hora de envío (t_envio) y un id único si no lo trae."""
+        header = dict(header, t_envio=time.time())
+        header.setdefault("id", uuid.uuid4().hex)
+        return header
+
+    def encolar(self, header, payload=b"", progreso=None):
+        """Pone un frame en la cola de salida sin esperar (llamar desde el event loop).
+
+        payload puede ser bytes o un archivo binario abierto (se lee por bloques
+        hasta header["filesize"] y debe seguir abierto hasta que termine).
+        progreso(porcentaje) se llama tras cada bloque escrito. Devuelve el header
+        enviado (con su id) y un futuro que termina cuando el frame entero está
+        escrito. Lanza asyncio.QueueFull si la cola está llena.
+        """
+        if not self.conectado:
+            raise ConnectionError("No hay conexión con el servidor")
+        if len(self._salida) >= MAX_COLA_SALIDA:
+            raise asyncio.QueueFull
+        header = self._sellar(header)
+        if not isinstance(payload, (bytes, bytearray, memoryview)):
+            payload = _bloques_archivo(payload, header.get("filesize", 0))
+        futuro = asyncio.get_running_loop().create_future()
+        self._salida.agregar(header, payload, (futuro, progreso))
+        if self._escritor_libre and not self._salida.flujos:
+            # Con el escritor parado, los frames cortos se escriben ya, sin
+            # esperar a que la tarea escritora despierte
+            self._escribir_disponible(self._writer)
+        if self._salida:
+            self._hay_salida.set()
+        return header, futuro
+
+    async def enviar_frame(self, header, payload=b"", progreso=None):
+        """Como encolar(), pero espera si la cola está llena y hasta que el frame
+        sale. Devuelve el header enviado."""
+        while self.conectado and len(self._salida) >= MAX_COLA_SALIDA:
+            self._hay_espacio.clear()
+            await self._hay_espacio.wait()
+        header, futuro = self.encolar(header, payload, progreso)
+        await futuro
+        return header
+
+    def _escribir_disponible(self, writer):
+        """Pasa frames de la cola al socket, por prioridad, mientras su buffer
+        no supere el límite; varios frames cortos van en una sola escritura."""
+        limite = writer.transport.get_write_buffer_limits()[1]
+        while self._salida and writer.transport.get_write_buffer_size() <= limite:
+            datos, hechos = self._salida.siguiente()
+            if datos is None:
+                continue
+            writer.write(datos)
+            for (futuro, progreso), enviado, total in hechos:
+                if progreso and total:
+                    progreso(int(enviado * 100 / total))
+                if enviado >= total and not futuro.done():
+                    futuro.set_result(None)
+        self._hay_espacio.set()
+
+    async def _bucle_escritura(self, writer):
+        """Único escritor del socket: vacía la cola de salida por prioridad."""
+        try:
+            while True:
+                self._escribir_disponible(writer)
+                if self._salida:
+                    await writer.drain()  # buffer lleno: esperar a que el socket avance
+                    continue
+                self._hay_salida.clear()
+                self._escritor_libre = True
+                try:
+                    await self._hay_salida.wait()
+                finally:
+                    self._escritor_libre = False
+        except OSError:
+            writer.close()  # el bucle de lectura lo verá y cerrará la conexión
+        except Exception as e:
+            # p. ej. un archivo que se acortó durante el envío: el flujo quedó a medias
+            print(f"[CLIENTE] Error al preparar un envío: {e}")
+            writer.close()
+
+    def _cortar_salida(self):
+        """Para el escritor y falla lo que quedaba por enviar en esta conexión."""
+        if self._tarea_escritura:
+            self._tarea_escritura.cancel()
+            self._tarea_escritura = None
+        self._escritor_libre = False
+        for futuro, _ in self._salida.vaciar():
+            if not futuro.done():
+                futuro.set_exception(ConnectionError("Conexión perdida antes de enviar el frame"))
+        self._hay_espacio.set()
+
+    async def enviar_texto(self, destino, texto, ack=False):
+        """Envía un texto. Devuelve False si quedó pendiente hasta reconectar."""
+        header = {
+            "type": "text",
+            "from": self.username,
+            "to": destino,
+            "message": texto,
+            "timestamp": time.strftime("%H:%M:%S"),
+        }
+        if ack:
+            header["ack"] = True
+        if not self.reconectando:
+            try:
+                await self.enviar_frame(header)
+                return True
+            except OSError:
+                if not (self.reconectar and self.sesion_token) or self._cerrado:
+                    raise
+        # Se enviará en cuanto vuelva la conexión (con el mismo id)
+        self._salida_pendiente.append(self._sellar(header))
+        return False
+
+    async def enviar_archivo(self, destino, ruta, progreso=None, ack=False, tipo="file", franjas=0, **extra):
+        """Envía un archivo leyéndolo por bloques. `extra` se añade al header.
+
+        Con franjas=N (y un archivo de al menos MIN_TAM_FRANJAS) los datos van
+        en paralelo por N conexiones auxiliares en vez de por la de chat.
+        """
+        header = {
+            "type": tipo,
+            "from": self.username,
+            "to": destino,
+            "filename": os.path.basename(ruta),
+            "filesize": os.path.getsize(ruta),
+            "timestamp": time.strftime("%H:%M:%S"),
+            **extra,
+        }
+        if ack:
+            header["ack"] = True
+        if franjas and header["filesize"] >= MIN_TAM_FRANJAS:
+            return await self._enviar_por_franjas(header, ruta, franjas, progreso)
+        with open(ruta, "rb") as f:
+            return await self.enviar_frame(header, f, progreso)
+
+    async def _enviar_por_franjas(self, header, ruta, franjas, progreso=None):
+        """Cada franja abre su conexión de datos y envía un rango contiguo; el
+        servidor lo copia en su sitio. Cuando todas confirman, el header sale
+        por la conexión de chat y el servidor reenvía el archivo completo."""
+        if not self.conectado:
+            raise ConnectionError("No hay conexión con el servidor")
+        total = header["filesize"]
+        transfer = uuid.uuid4().hex
+        tam = -(-total // franjas)
+        enviado = 0
+
+        async def enviar_rango(desde, hasta):
+            nonlocal enviado
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), TIMEOUT_CONEXION
+            )
+            try:
+                writer.write(codificar_frame(
+                    {"type": "datos", "from": self.username, "session": self.sesion_token}
+                ))
+                with open(ruta, "rb") as f:
+                    f.seek(desde)
+                    pos = desde
+                    while pos < hasta:
+                        bloque = f.read(min(BLOQUE_FRANJA, hasta - pos))
+                        if not bloque:
+                            raise EOFError("El archivo terminó antes de lo indicado en filesize")
+                        rango = {"type": "rango", "transfer": transfer, "offset": pos,
+                                 "total": total, "filesize": len(bloque)}
+                        writer.write(codificar_frame(rango) + bloque)
+                        await writer.drain()
+                        pos += len(bloque)
+                        enviado += len(bloque)
+                        if progreso:
+                            progreso(int(enviado * 100 / total))
+                writer.write(codificar_frame({"type": "fin"}))
+                respuesta, _ = await asyncio.wait_for(leer_frame(reader), TIMEOUT_CONEXION)
+                if respuesta.get("type") != "fin":
+                    raise ConnectionRefusedError(respuesta.get("message", "Conexión de datos rechazada"))
+            finally:
+                writer.close()
+
+        tareas = [
+            asyncio.create_task(enviar_rango(desde, min(total, desde + tam)))
+            for desde in range(0, total, tam)
+        ]
+        try:
+            await asyncio.gather(*tareas)
+        except BaseException:
+            for tarea in tareas:
+                tarea.cancel()
+            raise
+        return await self.enviar_frame(dict(header, transfer=transfer))
+
+    async def enviar_imagen(self, destino, ruta, previa, reducida, progreso=None, ack=False):
+        """Envía una foto ya reducida (image_manager.preparar_envio): primero la
+        vista previa, que es pequeña y sale enseguida, y después la imagen
+        reducida, las dos con la misma "ref". El original (`ruta`) no se envía,
+        pero queda disponible: si un receptor lo pide con pedir_original() se
+        le manda solo a él."""
+        ref = uuid.uuid4().hex
+        self.originales[ref] = ruta
+        if len(self.originales) > MAX_ORIGINALES:
+            del self.originales[next(iter(self.originales))]
+        nombre = os.path.splitext(os.path.basename(ruta))[0] + os.path.splitext(reducida)[1]
+        original = {"filename": os.path.basename(ruta), "filesize": os.path.getsize(ruta)}
+        await self.enviar_archivo(
+            destino, previa, filename=nombre, ref=ref, vista_previa=True, original=original
+        )
+        return await self.enviar_archivo(
+            destino, reducida, progreso, ack, filename=nombre, ref=ref, original=original
+        )
+
+    async def pedir_original(self, remitente, ref):
+        """Pide a `remitente` el original de la foto `ref` que envió reducida."""
+        return await self.enviar_frame({
+            "type": "pedir_original",
+            "from": self.username,
+            "to": remitente,
+            "ref": ref,
+        })
+
+    async def enviar_audio(self, destino, ruta, codec=None, ack=False):
+        """Envía una nota de voz (WAV, o ya codificada con `codec`)."""
+        extra = {"codec": codec} if codec else {}
+        return await self.enviar_archivo(destino, ruta, ack=ack, tipo="audio", **extra)
+
+
+def _bloques_archivo(archivo, total):
+    """Lee `total` bytes de un archivo en bloques de TAM_PARTE."""
+    restante = total
+    while restante > 0:
+        bloque = archivo.read(min(TAM_PARTE, restante))
+        if not bloque:
+            raise EOFError("El archivo terminó antes de lo indicado en filesize")
+        restante -= len(bloque)
+        yield bloque
@@ -1,19 +1,32 @@
 # chat_client_gui_files.py
 from asyncio import subprocess
-import json
+import argparse
+import asyncio
+import bisect
+import functools
 import os
 import platform
 import queue
-import socket
-import struct
+import random
+import re
+import sys
 import threading
 import time 
+import wave
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import Toplevel, filedialog, messagebox, scrolledtext, ttk
-from PIL import Image, ImageTk
-from playsound3 import playsound
 from audio_manager import AudioManager
-from emoji_manager import mostrar_paleta_emojis
+from chat_client import ChatClient
+from descargas import CacheDescargas
+from emoji_manager import Autocompletado, mostrar_paleta_emojis
+from historial import Historial
+from image_manager import EXTENSIONES_REDUCIBLES, UMBRAL_REDUCIR, ImageManager, preparar_envio
+from metricas import Metricas
+import perfilado
+
+# numpy, PIL y PyAudio (voice_codec, waveform, medios, audio_manager.p) se
+# cargan al usarse o en _precalentar(), ya con la ventana abierta
 
 HOST_DEFECTO = "127.0.0.1"
 PORT_DEFECTO = 65436
@@ -22,68 +35,17 @@ CARPETA_DESCARGAS = "descargas_chat"
 CARPETA_RECIBIDOS = "audios_recibidos"
 os.makedirs(CARPETA_DESCARGAS, exist_ok=True)
 
+# Elementos del historial que se vuelven a mostrar al abrir (aprox. una pantalla)
+LINEAS_HISTORIAL = 40
 
-# ==== Utilidades de framing ====
-
-
-def send_frame(
-    sock: socket.socket,
-    header: dict,
-    payload: bytes = b"",
-    progress_callback=None,
-    chunk_size=4096,
-):
-    # Enviar header como siempre
-    header_bytes = json.dumps(header).encode("utf-8")
-    header_len = len(header_bytes)
-
-    sock.sendall(struct.pack("!I", header_len))
-    sock.sendall(header_bytes)
-
-    # Enviar payload en chunks para que haya progreso
-    if not payload:
-        return
-
-    total = len(payload)
-    enviado = 0
-
-    # Enviar en bloques
-    for i in range(0, total, chunk_size):
-        chunk = payload[i : i + chunk_size]
-        sock.sendall(chunk)
-        enviado += len(chunk)
-
-        # Actualizar barra si existe callback
-        if progress_callback:
-            porcentaje = int((enviado / total) * 100)
-            progress_callback(porcentaje)
-
-
-def recv_exact(sock: socket.socket, n: int) -> bytes:
-    data = b""
-    while len(data) < n:
-        chunk = sock.recv(n - len(data))
-        if not chunk:
-            raise ConnectionError("Socket cerrado mientras se recibían datos")
-        data += chunk
-    return data
+# Espera tras abrir la ventana antes de cargar numpy/PIL y abrir PyAudio
+PRECALENTAR_MS = 100
 
+# Conexiones de datos con "Envío en paralelo de archivos grandes"
+FRANJAS_ENVIO = 4
 
-def recv_frame(sock: socket.socket):
-    raw_len = sock.recv(4)
-    if not raw_len:
-        raise ConnectionError("Socket cerrado al leer longitud header")
-    (header_len,) = struct.unpack("!I", raw_len)
-    header_bytes = recv_exact(sock, header_len)
-    header = json.loads(header_bytes.decode("utf-8"))
-
-    payload = b""
-    if header.get("type") in ("file", "audio"):
-        filesize = header.get("filesize", 0)
-        if filesize > 0:
-            payload = recv_exact(sock, filesize)
-
-    return header, payload
+# Detecta el nombre del remitente al inicio de una línea ("[12:00:00] Pedro -> ...")
+PATRON_NOMBRE = re.compile(r"^\s*(?:\[[^\]]+\]\s*)*([A-Za-z0-9_]+)\s*->")
 
 
 class ChatClientGUI:
@@ -93,12 +55,22 @@ class ChatClientGUI:
         self.master = master
         self.master.title("SuperVillano Chat")
 
-        self.imagenes_chat = []  # evitar que el GC borre las imágenes
-
-        # Estado de red
-        self.sock = None
-        self.conectado = False
+        # Estado de red: la conexión la lleva ChatClient en un event loop propio
+        self.cliente = None
         self.username = None
+        self.codecs_usuarios = {}  # username -> codecs de voz que entiende
+        # Fotos recibidas reducidas cuyo original se puede pedir
+        self._fotos = {}  # ref -> ruta de la vista previa mostrada
+        self._refs_fotos = {}  # ruta (previa o reducida) -> (remitente, ref)
+        self._cerrando = False
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        # Los frames recibidos se procesan en orden en un hilo aparte (no en Tk)
+        self._receptor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="receptor")
+
+        # Latencias y entrega
+        self.metricas = Metricas()
+        self.ventana_latencias = None
 
         self.audio_manager = AudioManager(self)
 
@@ -106,6 +78,9 @@ class ChatClientGUI:
         self.cola_mensajes = queue.Queue()
         # Cola para updates de userlist (lista de strings)
         self.cola_userlist = queue.Queue()
+        # Evita programar más de un despertar del hilo de Tk a la vez
+        self._despertar_lock = threading.Lock()
+        self._despertar_pendiente = False
 
         # Modo oscuro
         self.modo_oscuro = False
@@ -142,8 +117,17 @@ class ChatClientGUI:
         frame_users.pack(side="left", fill="y")
 
         tk.Label(frame_users, text="Usuarios conectados").pack()
-        self.listbox_users = tk.Listbox(frame_users, height=20, width=20)
+        # Filtro por prefijo sobre el índice ordenado de usuarios
+        self.entry_filtro_usuarios = tk.Entry(frame_users, width=20)
+        self.entry_filtro_usuarios.pack(fill="x")
+        self.entry_filtro_usuarios.bind("<KeyRelease>", lambda e: self._mostrar_usuarios())
+        # exportselection=False: la selección no se pierde al seleccionar texto en otro widget
+        self.listbox_users = tk.Listbox(frame_users, height=20, width=20, exportselection=False)
         self.listbox_users.pack(fill="y", expand=False)
+        self.listbox_users.insert(tk.END, "Todos")
+        self._claves_usuarios = []  # nombres en minúsculas, ordenados (para bisect)
+        self._nombres_usuarios = []  # nombres reales, en el mismo orden
+        self._usuarios_mostrados = []  # lo que hay en el listbox después de "Todos"
 
         # Área de chat
         frame_chat = tk.Frame(frame_main)
@@ -154,6 +138,11 @@ class ChatClientGUI:
         )
         self.text_chat.pack(fill="both", expand=True)
 
+        # Miniaturas decodificadas en segundo plano y cargadas al hacerse visibles
+        self.image_manager = ImageManager(self)
+        # Lo recibido se guarda una vez por contenido (descargas.py)
+        self.descargas = CacheDescargas()
+
         # Buscador de mensajes
         frame_search = tk.Frame(frame_chat)
         frame_search.pack(fill="x", pady=(5, 0))
@@ -162,11 +151,16 @@ class ChatClientGUI:
         self.entry_search = tk.Entry(frame_search)
         self.entry_search.pack(side="left", fill="x", expand=True)
         self.entry_search.bind("<KeyRelease>", self.buscar_mensajes)
+        self.entry_search.bind("<Return>", lambda e: self.buscar_en_historial())
 
         self.btn_clear_search = tk.Button(
             frame_search, text="Limpiar", command=self.limpiar_busqueda
         )
         self.btn_clear_search.pack(side="left", padx=5)
+        tk.Button(
+            frame_search, text="🔎 Historial", command=self.buscar_en_historial
+        ).pack(side="left")
+        self.ventana_busqueda = None
 
         # Campo mensaje + botones
         frame_bottom = tk.Frame(master)
@@ -175,6 +169,8 @@ class ChatClientGUI:
         self.entry_msg = tk.Entry(frame_bottom)
         self.entry_msg.pack(side="left", fill="x", expand=True)
         self.entry_msg.bind("<Return>", self.enviar_texto_evento)
+        # Sugerencias de emoji al escribir ":codigo"
+        self.autocompletado = Autocompletado(self)
         
         # Menú de opciones
         self.btn_opciones = tk.Button(
@@ -193,6 +189,46 @@ class ChatClientGUI:
             label="Modo oscuro",
             command=self.toggle_modo
         )
+        self.menu_opciones.add_command(
+            label="⏹ Detener reproducción de audio",
+            command=self.audio_manager.detener_reproduccion
+        )
+        # Audio en vivo: se transmite mientras se graba en vez de al terminar
+        self.audio_en_vivo = tk.BooleanVar(value=False)
+        self.menu_opciones.add_checkbutton(
+            label="🎙 Audio en vivo",
+            variable=self.audio_en_vivo
+        )
+        self.comprimir_pausas = tk.BooleanVar(value=self.audio_manager.comprimir_pausas)
+        self.menu_opciones.add_checkbutton(
+            label="Acortar pausas largas en notas de voz",
+            variable=self.comprimir_pausas,
+            command=lambda: setattr(
+                self.audio_manager, "comprimir_pausas", self.comprimir_pausas.get()
+            ),
+        )
+        # Confirmaciones de entrega para textos y archivos
+        self.pedir_acks = tk.BooleanVar(value=False)
+        self.menu_opciones.add_checkbutton(
+            label="✓ Pedir confirmación de entrega",
+            variable=self.pedir_acks
+        )
+        # Archivos grandes por varias conexiones de datos a la vez
+        self.envio_paralelo = tk.BooleanVar(value=False)
+        self.menu_opciones.add_checkbutton(
+            label="⇉ Envío en paralelo de archivos grandes",
+            variable=self.envio_paralelo
+        )
+        # Fotos grandes: se envían reducidas y el original solo si lo piden
+        self.reducir_fotos = tk.BooleanVar(value=True)
+        self.menu_opciones.add_checkbutton(
+            label="🖼 Reducir fotos grandes antes de enviar",
+            variable=self.reducir_fotos
+        )
+        self.menu_opciones.add_command(
+            label="📊 Latencias",
+            command=self.mostrar_latencias
+        )
         
         emoji_button = tk.Button(
             frame_bottom, 
@@ -216,7 +252,7 @@ class ChatClientGUI:
         self.btn_grabar_audio = tk.Button(
             frame_bottom,
             text="Grabar audio",
-            command=self.audio_manager.start_recording,
+            command=self._handle_iniciar_grabacion_audio,
         )
         self.btn_grabar_audio.pack(side="left", padx=5)
 
@@ -237,7 +273,6 @@ class ChatClientGUI:
 
 
         # Paleta de colores para los nombres de los usuarios
-        import random
         self.colores_usuarios = {}
         self.colores_base = [
             "#FF7F7F", "#FFBF7F", "#FFFF7F", "#7FFF7F", "#7FFFFF",
@@ -245,12 +280,37 @@ class ChatClientGUI:
             "#A5FFAF", "#FFD1A5", "#B5A5FF", "#FFA5E2"
         ]
 
-        # Timer para procesar colas
-        self.master.after(100, self.procesar_colas)
+        # Historial local: se muestra lo último al instante y se guarda lo nuevo
+        try:
+            self.historial = Historial()
+            self._cargar_historial()
+        except Exception as e:
+            print(f"[HISTORIAL] Desactivado: {e}")
+            self.historial = None
 
         # Cierre ordenado
         self.master.protocol("WM_DELETE_WINDOW", self.cerrar)
 
+        # Lo pesado se carga en segundo plano cuando la ventana ya se ve
+        self.precalentado = threading.Event()
+        self.master.after(PRECALENTAR_MS, self._precalentar)
+
+    def _precalentar(self):
+        threading.Thread(target=self._hilo_precalentar, name="precalentar", daemon=True).start()
+
+    def _hilo_precalentar(self):
+        """Importa numpy/PIL y abre PyAudio para que el primer audio o la
+        primera imagen no esperen (y la ventana tampoco lo haya hecho)."""
+        try:
+            import medios  # noqa: F401  (numpy, PIL, voice_codec, waveform)
+            from PIL import ImageTk  # noqa: F401
+
+            self.audio_manager.precalentar()
+        except Exception as e:
+            print(f"[AUDIO] No se pudo inicializar el audio: {e}")
+        finally:
+            self.precalentado.set()
+
     def toggle_modo(self):
         if not self.modo_oscuro:
             # Activar modo oscuro
@@ -287,67 +347,82 @@ class ChatClientGUI:
         self.text_chat.config(state="disabled")
 
         # Limpia también imágenes almacenadas en RAM
-        self.imagenes_chat.clear()
+        self.image_manager.limpiar()
 
 
     # imagenes
+    def _crear_imagen_chat(self, ruta):
+        """Crea el Label clickeable de la imagen; la miniatura se carga al verse."""
+        label = self.image_manager.crear_label(ruta)
+        if ruta in self._refs_fotos:
+            # Foto recibida reducida: clic derecho para pedir el original
+            label.bind("<Button-3>", lambda e, r=ruta: self._pedir_original(r))
+        return label
+
+    def _pedir_original(self, ruta):
+        if not self.conectado:
+            messagebox.showwarning("Chat", "No estás conectado.")
+            return
+        remitente, ref = self._refs_fotos[ruta]
+        self._en_red(self.cliente.pedir_original(remitente, ref))
+        self._log_local(f"[IMAGEN] Pidiendo a {remitente} la imagen original...\n")
+
     def _insertar_imagen_chat(self, ruta):
         try:
-            # Cargar y crear la miniatura para la vista previa
-            img = Image.open(ruta)
-
-            max_width = 300
-            if img.width > max_width:
-                ratio = max_width / img.width
-                img = img.resize((max_width, int(img.height * ratio)))
-
-            img_tk = ImageTk.PhotoImage(img)
-
-            # Guardar referencia para evitar GC
-            self.imagenes_chat.append(img_tk)
-
-            # Crear un Label (widget REAL) que será clickeable
-            lbl = tk.Label(self.text_chat, image=img_tk, cursor="hand2")
-            lbl.bind("<Button-1>", lambda e, r=ruta: self._abrir_imagen(r))
-
-            # Insertar el Label dentro del Text como ventana (widget real)
-            self.text_chat.config(state="normal")
-            self.text_chat.window_create(tk.END, window=lbl)
-            self.text_chat.insert(tk.END, "\n")
-            self.text_chat.see(tk.END)
-            self.text_chat.config(state="disabled")
-
+            self._renderizar_lote([self._crear_imagen_chat(ruta), "\n"])
         except Exception as e:
             self._log_local(f"[ERROR] No se pudo mostrar la imagen: {e}\n")
 
-    def boton_reproducir_audio(self, ruta):
-        try:
-            btn_play = tk.Button(
-                self.text_chat,
-                text="Reproducir",
-                command=lambda r=ruta: self.audio_manager.reproducir_audio(
-                    r, self._log_local
-                ),
-                relief="raised",
-                bd=1,
-                padx=4,
-                pady=2,
+    def _crear_boton_audio(self, ruta):
+        """Crea el botón "Reproducir" con la forma de onda (si existe) sin insertarlo."""
+        marco = tk.Frame(self.text_chat)
+        btn_play = tk.Button(
+            marco,
+            text="Reproducir",
+            command=lambda r=ruta: self.audio_manager.reproducir_audio(
+                r, self._log_local
+            ),
+            relief="raised",
+            bd=1,
+            padx=4,
+            pady=2,
+        )
+        btn_play.pack(side="left")
+
+        import waveform
+
+        png = waveform.ruta_preview(ruta)
+        if os.path.exists(png):
+            foto = tk.PhotoImage(file=png)
+            lbl_onda = tk.Label(marco, image=foto, cursor="hand2")
+            lbl_onda.image = foto  # evitar que el GC borre la imagen
+            lbl_onda.bind(
+                "<Button-1>",
+                lambda e, r=ruta, f=foto: self._click_forma_onda(r, e.x / max(1, f.width())),
             )
+            lbl_onda.pack(side="left", padx=4)
+        return marco
 
-            self.text_chat.config(state="normal")
-            self.text_chat.window_create(tk.END, window=btn_play)
-            self.text_chat.insert(tk.END, "\n")
-            self.text_chat.see(tk.END)
-            self.text_chat.config(state="disabled")
-            # Forzar renderizado inmediato del botón embebido
-            try:
-                btn_play.update_idletasks()
-            except Exception:
-                pass
+    def _click_forma_onda(self, ruta, fraccion):
+        """Click en la forma de onda: salta a ese punto si ya suena, si no la reproduce."""
+        if self.audio_manager.reproduciendo != ruta:
+            self.audio_manager.reproducir_audio(ruta, self._log_local)
+            return
+        try:
+            with wave.open(ruta, "rb") as wf:
+                duracion = wf.getnframes() / wf.getframerate()
+        except (OSError, wave.Error):
+            return
+        self.audio_manager.buscar(fraccion * duracion)
+
+    def boton_reproducir_audio(self, ruta):
+        try:
+            self._renderizar_lote([self._crear_boton_audio(ruta), "\n"])
         except Exception as e:
             self._log_local(f"[ERROR] No se pudo insertar botón de audio: {e}\n")
 
     def _abrir_imagen(self, ruta):
+        self.descargas.usar(ruta)
         try:
             if os.name == "nt":
                 # Windows
@@ -361,6 +436,20 @@ class ChatClientGUI:
 
     # ========= Lógica de red =========
 
+    @property
+    def conectado(self):
+        return self.cliente is not None and self.cliente.conectado
+
+    def _en_red(self, coro):
+        """Ejecuta una corrutina en el loop de red; devuelve un Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _enviar_sync(self, header, payload=b"", progress_callback=None):
+        """send_frame para los hilos de audio: bloquea hasta que el frame sale."""
+        return self._en_red(
+            self.cliente.enviar_frame(header, payload, progress_callback)
+        ).result()
+
     def conectar(self):
         if self.conectado:
             messagebox.showinfo("Chat", "Ya estás conectado.")
@@ -374,100 +463,208 @@ class ChatClientGUI:
             messagebox.showwarning("Chat", "Debes escribir un nombre de usuario.")
             return
 
+        import voice_codec
+
+        cliente = ChatClient(
+            username,
+            host,
+            port,
+            codecs=voice_codec.CODECS,
+            al_presencia=self._al_presencia,
+            metricas=self.metricas,
+            hashear=True,
+        )
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect((host, port))
-        except OSError as e:
+            self._en_red(cliente.conectar()).result()
+        except ConnectionRefusedError as e:
+            messagebox.showerror("Error", f"El servidor rechazó la conexión: {e}")
+            return
+        except (OSError, asyncio.TimeoutError) as e:
             messagebox.showerror("Error", f"No se pudo conectar: {e}")
             return
 
-        self.sock = sock
-        self.conectado = True
+        self.cliente = cliente
         self.username = username
+        if self.historial:
+            self.historial.cuenta = username
+        self.btn_conectar.config(state="disabled")
+        self._log_local(f"[CLIENTE] Conectado a {host}:{port} como {username}\n")
 
-        # Enviar frame de login
-        ts = time.strftime("%H:%M:%S")
+        self._en_red(self._consumir(cliente))
 
-        header = {
-            "type": "login",
-            "from": self.username,
-            "to": "SERVER",
-            "timestamp": ts,
-        }
-        send_frame(self.sock, header)
+    def _al_presencia(self, usuarios, codecs):
+        # Se llama en el loop de red
+        self.codecs_usuarios = codecs
+        self.cola_userlist.put(usuarios)
+        self._notificar_ui()
 
-        self.btn_conectar.config(state="disabled")
-        self._log_local(f"[CLIENTE] Conectado a {host}:{port} como {username}\n")
+    async def _consumir(self, cliente):
+        """Pasa cada frame recibido al hilo receptor, en orden."""
+        async for header, payload in cliente:
+            try:
+                await self.loop.run_in_executor(self._receptor, self._procesar_frame, header, payload)
+            except Exception as e:
+                # Un frame malo no puede parar la recepción
+                print(f"[CLIENTE] Error al procesar un frame {header.get('type')} de {header.get('from')}: {e}")
+        if not self._cerrando:
+            self.cola_mensajes.put("[CLIENTE] Pulsa Conectar para volver a entrar.\n")
+            self._notificar_ui()
+            self.master.after(0, lambda: self.btn_conectar.config(state="normal"))
+
+    def _procesar_frame(self, header, payload):
+        """Atiende un frame recibido (se ejecuta en el hilo receptor)."""
+        mtype = header.get("type")
+
+        if mtype == "estado":
+            if not header.get("conectado"):
+                self.audio_manager.cerrar_streams_vivo()
+            self.cola_mensajes.put(f"[CLIENTE] {header.get('message', '')}\n")
+            self._notificar_ui()
+
+        elif mtype == "userlist":
+            pass  # ya la atendió _al_presencia
+
+        elif mtype == "text":
+            remitente = header.get("from")
+            destino = header.get("to")
+            msg = header.get("message", "")
+            ts = header.get("timestamp", "??:??")
+            self.cola_mensajes.put(f"[{ts}] {remitente} -> {destino}: {msg}\n")
+            self._notificar_ui()
+            self.audio_manager.notificar()
+
+        elif mtype == "file" or mtype == "audio":
+            remitente = header.get("from")
+            destino = header.get("to")
+            filename = header.get("filename", "archivo")
+            ts = header.get("timestamp", "??:??")
+            ref = header.get("ref")
+            if header.get("vista_previa"):
+                base, ext = os.path.splitext(filename)
+                filename = f"{base}_previa{ext}"
+            carpeta = CARPETA_DESCARGAS if mtype == "file" else CARPETA_RECIBIDOS
+
+            # Una sola copia por contenido; lo repetido reutiliza el archivo
+            # (y el nombre, si coincide) en vez de crear nombre_1, nombre_2...
+            codec = header.get("codec") if mtype == "audio" else None
+            escritor = None
+            if codec:
+                # Nota de voz comprimida: se guarda ya decodificada como WAV
+                import voice_codec
+
+                if codec not in voice_codec.CODECS:
+                    print(f"[AUDIO] Nota de voz de {remitente} con codec desconocido {codec!r}: descartada")
+                    return
+                escritor = functools.partial(voice_codec.decodificar_a_wav, payload, codec=codec)
+
+            ruta = self.descargas.guardar(
+                carpeta,
+                filename,
+                payload,
+                remitente=remitente,
+                clave=header.get("contenido"),
+                variante=codec,
+                escribir=escritor,
+            )
 
-        # Lanzar hilo de recepción
-        hilo = threading.Thread(target=self.hilo_receptor, daemon=True)
-        hilo.start()
+            ext = os.path.splitext(filename)[1].lower()
+            medios = header.get("medios")
+            if medios and mtype == "file":
+                try:
+                    self.image_manager.registrar_medios(ruta, medios)
+                except Exception as e:
+                    print(f"[IMAGEN] Vista previa del servidor no válida para {ruta}: {e}")
+
+            if mtype == "audio":
+                self._generar_forma_onda(ruta, medios)
+                self.cola_mensajes.put(("audio", ruta, remitente, filename))
+            elif header.get("vista_previa") and ref:
+                # Foto reducida: se muestra ya la vista previa; la imagen
+                # reducida la sustituirá al llegar
+                self._fotos[ref] = ruta
+                self._refs_fotos[ruta] = (remitente, ref)
+                mb = header.get("original", {}).get("filesize", 0) / (1024 * 1024)
+                self.cola_mensajes.put(
+                    f"[IMAGEN] Vista previa; clic derecho en la imagen para pedir el original ({mb:.1f} MB)\n"
+                )
+                self.cola_mensajes.put(("img", ruta, remitente, filename))
+            elif ref in self._fotos and not header.get("es_original"):
+                previa = self._fotos.pop(ref)
+                self._refs_fotos[ruta] = (remitente, ref)
+                self.master.after(0, self.image_manager.actualizar_ruta, previa, ruta)
+                return
+            elif ext in [".png", ".jpg", ".jpeg", ".gif"]:
+                # Enviar instrucción a la cola para mostrar imagen
+                self.cola_mensajes.put(("img", ruta, remitente, filename))
+            else:
+                # Mensaje normal
+                self.cola_mensajes.put(("file", ruta, remitente, filename, ts))
+            self._notificar_ui()
+            self.audio_manager.notificar()
+
+        elif mtype == "audio_chunk":
+            if self.audio_manager.recibir_chunk(header, payload):
+                self.cola_mensajes.put(
+                    f"[AUDIO] {header.get('from')} está enviando audio en vivo...\n"
+                )
+                self._notificar_ui()
+                self.audio_manager.notificar()
+
+        elif mtype == "audio_fin":
+            ruta = self.audio_manager.finalizar_stream(header)
+            if ruta:
+                self._generar_forma_onda(ruta)
+                self.cola_mensajes.put(
+                    ("audio", ruta, header.get("from"), os.path.basename(ruta))
+                )
+                self._notificar_ui()
+
+        elif mtype == "ack":
+            if header.get("destino_original") != "Todos":
+                self.cola_mensajes.put(
+                    f"[✓] {header.get('from')} recibió tu mensaje ({header.get('rtt_ms', 0):.0f} ms)\n"
+                )
+                self._notificar_ui()
+
+        elif mtype == "system":
+            msg = header.get("message", "")
+            self.cola_mensajes.put(f"[SERVIDOR] {msg}\n")
+            self._notificar_ui()
+
+        else:
+            self.cola_mensajes.put(f"[WARN] Mensaje desconocido: {header}\n")
+            self._notificar_ui()
+
+    def _generar_forma_onda(self, ruta, medios=None):
+        """Calcula la vista previa de una nota de voz (en el hilo receptor, no en Tk).
+        Si el servidor ya mandó el resumen de la onda no se lee el WAV."""
+        import waveform
+        from medios import guardar_onda
 
-    def hilo_receptor(self):
         try:
-            while self.conectado and self.sock:
-                header, payload = recv_frame(self.sock)
-                mtype = header.get("type")
-
-                if mtype == "userlist":
-                    users = header.get("users", [])
-                    self.cola_userlist.put(users)
-
-                elif mtype == "text":
-                    remitente = header.get("from")
-                    destino = header.get("to")
-                    msg = header.get("message", "")
-                    ts = header.get("timestamp", "??:??")
-                    self.cola_mensajes.put(f"[{ts}] {remitente} -> {destino}: {msg}\n")
-                    self.audio_manager.reproducir_audio("notif.wav", self._log_local)
-
-                elif mtype == "file" or mtype == "audio":
-                    remitente = header.get("from")
-                    destino = header.get("to")
-                    filename = header.get("filename", "archivo")
-                    if mtype == "file":
-                        ruta = os.path.join(CARPETA_DESCARGAS, filename)
-                    else:
-                        ruta = os.path.join(CARPETA_RECIBIDOS, filename)
-                        os.makedirs(CARPETA_RECIBIDOS, exist_ok=True)
-
-                    # Evitar sobrescribir: si existe, agrega sufijo
-                    base, ext = os.path.splitext(ruta)
-                    i = 1
-                    while os.path.exists(ruta):
-                        ruta = f"{base}_{i}{ext}"
-                        i += 1
-
-                    with open(ruta, "wb") as f:
-                        f.write(payload)
-
-                    ext = os.path.splitext(filename)[1].lower()
-
-                    if mtype == "audio":
-                        self.cola_mensajes.put(("audio", ruta, remitente, filename))
-                    elif ext in [".png", ".jpg", ".jpeg", ".gif"]:
-                        # Enviar instrucción a la cola para mostrar imagen
-                        self.cola_mensajes.put(("img", ruta, remitente, filename))
-                    else:
-                        # Mensaje normal
-                        self.cola_mensajes.put(("file", ruta, remitente, filename))
-                    self.audio_manager.reproducir_audio("notif.wav", self._log_local)
-
-                elif mtype == "system":
-                    msg = header.get("message", "")
-                    self.cola_mensajes.put(f"[SERVIDOR] {msg}\n")
-
-                else:
-                    self.cola_mensajes.put(f"[WARN] Mensaje desconocido: {header}\n")
-
-        except (ConnectionError, OSError):
-            self.cola_mensajes.put("[CLIENTE] Conexión con el servidor perdida.\n")
-        finally:
-            self.conectado = False
-            self.sock = None
+            if medios and medios.get("onda"):
+                guardar_onda(medios, ruta)
+            waveform.generar_preview(ruta)
+        except Exception as e:
+            print(f"[AUDIO] No se pudo generar la forma de onda de {ruta}: {e}")
 
     # ========= Envío de datos =========
 
+    def codec_para(self, destino):
+        """Codec de voz que entienden todos los receptores de `destino` (None = WAV)."""
+        if destino == "Todos":
+            receptores = [u for u in self.codecs_usuarios if u != self.username]
+        else:
+            receptores = [destino]
+        if not receptores:
+            return None
+        import voice_codec
+
+        for codec in voice_codec.CODECS:
+            if all(codec in self.codecs_usuarios.get(u, ()) for u in receptores):
+                return codec
+        return None
+
     def _obtener_destinatario(self):
         seleccion = self.listbox_users.curselection()
         if not seleccion:
@@ -485,10 +682,13 @@ class ChatClientGUI:
         return usuario
 
     def enviar_texto_evento(self, event):
+        # Con el popup de emojis abierto, Enter elige la sugerencia
+        if self.autocompletado.aceptar():
+            return "break"
         self.enviar_texto()
 
     def enviar_texto(self):
-        if not self.conectado or not self.sock:
+        if not self.conectado and not (self.cliente and self.cliente.reconectando):
             messagebox.showwarning("Chat", "No estás conectado.")
             return
 
@@ -501,28 +701,26 @@ class ChatClientGUI:
             return
 
         ts = time.strftime("%H:%M:%S")
+        futuro = self._en_red(
+            self.cliente.enviar_texto(destino, texto, ack=self.pedir_acks.get())
+        )
 
-        header = {
-        "type": "text",
-        "from": self.username,
-        "to": destino,
-        "message": texto,
-        "timestamp": ts,
-        }
-
-        try:
-            send_frame(self.sock, header)
+        def al_terminar(f):
+            # Se ejecuta en el loop de red; _log_local lo pasa al hilo de Tk
+            try:
+                enviado = f.result()
+            except Exception as e:
+                self._log_local(f"[ERROR] No se pudo enviar el mensaje: {e}\n")
+                return
             # Mostrar en chat local
-            self._log_local(f"[{ts}] Yo -> {destino}: {texto}\n")
-        except OSError as e:
-            messagebox.showerror("Error", f"No se pudo enviar el mensaje: {e}")
-            self.conectado = False
-            self.sock = None
+            pendiente = "" if enviado else " (pendiente)"
+            self._log_local(f"[{ts}] Yo -> {destino}: {texto}{pendiente}\n")
 
+        futuro.add_done_callback(al_terminar)
         self.entry_msg.delete(0, tk.END)
 
     def enviar_archivo(self):
-        if not self.conectado or not self.sock:
+        if not self.conectado:
             messagebox.showwarning("Chat", "No estás conectado.")
             return
 
@@ -549,46 +747,60 @@ class ChatClientGUI:
 
         ts = time.strftime("%H:%M:%S")
 
-        header = {
-           "type": "file",
-           "from": self.username,
-           "to": destino,
-           "filename": filename,
-           "filesize": tam,
-           "timestamp": ts,
-        }
-
         # Crear ventana de progreso
         win, barra = self._crear_barra_progreso("Enviando archivo...")
 
         def update_barra(p):
-            barra["value"] = p
-            barra.update_idletasks()
+            # Llega desde el loop de red
+            self.master.after(0, lambda: barra.configure(value=p))
+
+        ack = self.pedir_acks.get()
+        franjas = FRANJAS_ENVIO if self.envio_paralelo.get() else 0
+        enviado = f"{tam} bytes"
 
-        # --- MOVER ENVIO A UN HILO ---
-        def hilo_envio():
+        def al_terminar(f):
             try:
-                # Leer archivo
-                with open(ruta, "rb") as f:
-                    datos = f.read()
-                # Enviar con barra de progreso
-                send_frame(self.sock, header, datos, progress_callback=update_barra)
-                # Cerrar ventana al terminar
-                win.destroy()
-
-                # Log local
-                self.master.after(
-                    0,
-                    lambda: self._log_local(
-                        f"[{ts}] [ARCHIVO] Yo -> {destino}: '{filename}' ({tam} bytes)\n"
-                    ),
-                )
+                f.result()
+            except Exception as e:
+                self.master.after(0, lambda msg=str(e): (
+                    win.destroy(),
+                    messagebox.showerror("Error", f"No se pudo enviar el archivo: {msg}"),
+                ))
+                return
+            # Cerrar ventana al terminar y log local
+            self.master.after(0, win.destroy)
+            self._log_local(f"[{ts}] [ARCHIVO] Yo -> {destino}: '{filename}' ({enviado})\n")
+
+        def enviar_normal():
+            # El envío corre en el loop de red, leyendo el archivo por bloques
+            self._en_red(
+                self.cliente.enviar_archivo(destino, ruta, progreso=update_barra, ack=ack, franjas=franjas)
+            ).add_done_callback(al_terminar)
+
+        ext = os.path.splitext(ruta)[1].lower()
+        if not (self.reducir_fotos.get() and ext in EXTENSIONES_REDUCIBLES and tam > UMBRAL_REDUCIR):
+            enviar_normal()
+            return
 
+        def al_reducir(f):
+            # Corre en un hilo del pool de imágenes
+            nonlocal enviado
+            try:
+                reducida = f.result()
             except Exception as e:
-                win.destroy()
-                messagebox.showerror("Error", f"No se pudo enviar el archivo: {e}")
+                print(f"[IMAGEN] No se pudo reducir {ruta}: {e}")
+                reducida = None
+            if reducida is None:
+                enviar_normal()
+                return
+            previa, ruta_reducida = reducida
+            enviado = f"reducida a {os.path.getsize(ruta_reducida)} de {tam} bytes"
+            self._en_red(
+                self.cliente.enviar_imagen(destino, ruta, previa, ruta_reducida, progreso=update_barra, ack=ack)
+            ).add_done_callback(al_terminar)
 
-        threading.Thread(target=hilo_envio, daemon=True).start()
+        # Reducir la foto fuera del hilo de Tk
+        self.image_manager.pool.submit(preparar_envio, ruta).add_done_callback(al_reducir)
 
     def _crear_barra_progreso(self, titulo="Enviando archivo..."):
         win = Toplevel(self.master)
@@ -604,16 +816,29 @@ class ChatClientGUI:
         return win, barra
 
     def _handle_iniciar_grabacion_audio(self):
-        if not self.conectado or not self.sock:
+        if not self.audio_en_vivo.get():
+            # Nota de voz normal: el destinatario se elige al detener
+            self.audio_manager.start_recording()
+            return
+        if not self.conectado:
             messagebox.showwarning("Chat", "No estás conectado.")
             return
         destino = self._obtener_destinatario()
         if not destino:
             return
-        self.audio_manager.start_recording()
+        self.audio_manager.start_recording(
+            destino,
+            self.username,
+            send_frame_func=self._enviar_sync,
+            codec=self.codec_para(destino),
+        )
 
     def _detener_grabacion_audio(self):
-        if not self.conectado or not self.sock:
+        if self.audio_manager.en_vivo:
+            # El audio ya se envió mientras se grababa
+            self.audio_manager.stop_recording(None, self.username, None, self._log_local)
+            return
+        if not self.conectado:
             messagebox.showwarning("Chat", "No estás conectado.")
             return
         destino = self._obtener_destinatario()
@@ -627,9 +852,7 @@ class ChatClientGUI:
         self.audio_manager.stop_recording(
             destino,
             self.username,
-            send_frame_func=lambda header, payload=b"": send_frame(
-                self.sock, header, payload
-            ),
+            send_frame_func=self._enviar_sync,
             log_local_func=self._log_local,
         )
 
@@ -651,6 +874,35 @@ class ChatClientGUI:
         self.menu_opciones.tk_popup(x, y)
         self.menu_opciones.grab_release()
         
+    def mostrar_latencias(self):
+        """Ventana con los histogramas de latencia (se reutiliza si ya existe)."""
+        if self.ventana_latencias is not None and self.ventana_latencias.winfo_exists():
+            self.ventana_latencias.deiconify()
+            self.ventana_latencias.lift()
+            self._actualizar_latencias()
+            return
+
+        win = Toplevel(self.master)
+        win.title("Latencias")
+        self.ventana_latencias = win
+        self.text_latencias = scrolledtext.ScrolledText(win, width=80, height=30, font=("Courier", 10))
+        self.text_latencias.pack(fill="both", expand=True, padx=5, pady=5)
+        botones = tk.Frame(win)
+        botones.pack(pady=5)
+        tk.Button(botones, text="Actualizar", command=self._actualizar_latencias).pack(side=tk.LEFT, padx=5)
+        tk.Button(
+            botones,
+            text="Reiniciar",
+            command=lambda: (self.metricas.reiniciar(), self._actualizar_latencias()),
+        ).pack(side=tk.LEFT, padx=5)
+        self._actualizar_latencias()
+
+    def _actualizar_latencias(self):
+        self.text_latencias.config(state="normal")
+        self.text_latencias.delete("1.0", tk.END)
+        self.text_latencias.insert(tk.END, self.metricas.texto())
+        self.text_latencias.config(state="disabled")
+
     def abrir_carpeta_descargas(self):
         ruta = os.path.abspath(CARPETA_DESCARGAS)
         
@@ -673,116 +925,200 @@ class ChatClientGUI:
   
     # ========= GUI helpers =========
 
+    @perfilado.cronometrar
     def _log_local(self, texto: str):
         """
-        Inserta el texto en el chat de forma robusta incluso si hay imágenes,
-        botones u otros widgets que rompen tk.END.
+        Inserta el texto en el chat. Si se llama desde otro hilo (envíos, audio)
+        se encola y se despierta al hilo de Tk para que lo dibuje.
         """
-        import re
-        import random
-        import traceback
-
-        print("RECIBIDO EN LOG:", repr(texto))
+        if threading.current_thread() is not threading.main_thread():
+            self.cola_mensajes.put(texto)
+            self._notificar_ui()
+            return
+        self._guardar_en_historial(texto)
+        self._renderizar_lote([texto])
 
+    def _notificar_ui(self):
+        """Programa un único procesar_colas en el hilo de Tk (seguro desde cualquier hilo)."""
+        with self._despertar_lock:
+            if self._despertar_pendiente:
+                return
+            self._despertar_pendiente = True
         try:
-            self.text_chat.config(state="normal")
+            self.master.after(0, self.procesar_colas)
+        except (RuntimeError, tk.TclError):
+            # La ventana ya fue destruida
+            pass
 
-            # REGEX que detecta nombre al inicio
-            patron = r"^\s*(?:\[[^\]]+\]\s*)*([A-Za-z0-9_]+)\s*->"
-            m = re.match(patron, texto)
-
-            # Índice seguro del final real del texto
-            safe_end = self.text_chat.index("end-1c")
-
-            if m:
-                nombre = m.group(1)
-
-                # asignar color si no existe
-                if nombre not in self.colores_usuarios:
-                    color = random.choice(self.colores_base)
-                    tag = f"tag_{nombre}"
-                    self.colores_usuarios[nombre] = {"color": color, "tag": tag}
-                    self.text_chat.tag_config(tag, foreground=color, font=("Arial", 10, "bold"))
-                else:
-                    color = self.colores_usuarios[nombre]["color"]
-                    tag = self.colores_usuarios[nombre]["tag"]
-
-                # dividir texto en partes
-                idx = texto.find(nombre)
-                pref = texto[:idx]
-                nom = nombre
-                suf = texto[idx + len(nombre):]
-
-                # insertar prefijo
-                if pref:
-                    self.text_chat.insert(safe_end, pref)
-
-                # insertar nombre con color
-                start = self.text_chat.index("end-1c")
-                self.text_chat.insert(start, nom)
-                end = self.text_chat.index("end-1c")
-                self.text_chat.tag_add(tag, start, end)
-
-                # insertar sufijo
-                self.text_chat.insert("end-1c", suf)
+    def _segmentar_linea(self, texto):
+        """Divide una línea en pares texto/tags, coloreando el nombre del remitente."""
+        m = PATRON_NOMBRE.match(texto)
+        if not m:
+            return [texto, ()]
 
-            else:
-                # sin nombre, inserción directa
-                self.text_chat.insert(safe_end, texto)
+        nombre = m.group(1)
+
+        # asignar color si no existe
+        if nombre not in self.colores_usuarios:
+            color = random.choice(self.colores_base)
+            tag = f"tag_{nombre}"
+            self.colores_usuarios[nombre] = {"color": color, "tag": tag}
+            self.text_chat.tag_config(tag, foreground=color, font=("Arial", 10, "bold"))
+        tag = self.colores_usuarios[nombre]["tag"]
+
+        inicio, fin = m.span(1)
+        return [texto[:inicio], (), nombre, (tag,), texto[fin:], ()]
 
+    def _renderizar_lote(self, entradas):
+        """
+        Inserta un lote de líneas (str) y widgets embebidos en text_chat con un
+        solo cambio de estado y un único see(). Las líneas consecutivas se
+        agrupan en una sola llamada a insert().
+        """
+        if not entradas:
+            return
+
+        try:
+            self.text_chat.config(state="normal")
+            pendientes = []  # texto, tags, texto, tags, ...
+            for entrada in entradas:
+                if isinstance(entrada, str):
+                    pendientes.extend(self._segmentar_linea(entrada))
+                    continue
+                if pendientes:
+                    self.text_chat.insert("end-1c", *pendientes)
+                    pendientes = []
+                self.text_chat.window_create("end-1c", window=entrada)
+            if pendientes:
+                self.text_chat.insert("end-1c", *pendientes)
             self.text_chat.see("end")
+        except tk.TclError as e:
+            print("ERROR al renderizar mensajes:", e)
+        finally:
             self.text_chat.config(state="disabled")
 
-        except Exception as e:
-            print("ERROR en _log_local:", e)
-            traceback.print_exc()
+    def _entradas_de_item(self, item):
+        """Convierte un elemento de cola_mensajes en líneas y widgets para el chat."""
+        if not isinstance(item, tuple):
+            # Mensaje simple
+            return [item]
+
+        tipo = item[0]
+        if tipo == "img":
+            _, ruta, remitente, filename = item
+            entradas = [f"[IMAGEN] {remitente} envió {filename}\n"]
+            try:
+                entradas += [self._crear_imagen_chat(ruta), "\n"]
+            except Exception as e:
+                entradas.append(f"[ERROR] No se pudo mostrar la imagen: {e}\n")
+            return entradas
+
+        if tipo == "file":
+            _, ruta, remitente, filename, ts = item
+            return [f"[{ts}] [ARCHIVO] {remitente} envió {filename}. Guardado en: {ruta}\n"]
+
+        if tipo == "audio":
+            _, ruta, remitente, filename = item
+            entradas = [f"[AUDIO] {remitente} envió {filename}. Guardado en: {ruta}\n"]
+            try:
+                entradas += [self._crear_boton_audio(ruta), "\n"]
+            except Exception as e:
+                entradas.append(f"[ERROR] No se pudo insertar botón de audio: {e}\n")
+            return entradas
+        return []
+
+    def _guardar_en_historial(self, item):
+        """Guarda mensajes y archivos; los avisos del cliente/servidor no."""
+        if not self.historial:
+            return
+        if isinstance(item, tuple):
+            self.historial.guardar(item)
+            return
+        m = PATRON_NOMBRE.match(item)
+        if m:
+            self.historial.guardar(item, m.group(1))
+
+    def _cargar_historial(self):
+        entradas = []
+        for item in self.historial.ultimos(LINEAS_HISTORIAL):
+            entradas += self._entradas_de_item(item)
+        if entradas:
+            entradas.append("──────── mensajes anteriores ────────\n")
+            self._renderizar_lote(entradas)
 
     # Procesar colas
+    @perfilado.cronometrar
     def procesar_colas(self):
+        """Vacía todo lo pendiente y lo dibuja en una única actualización del chat."""
+        with self._despertar_lock:
+            self._despertar_pendiente = False
+
         # Mensajes de chat
+        lote = []
         try:
             while True:
                 item = self.cola_mensajes.get_nowait()
-                if isinstance(item, tuple):
-                    tipo = item[0]
-
-                    if tipo == "img":
-                        _, ruta, remitente, filename = item
-                        self._log_local(f"[IMAGEN] {remitente} envió {filename}\n")
-                        self._insertar_imagen_chat(ruta)
-
-                    elif tipo == "file":
-                        _, ruta, remitente, filename, ts = item
-                        self._log_local(
-                            f"[{ts}] [ARCHIVO] {remitente} envió {filename}. Guardado en: {ruta}\n"
-                        )
-
-                    elif tipo == "audio":
-                        _, ruta, remitente, filename = item
-                        self._log_local(
-                            f"[AUDIO] {remitente} envió {filename}. Guardado en: {ruta}\n"
-                        )
-                        self.boton_reproducir_audio(ruta)
-
-                else:
-                    # Mensaje simple
-                    self._log_local(item)
-
+                self._guardar_en_historial(item)
+                lote += self._entradas_de_item(item)
         except queue.Empty:
             pass
 
-        # Actualizar lista de usuarios
+        self._renderizar_lote(lote)
+
+        # Actualizar lista de usuarios: solo importa la última lista encolada
+        users = None
         try:
             while True:
                 users = self.cola_userlist.get_nowait()
-                self.listbox_users.delete(0, tk.END)
-                self.listbox_users.insert(tk.END, "Todos")
-                for u in users:
-                    self.listbox_users.insert(tk.END, u)
         except queue.Empty:
             pass
-
-        self.master.after(100, self.procesar_colas)
+        if users is not None:
+            ordenados = sorted(users, key=lambda u: (u.lower(), u))
+            self._claves_usuarios = [u.lower() for u in ordenados]
+            self._nombres_usuarios = ordenados
+            self._mostrar_usuarios()
+
+    def _filtrar_usuarios(self):
+        """Usuarios cuyo nombre empieza por el filtro (búsqueda binaria en el índice)."""
+        prefijo = self.entry_filtro_usuarios.get().strip().lower()
+        if not prefijo:
+            return self._nombres_usuarios
+        desde = bisect.bisect_left(self._claves_usuarios, prefijo)
+        hasta = bisect.bisect_right(self._claves_usuarios, prefijo + "\uffff")
+        return self._nombres_usuarios[desde:hasta]
+
+    def _mostrar_usuarios(self):
+        """Aplica al listbox solo las altas y bajas necesarias, conservando la selección."""
+        actual = self._usuarios_mostrados
+        nueva = self._filtrar_usuarios()
+        clave = lambda u: (u.lower(), u)
+
+        i = j = 0
+        pos = 1  # posición en el listbox ("Todos" ocupa la 0)
+        while i < len(actual) or j < len(nueva):
+            # Bloque de bajas consecutivas
+            k = i
+            while k < len(actual) and (j >= len(nueva) or clave(actual[k]) < clave(nueva[j])):
+                k += 1
+            if k > i:
+                self.listbox_users.delete(pos, pos + (k - i) - 1)
+                i = k
+                continue
+            # Bloque de altas consecutivas
+            k = j
+            while k < len(nueva) and (i >= len(actual) or clave(nueva[k]) < clave(actual[i])):
+                k += 1
+            if k > j:
+                self.listbox_users.insert(pos, *nueva[j:k])
+                pos += k - j
+                j = k
+                continue
+            # Mismo usuario en ambas listas
+            i += 1
+            j += 1
+            pos += 1
+
+        self._usuarios_mostrados = list(nueva)
 
     # Buscador de mensajes
     def buscar_mensajes(self, event=None):
@@ -803,28 +1139,61 @@ class ChatClientGUI:
 
         self.text_chat.tag_config("search", background="yellow", foreground="black")
 
+    def buscar_en_historial(self):
+        """Busca el texto del buscador en todo el historial guardado (por relevancia)."""
+        texto = self.entry_search.get().strip()
+        if not texto or not self.historial:
+            return
+        resultados = self.historial.buscar(texto)
+
+        if self.ventana_busqueda is None or not self.ventana_busqueda.winfo_exists():
+            win = Toplevel(self.master)
+            win.title("Buscar en el historial")
+            self.ventana_busqueda = win
+            self.lista_resultados = tk.Listbox(win, width=90, height=20)
+            self.lista_resultados.pack(fill="both", expand=True, padx=5, pady=5)
+        self.ventana_busqueda.deiconify()
+        self.ventana_busqueda.lift()
+
+        self.lista_resultados.delete(0, tk.END)
+        if not resultados:
+            self.lista_resultados.insert(tk.END, f"Sin resultados para «{texto}»")
+        for ts, remitente, fragmento in resultados:
+            fecha = time.strftime("%Y-%m-%d %H:%M", time.localtime(ts))
+            self.lista_resultados.insert(tk.END, f"{fecha}  {remitente or ''}: {fragmento.strip()}")
+
     def limpiar_busqueda(self):
         self.entry_search.delete(0, tk.END)
         self.text_chat.tag_remove("search", "1.0", tk.END)
 
     # Cerrar
     def cerrar(self):
-        self.conectado = False
+        self._cerrando = True
         # audio_manager.close() no existe; usar terminate()
         try:
             self.audio_manager.terminate()
         except Exception:
             pass
-        if self.sock:
+        self.image_manager.cerrar()
+        if self.historial:
+            self.historial.cerrar()
+        if self.cliente:
             try:
-                self.sock.shutdown(socket.SHUT_RDWR)
-            except OSError:
+                self._en_red(self.cliente.cerrar()).result(timeout=2)
+            except Exception:
                 pass
-            self.sock.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._receptor.shutdown(wait=False, cancel_futures=True)
+        self.descargas.cerrar()
         self.master.destroy()
 
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cliente de SuperVillano Chat")
+    perfilado.agregar_argumentos(parser)
+    args = parser.parse_args(argv)
+    perfilado.iniciar("cliente", args.perfil, args.perfil_dir)
+
     root = tk.Tk()
     app = ChatClientGUI(root)
     root.mainloop()
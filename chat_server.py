@@ -1,24 +1,213 @@
 # chat_server_files.py
+import argparse
+import bisect
+import hmac
+import signal
 import socket
+import sys
 import threading
 import json
 import struct
 import time
+import uuid
+from collections import deque
+
+from captura import Captura
+import medios
+from metricas import Metricas
+from multiplexado import Ensamblador, Planificador, codificar_frame, lleva_payload
+import perfilado
 
 HOST = "0.0.0.0"
 PORT = 65436
 
+# Reanudación de sesiones tras una desconexión
+SESION_TTL = 120  # segundos que se guarda la sesión de un usuario desconectado
+MAX_REPLAY_FRAMES = 500  # frames recientes guardados por usuario
+MAX_REPLAY_BYTES = 16 * 1024 * 1024  # tope de payload guardado por usuario
+# Un payload mayor no se guarda (vaciaría el buffer): se repite solo un aviso
+MAX_REPLAY_PAYLOAD = MAX_REPLAY_BYTES // 4
+# Audio en vivo: no se guarda para repetir (echaría del buffer a los textos y
+# al reanudar ya no sirve)
+TIPOS_EFIMEROS = ("audio_chunk", "audio_fin")
+
+# Tiempos por salto: cada cuánto se imprime el resumen
+INTERVALO_METRICAS = 60  # segundos
+
+# Frames cortos encolados para un cliente que no lee; al pasarlo se le desconecta
+MAX_SALIDA_PENDIENTE = 10000
+
+# Envío en paralelo: tamaño máximo de un archivo que llega por franjas
+MAX_TRANSFERENCIA = 1024 * 1024 * 1024
+# ...y lo que puede haber a medio llegar a la vez (memoria ya reservada)
+MAX_TRANSFERENCIAS_USUARIO = 4
+MAX_RESERVA_USUARIO = MAX_TRANSFERENCIA
+MAX_RESERVA_TOTAL = 2 * MAX_TRANSFERENCIA
+
+# Federación: varios servidores enlazados (--nodo, --par)
+REINTENTO_PAR = 2.0  # segundos entre intentos de enlazar con un nodo par
+
 lock = threading.Lock()
-usuarios = {}  # username -> socket
+metricas = Metricas()
+usuarios = {}  # username -> Salida
+codecs_usuarios = {}  # username -> codecs de voz que sabe decodificar
+sesiones = {}  # username -> Sesion (conectados y recién desconectados)
+transferencias = {}  # (username, id) -> Transferencia (archivos que llegan por rangos)
+procesador = None  # medios.Procesador: vistas previas de imágenes y notas de voz
+captura = None  # Captura del tráfico recibido (--captura)
+NODO = None  # nombre de este servidor en la federación
+CLAVE_FEDERACION = None  # clave compartida con los nodos pares (--clave-federacion)
+nodos = {}  # nombre del nodo par -> Enlace
+directorio = {}  # nombre del nodo par -> {username: codecs} de sus usuarios conectados
+
+
+class Sesion:
+    """Estado reanudable de un usuario: su número de secuencia y los últimos
+    frames que se le entregaron (o que se le iban a entregar)."""
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+        self.seq = 0
+        self.buffer = deque()  # (seq, header, payload)
+        self.bytes = 0
+        self.desconectado = None  # time.monotonic() de la desconexión
+
+    def registrar(self, header: dict, payload: bytes) -> dict:
+        """Numera el frame para este usuario y lo guarda para poder repetirlo."""
+        self.seq += 1
+        header = dict(header, seq=self.seq)
+        if len(payload) > MAX_REPLAY_PAYLOAD:
+            aviso = {
+                "type": "system",
+                "from": "SERVER",
+                "to": header.get("to"),
+                "seq": self.seq,
+                "message": f"No se pudo recuperar '{header.get('filename', 'archivo')}' de "
+                           f"{header.get('from')}: es demasiado grande para guardarlo.",
+            }
+            self.buffer.append((self.seq, aviso, b""))
+        else:
+            self.buffer.append((self.seq, header, payload))
+            self.bytes += len(payload)
+        while len(self.buffer) > MAX_REPLAY_FRAMES or self.bytes > MAX_REPLAY_BYTES:
+            _, _, viejo = self.buffer.popleft()
+            self.bytes -= len(viejo)
+        return header
+
+    def pendientes(self, ultimo_seq: int):
+        """Frames con seq > ultimo_seq. completos=False si algunos ya no están."""
+        primero = self.buffer[0][0] if self.buffer else self.seq + 1
+        completos = primero <= ultimo_seq + 1
+        return completos, [(h, p) for seq, h, p in self.buffer if seq > ultimo_seq]
+
+
+class Salida:
+    """Cola de salida de una conexión, vaciada por su propio hilo escritor.
+
+    Quien reenvía (con el lock global tomado) solo encola y nunca espera al
+    socket; el Planificador hace pasar textos y control por delante de las
+    partes de los archivos grandes.
+    """
+
+    def __init__(self, sock: socket.socket, nombre: str):
+        self.sock = sock
+        self.planificador = Planificador()
+        self.cond = threading.Condition()
+        self.cerrada = False
+        threading.Thread(target=self._hilo_escritor, name=f"salida-{nombre}", daemon=True).start()
+
+    def enviar(self, header: dict, payload: bytes = b""):
+        with self.cond:
+            if self.cerrada:
+                raise ConnectionError("Conexión cerrada")
+            if len(self.planificador.control) >= MAX_SALIDA_PENDIENTE:
+                # No lee: se corta y, si reconecta, la sesión le repite lo perdido
+                self._cortar()
+                raise ConnectionError("Cliente demasiado lento")
+            self.planificador.agregar(header, payload)
+            self.cond.notify()
+
+    def cerrar(self):
+        with self.cond:
+            self.cerrada = True
+            self.cond.notify()
+
+    def cortar(self):
+        """Cierra ya la conexión (el hilo lector verá el socket cerrado)."""
+        with self.cond:
+            self._cortar()
+
+    def _cortar(self):
+        self.cerrada = True
+        self.cond.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _hilo_escritor(self):
+        try:
+            while True:
+                with self.cond:
+                    while not self.planificador and not self.cerrada:
+                        self.cond.wait()
+                    if self.cerrada:
+                        return
+                    datos, _ = self.planificador.siguiente()
+                if datos:
+                    self.sock.sendall(datos)
+        except OSError:
+            with self.cond:
+                self._cortar()  # el hilo lector verá el socket cerrado
+
+
+class Enlace:
+    """Conexión con otro servidor de la federación. Entre dos nodos queda una
+    sola: si se abren dos a la vez gana la que abrió el de nombre menor."""
+
+    def __init__(self, salida: Salida, iniciador: str):
+        self.salida = salida
+        self.iniciador = iniciador
+
+
+class Transferencia:
+    """Archivo enviado en paralelo: los rangos llegan por conexiones de datos
+    auxiliares (en cualquier orden) y el header por la conexión de chat."""
+
+    def __init__(self, total: int):
+        if not 0 < total <= MAX_TRANSFERENCIA:
+            raise ValueError(f"Tamaño de transferencia no válido: {total}")
+        self.total = total
+        self.datos = bytearray(total)
+        self.faltan = total
+        self.rangos = []  # [desde, hasta) ya reservados, ordenados y sin huecos entre contiguos
+        self.header = None
+
+    def reservar(self, desde: int, n: int):
+        """Anota el rango antes de recibirlo: así `faltan` solo baja por bytes
+        nuevos. ValueError si se sale del archivo o pisa otro rango."""
+        hasta = desde + n
+        if n <= 0 or desde < 0 or hasta > self.total:
+            raise ValueError("Rango fuera del archivo")
+        i = bisect.bisect_left(self.rangos, [desde])
+        if (i < len(self.rangos) and self.rangos[i][0] < hasta) or (i > 0 and self.rangos[i - 1][1] > desde):
+            raise ValueError("Rango repetido o solapado")
+        # Unir con los vecinos contiguos para que la lista no crezca por rango
+        if i > 0 and self.rangos[i - 1][1] == desde:
+            i -= 1
+            self.rangos[i][1] = hasta
+        else:
+            self.rangos.insert(i, [desde, hasta])
+        if i + 1 < len(self.rangos) and self.rangos[i + 1][0] == hasta:
+            self.rangos[i][1] = self.rangos.pop(i + 1)[1]
 
 
 # ==== Utilidades de framing ====
 
 def send_frame(sock: socket.socket, header: dict, payload: bytes = b""):
-    header_bytes = json.dumps(header).encode("utf-8")
-    header_len = len(header_bytes)
-    sock.sendall(struct.pack("!I", header_len))  # 4 bytes longitud header
-    sock.sendall(header_bytes)
+    # Longitud y header en una sola escritura: dos envíos pequeños seguidos
+    # chocan con Nagle + ACK retardado y añaden ~40 ms por mensaje
+    sock.sendall(codificar_frame(header))
     if payload:
         sock.sendall(payload)
 
@@ -33,21 +222,35 @@ def recv_exact(sock: socket.socket, n: int) -> bytes:
     return data
 
 
-def recv_frame(sock: socket.socket):
+def recv_into_exact(sock: socket.socket, vista: memoryview):
+    """Llena `vista` directamente desde el socket (sin copias intermedias)."""
+    while vista:
+        n = sock.recv_into(vista)
+        if not n:
+            raise ConnectionError("Socket cerrado mientras se recibían datos")
+        vista = vista[n:]
+
+
+def recv_header(sock: socket.socket) -> dict:
     # Leer primero 4 bytes de longitud
     raw_len = sock.recv(4)
     if not raw_len:
         raise ConnectionError("Socket cerrado al leer longitud de encabezado")
+    if len(raw_len) < 4:
+        raw_len += recv_exact(sock, 4 - len(raw_len))
     (header_len,) = struct.unpack("!I", raw_len)
     header_bytes = recv_exact(sock, header_len)
-    header = json.loads(header_bytes.decode("utf-8"))
+    return json.loads(header_bytes.decode("utf-8"))
+
+
+@perfilado.cronometrar
+def recv_frame(sock: socket.socket):
+    header = recv_header(sock)
 
     payload = b""
     # Leer payload para tipos que incluyen datos binarios
-    if header.get("type") in ("file", "audio"):
-        filesize = header.get("filesize", 0)
-        if filesize > 0:
-            payload = recv_exact(sock, filesize)
+    if lleva_payload(header):
+        payload = recv_exact(sock, header["filesize"])
 
     return header, payload
 
@@ -56,25 +259,376 @@ def recv_frame(sock: socket.socket):
 
 def broadcast_userlist():
     with lock:
-        user_list = list(usuarios.keys())
-        for user, sock in usuarios.items():
+        codecs = {u: codecs_usuarios.get(u, []) for u in usuarios}
+        for remotos in directorio.values():
+            codecs.update(remotos)
+        user_list = list(codecs)
+        for user, salida in usuarios.items():
             header = {
                 "type": "userlist",
                 "from": "SERVER",
                 "to": user,
                 "users": user_list,
+                "codecs": codecs,
             }
             try:
-                send_frame(sock, header)
+                salida.enviar(header)
+            except OSError:
+                pass
+
+
+def purgar_sesiones():
+    """Olvida las sesiones desconectadas hace más de SESION_TTL (llamar con lock)."""
+    ahora = time.monotonic()
+    for user in [u for u, s in sesiones.items() if s.desconectado and ahora - s.desconectado > SESION_TTL]:
+        del sesiones[user]
+
+
+def entregar(user: str, header: dict, payload: bytes = b""):
+    """Numera y guarda el frame en la sesión de `user` y se lo envía si está
+    conectado; si no, quedará para cuando reanude (llamar con lock). El audio
+    en vivo solo se envía: sin seq y sin guardarse."""
+    sesion = sesiones.get(user)
+    if sesion and header.get("type") not in TIPOS_EFIMEROS:
+        header = sesion.registrar(header, payload)
+    salida = usuarios.get(user)
+    if salida:
+        try:
+            salida.enviar(dict(header, t_srv_tx=time.time()), payload)
+        except OSError:
+            pass  # se repetirá si el usuario reanuda la sesión
+
+
+def nodo_de(user: str):
+    """Nodo par donde está conectado `user`, o None (llamar con lock)."""
+    for nodo, remotos in directorio.items():
+        if user in remotos:
+            return nodo
+    return None
+
+
+def enviar_a_nodo(nodo: str, header: dict, payload: bytes = b""):
+    """Una copia del frame para el nodo par (llamar con lock)."""
+    enlace = nodos.get(nodo)
+    if enlace:
+        try:
+            enlace.salida.enviar(header, payload)
+        except OSError:
+            pass  # el enlace se cayó: su hilo lo quitará
+
+
+def reenviar(username: str, header: dict, payload: bytes = b"", desde_nodo: bool = False) -> bool:
+    """Reenvía un frame a su destino ("Todos" o un usuario).
+
+    Los usuarios de otros nodos reciben el frame a través de su nodo: una sola
+    copia por nodo, que allí se reparte. Lo que llega de un nodo par
+    (desde_nodo=True) solo se entrega a usuarios locales.
+
+    Devuelve False si el destinatario directo no está conectado ni tiene una
+    sesión reanudable.
+    """
+    destino = header.get("to")
+    with lock:
+        purgar_sesiones()
+        if destino == "Todos":
+            # Enviar a todos excepto al remitente (también a quien está reconectando)
+            for user in set(usuarios) | set(sesiones):
+                if user != username and user != "Todos":
+                    entregar(user, header, payload)
+            if not desde_nodo:
+                for nodo in nodos:
+                    enviar_a_nodo(nodo, header, payload)
+            return True
+        if destino not in usuarios:
+            nodo = None if desde_nodo else nodo_de(destino)
+            if nodo:
+                enviar_a_nodo(nodo, header, payload)
+                return True
+            if destino not in sesiones:
+                return False
+        entregar(destino, header, payload)  # reenviamos tal cual
+        return True
+
+
+def reenviar_archivo(username: str, salida, header: dict, payload: bytes):
+    mtype = header.get("type")
+    destino = header.get("to")
+    filename = header.get("filename", "archivo")
+    print(f"[{header.get('timestamp')}] [{mtype.upper()}] {username} -> {destino}: {filename}")
+    # "medios" solo lo pone el servidor: el del cliente se descarta siempre
+    header.pop("medios", None)
+    if procesador:
+        # Vista previa calculada una vez aquí en vez de en cada receptor
+        t0 = time.perf_counter()
+        resumen = procesador.analizar(header, payload)
+        if resumen:
+            header["medios"] = resumen
+            metricas.registrar(f"medios {mtype}", (time.perf_counter() - t0) * 1000)
+    if not reenviar(username, header, payload) and salida:
+        err = {
+            "type": "system",
+            "from": "SERVER",
+            "to": username,
+            "message": f"No se pudo entregar el archivo, usuario '{destino}' no está conectado.",
+        }
+        salida.enviar(err)
+
+
+def transferencia(clave, total: int) -> Transferencia:
+    """La transferencia `clave`, creándola si hace falta (llamar con lock).
+    ValueError si el tamaño no es válido o no coincide con el ya anunciado."""
+    t = transferencias.get(clave)
+    if t is None:
+        propias = [x.total for c, x in transferencias.items() if c[0] == clave[0]]
+        if len(propias) >= MAX_TRANSFERENCIAS_USUARIO:
+            raise ValueError("Demasiados envíos en paralelo a la vez")
+        if sum(propias) + total > MAX_RESERVA_USUARIO:
+            raise ValueError("Demasiados datos a medio enviar")
+        if sum(x.total for x in transferencias.values()) + total > MAX_RESERVA_TOTAL:
+            raise ValueError("El servidor no tiene memoria libre para más envíos en paralelo")
+        t = transferencias[clave] = Transferencia(total)
+    elif t.total != total:
+        del transferencias[clave]
+        raise ValueError(f"Tamaño de transferencia distinto: {total} != {t.total}")
+    return t
+
+
+def avanzar_transferencia(clave, total: int, recibidos: int = 0, header: dict = None):
+    """Anota lo recibido de una transferencia (bytes de un rango ya reservado
+    o su header). Devuelve (header, payload) cuando ya está completa.
+    ValueError si la transferencia se canceló mientras tanto."""
+    with lock:
+        t = transferencias.get(clave)
+        if t is None or t.total != total:
+            transferencias.pop(clave, None)
+            raise ValueError("El envío en paralelo se canceló o no llegó entero")
+        t.faltan -= recibidos
+        if header is not None:
+            t.header = header
+        if t.faltan > 0 or t.header is None:
+            return None
+        del transferencias[clave]
+    return t.header, t.datos
+
+
+def manejar_datos(sock: socket.socket, addr, header: dict, conexion=None):
+    """Conexión de datos auxiliar de un usuario conectado: recibe rangos de
+    archivos enviados en paralelo y los copia directamente en su sitio."""
+    username = header.get("from")
+    with lock:
+        sesion = sesiones.get(username)
+        valida = username in usuarios and sesion is not None and header.get("session") == sesion.token
+    if not valida:
+        send_frame(sock, {"type": "system", "from": "SERVER", "to": username,
+                          "message": "Conexión de datos sin sesión válida."})
+        return
+
+    claves = set()  # transferencias que pasaron por esta conexión
+    try:
+        recibir_rangos(sock, username, claves, conexion)
+    except Exception:
+        # Conexión cortada o rango no válido: lo que faltaba ya no llegará
+        with lock:
+            for clave in claves:
+                transferencias.pop(clave, None)
+        raise
+
+
+def recibir_rangos(sock: socket.socket, username: str, claves: set, conexion=None):
+    """Bucle de manejar_datos: copia cada rango en su transferencia hasta el "fin"."""
+    recibido = 0
+    while True:
+        rango = recv_header(sock)
+        if captura and rango.get("type") != "rango":
+            captura.frame(conexion, rango)
+        if rango.get("type") == "fin":
+            # Todo lo de esta conexión está en memoria: el cliente ya puede
+            # mandar el header por la conexión de chat
+            send_frame(sock, {"type": "fin", "from": "SERVER", "to": username, "recibido": recibido})
+            return
+        if rango.get("type") != "rango":
+            raise ValueError(f"Frame inesperado en una conexión de datos: {rango.get('type')}")
+
+        clave = (username, rango.get("transfer"))
+        total, desde, n = int(rango["total"]), int(rango["offset"]), int(rango["filesize"])
+        with lock:
+            t = transferencia(clave, total)
+            claves.add(clave)
+            t.reservar(desde, n)
+        recv_into_exact(sock, memoryview(t.datos)[desde : desde + n])
+        recibido += n
+        if captura:
+            captura.frame(conexion, rango, memoryview(t.datos)[desde : desde + n])
+
+        completo = avanzar_transferencia(clave, total, recibidos=n)
+        if completo:
+            # El header llegó antes que los últimos datos: se reenvía desde aquí
+            header, payload = completo
+            header["t_srv_rx"] = time.time()
+            with lock:
+                salida = usuarios.get(username)
+            reenviar_archivo(username, salida, header, payload)
+
+
+def presencia(tipo="presencia") -> dict:
+    """Usuarios conectados a este nodo y sus codecs (llamar con lock)."""
+    return {
+        "type": tipo,
+        "from": NODO,
+        "users": {u: codecs_usuarios.get(u, []) for u in usuarios},
+    }
+
+
+def saludo() -> dict:
+    """Frame "nodo" con el que se presenta este servidor (llamar con lock)."""
+    return dict(presencia("nodo"), clave=CLAVE_FEDERACION)
+
+
+def clave_valida(hola: dict) -> bool:
+    """True si el saludo trae la clave de la federación."""
+    if CLAVE_FEDERACION is None:
+        return False  # sin --clave-federacion no se aceptan nodos
+    return hmac.compare_digest(str(hola.get("clave", "")).encode(), CLAVE_FEDERACION.encode())
+
+
+def anunciar_presencia():
+    """Cuenta a los nodos pares quién está conectado aquí."""
+    with lock:
+        aviso = presencia()
+        for enlace in nodos.values():
+            try:
+                enlace.salida.enviar(aviso)
             except OSError:
                 pass
 
 
+def registrar_enlace(nombre: str, enlace: Enlace) -> bool:
+    """Guarda el enlace con `nombre` si no hay ya uno mejor (llamar con lock)."""
+    actual = nodos.get(nombre)
+    preferido = min(NODO, nombre)
+    if actual is not None and (actual.iniciador == preferido or enlace.iniciador != preferido):
+        return False
+    if actual is not None:
+        actual.salida.cortar()
+    nodos[nombre] = enlace
+    return True
+
+
+def manejar_nodo(sock: socket.socket, addr, hola: dict, iniciador: str):
+    """Enlace con otro servidor: recibe su presencia y los frames que sus
+    usuarios envían a usuarios de este nodo (o a "Todos")."""
+    nombre = hola.get("from")
+    if not clave_valida(hola):
+        print(f"[NODO] Saludo de nodo rechazado desde {addr[0]}:{addr[1]}: clave no válida")
+        send_frame(sock, {"type": "system", "from": "SERVER", "message": "Este servidor no acepta ese nodo."})
+        return
+    if not nombre or nombre == NODO:
+        send_frame(sock, {"type": "system", "from": "SERVER", "message": "Nombre de nodo no válido."})
+        return
+    salida = Salida(sock, f"nodo-{nombre}")
+    enlace = Enlace(salida, iniciador)
+    with lock:
+        if not registrar_enlace(nombre, enlace):
+            salida.cerrar()
+            try:
+                send_frame(sock, {"type": "system", "from": "SERVER", "nodo": NODO,
+                                  "message": f"Ya hay un enlace con {nombre}."})
+            except OSError:
+                pass
+            return
+        # Respuesta al saludo; quien saludó manda su presencia otra vez por si
+        # alguien entró o salió mientras esperaba la respuesta
+        salida.enviar(presencia() if iniciador == NODO else saludo())
+        directorio[nombre] = dict(hola.get("users", {}))
+    print(f"[NODO] Enlazado con {nombre} ({addr[0]}:{addr[1]})")
+    broadcast_userlist()
+
+    entrada = Ensamblador()
+    try:
+        while True:
+            completo = entrada.recibir(*recv_frame(sock))
+            if completo is None:
+                continue
+            header, payload = completo
+            mtype = header.get("type")
+            if mtype == "presencia":
+                with lock:
+                    if nodos.get(nombre) is enlace:
+                        directorio[nombre] = dict(header.get("users", {}))
+                broadcast_userlist()
+            else:
+                with lock:
+                    suyo = header.get("from") in directorio.get(nombre, {})
+                if not suyo:
+                    continue  # solo se aceptan frames de usuarios de ese nodo
+                reenviar(header.get("from"), header, payload, desde_nodo=True)
+                if mtype in ("text", "file", "audio") and "t_srv_rx" in header:
+                    metricas.registrar(f"nodo->nodo {mtype}", (time.time() - header["t_srv_rx"]) * 1000)
+    except (ConnectionError, OSError):
+        pass
+    except Exception as e:
+        print(f"[ERR] Error en el enlace con {nombre}: {e}")
+    finally:
+        with lock:
+            propio = nodos.get(nombre) is enlace
+            if propio:
+                del nodos[nombre]
+                directorio.pop(nombre, None)
+        salida.cerrar()
+        if propio:
+            print(f"[NODO] Enlace con {nombre} perdido")
+            broadcast_userlist()
+
+
+def hilo_par(direccion: str):
+    """Mantiene el enlace con un nodo par (--par HOST:PUERTO), reintentando
+    mientras no responda."""
+    host, _, port = direccion.rpartition(":")
+    conocido = None  # nombre del nodo en esa dirección, cuando ya respondió
+    while True:
+        with lock:
+            enlazado = conocido in nodos
+        if enlazado:
+            # Ya hay enlace (quizá lo abrió el otro lado): no hace falta otro
+            time.sleep(REINTENTO_PAR)
+            continue
+        sock = None
+        try:
+            sock = socket.create_connection((host or "127.0.0.1", int(port)), timeout=5)
+            sock.settimeout(None)
+            with lock:
+                hola = saludo()
+            send_frame(sock, hola)
+            respuesta, _ = recv_frame(sock)
+            conocido = respuesta.get("from") if respuesta.get("type") == "nodo" else respuesta.get("nodo", conocido)
+            if respuesta.get("type") == "nodo":
+                manejar_nodo(sock, (host, int(port)), respuesta, iniciador=NODO)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if sock is not None:
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+        time.sleep(REINTENTO_PAR)
+
+
+@perfilado.cronometrar
 def manejar_cliente(sock: socket.socket, addr):
     username = None
+    salida = None
+    entrada = Ensamblador()  # reconstruye los frames que llegan en partes
+    conexion = captura.nueva_conexion() if captura else None
     try:
         # Esperar frame de login
         header, _ = recv_frame(sock)
+        if captura:
+            captura.frame(conexion, header)
+        if header.get("type") == "datos":
+            return manejar_datos(sock, addr, header, conexion)
+        if header.get("type") == "nodo":
+            return manejar_nodo(sock, addr, header, iniciador=header.get("from"))
         if header.get("type") != "login":
             raise ValueError("Primer mensaje no es login")
 
@@ -83,8 +637,11 @@ def manejar_cliente(sock: socket.socket, addr):
             raise ValueError("Login sin nombre de usuario")
 
         with lock:
-            if username in usuarios:
-                # Nombre en uso
+            purgar_sesiones()
+            sesion = sesiones.get(username)
+            reanuda = sesion is not None and header.get("session") == sesion.token
+            if (username in usuarios and not reanuda) or nodo_de(username):
+                # Nombre en uso (aquí o en otro nodo)
                 error_header = {
                     "type": "system",
                     "from": "SERVER",
@@ -93,105 +650,234 @@ def manejar_cliente(sock: socket.socket, addr):
                 }
                 send_frame(sock, error_header)
                 raise ValueError("Username duplicado")
-            usuarios[username] = sock
+            if username in usuarios:
+                # Reanuda sobre una conexión vieja que aún no se detectó caída
+                try:
+                    usuarios[username].sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            if not reanuda:
+                sesion = Sesion()
+                sesiones[username] = sesion
+            sesion.desconectado = None
+            salida = Salida(sock, username)
+            usuarios[username] = salida
+            codecs_usuarios[username] = list(header.get("codecs", []))
+
+            salida.enviar({
+                "type": "sesion",
+                "from": "SERVER",
+                "to": username,
+                "session": sesion.token,
+                "last_seq": sesion.seq,
+                "resumed": reanuda,
+            })
+            if reanuda:
+                # Repetir lo que se perdió mientras estaba desconectado
+                completos, pendientes = sesion.pendientes(int(header.get("last_seq", 0)))
+                if not completos:
+                    salida.enviar({
+                        "type": "system",
+                        "from": "SERVER",
+                        "to": username,
+                        "message": "Algunos mensajes antiguos ya no se pudieron recuperar.",
+                    })
+                for h, p in pendientes:
+                    salida.enviar(dict(h, reenvio=True, t_srv_tx=time.time()), p)
+                print(f"[~] {username} reanudó su sesión ({len(pendientes)} frames repetidos)")
 
         print(f"[+] {username} conectado desde {addr}")
         # Avisar userlist nueva
         broadcast_userlist()
+        anunciar_presencia()
 
         # Bucle principal de recepción
         while True:
             header, payload = recv_frame(sock)
+            if captura:
+                captura.frame(conexion, header, payload)
+            completo = entrada.recibir(header, payload)
+            if completo is None:
+                continue  # falta parte del payload; mientras, llegan otros frames
+            header, payload = completo
+            t_rx = time.time()
             mtype = header.get("type")
             if "timestamp" not in header:
                 header["timestamp"] = time.strftime("%H:%M:%S")
+            # Sello del servidor para medir la latencia de cada salto
+            header["t_srv_rx"] = t_rx
+            if "t_envio" in header:
+                metricas.registrar(f"cliente->servidor {mtype}", (t_rx - header["t_envio"]) * 1000)
 
             if mtype == "text":
                 destino = header.get("to")
                 mensaje = header.get("message", "")
                 print(f"[{header.get('timestamp')}] [MSG] {username} -> {destino}: {mensaje}")
 
-                with lock:
-                    if destino == "Todos":
-                        # Enviar a todos excepto al remitente
-                        for user, dest_sock in usuarios.items():
-                            if user != username and user != "Todos":
-                                send_frame(dest_sock, header)
-                    else:
-                        dest_sock = usuarios.get(destino)
-                        if dest_sock:
-                            send_frame(dest_sock, header)  # reenviamos tal cual
-                        else:
-                            # Enviar error al remitente
-                            err = {
-                                "type": "system",
-                                "from": "SERVER",
-                                "to": username,
-                                "message": f"Usuario '{destino}' no existe o no está conectado.",
-                            }
-                            send_frame(sock, err)
+                if not reenviar(username, header):
+                    # Enviar error al remitente
+                    err = {
+                        "type": "system",
+                        "from": "SERVER",
+                        "to": username,
+                        "message": f"Usuario '{destino}' no existe o no está conectado.",
+                    }
+                    salida.enviar(err)
 
             elif mtype == "file" or mtype == "audio":
-                destino = header.get("to")
-                filename = header.get("filename", "archivo")
-                pprint(f"[{header.get('timestamp')}] [{mtype.upper()}] {username} -> {destino}: {filename}")
-                with lock:
-                    if destino == "Todos":
-                        # Enviar a todos excepto al remitente
-                        for user, dest_sock in usuarios.items():
-                            if user != username and user != "Todos":
-                                send_frame(dest_sock, header, payload)
-                    else:
-                        dest_sock = usuarios.get(destino)
-                        if dest_sock:
-                            # Reenviar mismo header y payload al destinatario
-                            send_frame(dest_sock, header, payload)
-                        else:
-                            err = {
-                                "type": "system",
-                                "from": "SERVER",
-                                "to": username,
-                                "message": f"No se pudo entregar el archivo, usuario '{destino}' no está conectado.",
-                            }
-                            send_frame(sock, err)
+                if "transfer" in header:
+                    # Envío en paralelo: los datos llegan por conexiones auxiliares
+                    clave = (username, header.pop("transfer"))
+                    try:
+                        completo = avanzar_transferencia(clave, header.get("filesize", 0), header=header)
+                    except ValueError as e:
+                        salida.enviar({
+                            "type": "system",
+                            "from": "SERVER",
+                            "to": username,
+                            "message": f"No se pudo recibir '{header.get('filename')}': {e}",
+                        })
+                        continue
+                    if completo is None:
+                        continue  # lo reenviará el hilo que reciba el último rango
+                    header, payload = completo
+                reenviar_archivo(username, salida, header, payload)
+
+            elif mtype == "audio_chunk" or mtype == "audio_fin":
+                # Audio en vivo: se reenvía cada trozo sin registrar nada por trozo
+                if mtype == "audio_fin":
+                    print(f"[{header.get('timestamp')}] [AUDIO EN VIVO] {username} -> {header.get('to')}")
+                reenviar(username, header, payload)
+
+            elif mtype == "ack":
+                # Confirmación de entrega: vuelve al remitente original
+                reenviar(username, header)
+
+            elif mtype == "pedir_original":
+                # Petición del original de una foto enviada reducida
+                if not reenviar(username, header):
+                    err = {
+                        "type": "system",
+                        "from": "SERVER",
+                        "to": username,
+                        "message": f"'{header.get('to')}' no está conectado; no se puede pedir el original.",
+                    }
+                    salida.enviar(err)
 
             else:
                 # Mensaje no soportado
                 print(f"[WARN] Tipo no soportado: {mtype} de {username}")
+                continue
+
+            metricas.registrar(f"reenvío {mtype}", (time.time() - t_rx) * 1000)
 
     except (ConnectionError, OSError):
         print(f"[!] Conexión perdida con {addr} ({username})")
     except Exception as e:
         print(f"[ERR] Error con {addr} ({username}): {e}")
     finally:
+        if captura:
+            captura.cerrar_conexion(conexion)
         if username:
             with lock:
-                if usuarios.get(username) is sock:
+                if salida is not None and usuarios.get(username) is salida:
                     del usuarios[username]
+                    codecs_usuarios.pop(username, None)
+                    # Transferencias en paralelo que ya no se completarán
+                    for clave in [c for c in transferencias if c[0] == username]:
+                        del transferencias[clave]
+                    if username in sesiones:
+                        # Se conserva un rato por si el cliente reconecta
+                        sesiones[username].desconectado = time.monotonic()
             print(f"[-] {username} desconectado")
             broadcast_userlist()
+            anunciar_presencia()
+        if salida:
+            salida.cerrar()
         try:
             sock.close()
         except OSError:
             pass
 
 
-def main():
+def hilo_metricas():
+    """Imprime cada INTERVALO_METRICAS los tiempos por salto acumulados."""
+    anteriores = []
+    while True:
+        time.sleep(INTERVALO_METRICAS)
+        lineas = metricas.resumen()
+        if lineas and lineas != anteriores:
+            anteriores = lineas
+            print("[METRICAS] " + "\n[METRICAS] ".join(lineas))
+
+
+def main(argv=None):
+    global procesador, captura, NODO, CLAVE_FEDERACION, PORT
+    parser = argparse.ArgumentParser(description="Servidor de SuperVillano Chat")
+    parser.add_argument(
+        "--medios-workers",
+        type=int,
+        default=medios.WORKERS,
+        help="procesos para las vistas previas de imágenes y audios (0 = no calcularlas)",
+    )
+    parser.add_argument("--captura", metavar="RUTA", help="guardar el tráfico recibido (.jsonl.gz)")
+    parser.add_argument("--captura-hash", action="store_true", help="guardar también un hash de cada payload")
+    parser.add_argument("--puerto", type=int, default=PORT, help=f"puerto de escucha (por defecto {PORT})")
+    parser.add_argument("--nodo", metavar="NOMBRE", help="nombre de este servidor en la federación (por defecto host:puerto)")
+    parser.add_argument(
+        "--par",
+        metavar="HOST:PUERTO",
+        action="append",
+        default=[],
+        help="otro servidor de la federación al que enlazarse (repetible)",
+    )
+    parser.add_argument(
+        "--clave-federacion",
+        metavar="CLAVE",
+        help="clave compartida por los nodos de la federación (sin ella no se aceptan nodos)",
+    )
+    perfilado.agregar_argumentos(parser)
+    args = parser.parse_args(argv)
+    if args.par and not args.clave_federacion:
+        parser.error("--par necesita --clave-federacion")
+    PORT = args.puerto
+    CLAVE_FEDERACION = args.clave_federacion
+    NODO = args.nodo or f"{socket.gethostname()}:{PORT}"
+    perfilado.iniciar("servidor", args.perfil, args.perfil_dir)
+    if args.captura:
+        captura = Captura(args.captura, con_hash=args.captura_hash)
+        print(f"[SERVIDOR] Capturando el tráfico en {args.captura}")
+    if args.medios_workers > 0:
+        procesador = medios.Procesador(args.medios_workers, max_pendientes=2 * args.medios_workers)
+
+    # SIGTERM (kill, systemd, docker stop) cierra igual que CTRL+C: la captura
+    # y el pool de medios terminan bien
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
     servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     servidor.bind((HOST, PORT))
     servidor.listen()
     print(f"[SERVIDOR] Escuchando en {HOST}:{PORT} ...")
+    threading.Thread(target=hilo_metricas, daemon=True).start()
+    for direccion in args.par:
+        threading.Thread(target=hilo_par, args=(direccion,), name=f"par-{direccion}", daemon=True).start()
+    if args.par:
+        print(f"[SERVIDOR] Nodo {NODO}, enlazando con {', '.join(args.par)}")
 
     try:
         while True:
             conn, addr = servidor.accept()
-            hilo = threading.Thread(target=manejar_cliente, args=(conn, addr), daemon=True)
+            hilo = threading.Thread(target=perfilado.en_hilo(manejar_cliente), args=(conn, addr), daemon=True)
             hilo.start()
     except KeyboardInterrupt:
         print("\n[SERVIDOR] Cerrando por CTRL+C...")
     finally:
         servidor.close()
+        if procesador:
+            procesador.cerrar()
+        if captura:
+            captura.cerrar()
 
 
 if __name__ == "__main__":
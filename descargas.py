@@ -0,0 +1,250 @@
+"""Caché de descargas direccionada por contenido.
+
+Cada archivo recibido se guarda una sola vez en CARPETA_CACHE, con el hash de
+su contenido como nombre; lo que el usuario ve en descargas_chat (o en
+audios_recibidos) son enlaces duros a esa copia. Un meme reenviado diez veces
+ocupa lo mismo que una vez y, si llega otra vez con el mismo nombre, se usa el
+mismo archivo visible en vez de crear foto_1, foto_2...
+
+El índice (SQLite) guarda el tamaño, el remitente y el último uso de cada
+contenido. Cada remitente tiene una cuota (CUOTA_USUARIO) y la caché entera un
+máximo (MAX_CACHE): al pasarse se borran los contenidos usados hace más
+tiempo, con sus archivos visibles. Si el disco no admite enlaces duros el
+archivo visible es una copia.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from multiplexado import hash_contenido
+
+CARPETA_CACHE = "descargas_cache"
+CUOTA_USUARIO = 256 * 1024 * 1024  # bytes por remitente
+MAX_CACHE = 1024 * 1024 * 1024  # bytes en total
+# Archivos que se generan junto al visible (waveform.ruta_preview y
+# ruta_resumen de las notas de voz): se van con él
+SUFIJOS_DERIVADOS = (".onda.png", ".onda.npy")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS contenidos (
+    clave TEXT PRIMARY KEY,
+    tam INTEGER NOT NULL,
+    remitente TEXT,
+    usado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contenidos_remitente ON contenidos(remitente, usado);
+CREATE INDEX IF NOT EXISTS contenidos_usado ON contenidos(usado);
+CREATE TABLE IF NOT EXISTS enlaces (
+    ruta TEXT PRIMARY KEY,
+    clave TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    copia INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS enlaces_clave ON enlaces(clave);
+"""
+
+
+def _enlazar(objeto, ruta):
+    """Crea `ruta` como enlace duro a `objeto` (o copia). FileExistsError si ya existe.
+
+    Devuelve True si tuvo que copiar.
+    """
+    try:
+        os.link(objeto, ruta)
+        return False
+    except FileExistsError:
+        raise
+    except OSError:
+        # FAT, otra unidad o sin permiso para enlaces: copia
+        with open(objeto, "rb") as origen, open(ruta, "xb") as destino:
+            shutil.copyfileobj(origen, destino)
+        return True
+
+
+def _hash_archivo(ruta, bloque=1 << 20):
+    h = hash_contenido()
+    with open(ruta, "rb") as f:
+        for parte in iter(lambda: f.read(bloque), b""):
+            h.update(parte)
+    return h.hexdigest()
+
+
+def _borrar_derivados(ruta):
+    """Quita las vistas previas de `ruta`, que ya no corresponden a su contenido."""
+    for sufijo in SUFIJOS_DERIVADOS:
+        try:
+            os.remove(ruta + sufijo)
+        except OSError:
+            pass
+
+
+def _es_copia_de(ruta, objeto, copia):
+    """True si `ruta` sigue siendo el enlace (o la copia) que se creó para `objeto`.
+
+    Una copia solo se da por buena si su contenido es idéntico: el usuario
+    pudo reemplazarla por otro archivo con el mismo nombre.
+    """
+    try:
+        if os.path.samefile(ruta, objeto):
+            return True
+        if not copia or os.path.getsize(ruta) != os.path.getsize(objeto):
+            return False
+        return _hash_archivo(ruta) == _hash_archivo(objeto)
+    except OSError:
+        return False
+
+
+class CacheDescargas:
+    """Guarda lo recibido por contenido y lo enlaza con nombres visibles.
+
+    El índice se abre al primer uso (no retrasa el arranque de la ventana).
+    """
+
+    def __init__(self, carpeta=CARPETA_CACHE, cuota_usuario=CUOTA_USUARIO, maximo=MAX_CACHE):
+        self.carpeta = carpeta
+        self.cuota_usuario = cuota_usuario
+        self.maximo = maximo
+        self._con = None
+        self._lock = threading.Lock()
+
+    def _indice(self):
+        if self._con is None:
+            os.makedirs(self.carpeta, exist_ok=True)
+            self._con = sqlite3.connect(os.path.join(self.carpeta, "indice.db"), check_same_thread=False)
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute("PRAGMA synchronous=NORMAL")
+            self._con.executescript(ESQUEMA)
+            try:
+                # Índice de una versión anterior, sin la columna copia
+                self._con.execute("ALTER TABLE enlaces ADD COLUMN copia INTEGER NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                pass  # ya la tiene
+        return self._con
+
+    def _objeto(self, clave):
+        return os.path.join(self.carpeta, clave)
+
+    def guardar(self, carpeta, nombre, datos, remitente=None, clave=None, variante=None, escribir=None):
+        """Deja `datos` visible como carpeta/nombre (o nombre_1, ...) y devuelve la ruta.
+
+        clave: hash de `datos` si ya se calculó al recibirlo.
+        variante: distingue contenidos guardados transformados (p. ej. el codec
+        de una nota de voz que se guarda decodificada).
+        escribir(ruta): escribe el contenido; por defecto `datos` tal cual.
+        """
+        if clave is None:
+            h = hash_contenido()
+            h.update(datos)
+            clave = h.hexdigest()
+        if variante:
+            clave = f"{clave}-{variante}"
+        objeto = self._objeto(clave)
+        ahora = time.time()
+
+        with self._lock:
+            con = self._indice()
+            fila = con.execute("SELECT tam FROM contenidos WHERE clave = ?", (clave,)).fetchone()
+            if fila is None or not os.path.exists(objeto) or os.path.getsize(objeto) != fila[0]:
+                temporal = f"{objeto}.{os.getpid()}.tmp"
+                if escribir:
+                    escribir(temporal)
+                else:
+                    with open(temporal, "wb") as f:
+                        f.write(datos)
+                os.replace(temporal, objeto)
+                con.execute(
+                    "INSERT OR REPLACE INTO contenidos (clave, tam, remitente, usado) VALUES (?, ?, ?, ?)",
+                    (clave, os.path.getsize(objeto), remitente, ahora),
+                )
+            else:
+                con.execute("UPDATE contenidos SET usado = ? WHERE clave = ?", (ahora, clave))
+
+            ruta = self._enlace_existente(clave, carpeta, nombre, objeto)
+            if ruta is None:
+                ruta, copia = self._nuevo_enlace(objeto, carpeta, nombre)
+                con.execute(
+                    "INSERT OR REPLACE INTO enlaces (ruta, clave, nombre, copia) VALUES (?, ?, ?, ?)",
+                    (ruta, clave, nombre, copia),
+                )
+            self._recortar(remitente, clave)
+            con.commit()
+        return ruta
+
+    def _enlace_existente(self, clave, carpeta, nombre, objeto):
+        """Archivo visible ya creado para el mismo contenido y el mismo nombre."""
+        for ruta, copia in self._indice().execute(
+            "SELECT ruta, copia FROM enlaces WHERE clave = ? AND nombre = ?", (clave, nombre)
+        ).fetchall():
+            if os.path.dirname(ruta) == carpeta and _es_copia_de(ruta, objeto, copia):
+                return ruta
+        return None
+
+    def _nuevo_enlace(self, objeto, carpeta, nombre):
+        """(ruta, copia) del archivo visible nuevo."""
+        os.makedirs(carpeta, exist_ok=True)
+        base, ext = os.path.splitext(os.path.join(carpeta, nombre))
+        ruta, i = f"{base}{ext}", 1
+        while True:
+            try:
+                copia = _enlazar(objeto, ruta)
+                # Si el nombre ya se usó antes, su vista previa es de otro contenido
+                _borrar_derivados(ruta)
+                return ruta, copia
+            except FileExistsError:
+                # Otro archivo con ese nombre: agrega sufijo
+                ruta = f"{base}_{i}{ext}"
+                i += 1
+
+    def _recortar(self, remitente, protegida):
+        """Borra lo usado hace más tiempo hasta cumplir la cuota del remitente
+        y el máximo total; `protegida` (lo que se acaba de guardar) se queda."""
+        con = self._indice()
+        limites = [(self.maximo, "", ())]
+        if remitente is not None:
+            limites.insert(0, (self.cuota_usuario, "WHERE remitente = ?", (remitente,)))
+        for limite, filtro, params in limites:
+            total = con.execute(f"SELECT COALESCE(SUM(tam), 0) FROM contenidos {filtro}", params).fetchone()[0]
+            if total <= limite:
+                continue
+            viejos = con.execute(f"SELECT clave, tam FROM contenidos {filtro} ORDER BY usado", params).fetchall()
+            for clave, tam in viejos:
+                if total <= limite:
+                    break
+                if clave != protegida:
+                    self._borrar(clave)
+                    total -= tam
+
+    def _borrar(self, clave):
+        con = self._indice()
+        objeto = self._objeto(clave)
+        for ruta, copia in con.execute("SELECT ruta, copia FROM enlaces WHERE clave = ?", (clave,)).fetchall():
+            if _es_copia_de(ruta, objeto, copia):
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+                _borrar_derivados(ruta)
+        try:
+            os.remove(objeto)
+        except OSError:
+            pass
+        con.execute("DELETE FROM enlaces WHERE clave = ?", (clave,))
+        con.execute("DELETE FROM contenidos WHERE clave = ?", (clave,))
+
+    def usar(self, ruta):
+        """Marca como recién usado el contenido del archivo visible `ruta`."""
+        with self._lock:
+            con = self._indice()
+            con.execute(
+                "UPDATE contenidos SET usado = ? WHERE clave = (SELECT clave FROM enlaces WHERE ruta = ?)",
+                (time.time(), ruta),
+            )
+            con.commit()
+
+    def cerrar(self):
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
@@ -1,5 +1,11 @@
+import os
+import re
 import tkinter as tk
 
+# Catálogo completo: una línea "emoji<TAB>código" por emoji (se carga al primer uso)
+RUTA_CATALOGO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "emojis.tsv")
+
+# Alias cortos de siempre; tienen prioridad sobre los nombres largos del catálogo
 EMOJIS = {
     "smile": "😄",
     "sad": "😢",
@@ -9,46 +15,280 @@ EMOJIS = {
     "clap": "👏",
 }
 
+COLUMNAS = 8  # paleta: botones por fila
+FILAS_VISIBLES = 6  # paleta: filas de botones reales (se reutilizan al desplazar)
+MAX_SUGERENCIAS = 8
+
+# ":cod" mientras se escribe y ":codigo:" ya cerrado, justo antes del cursor
+PATRON_PARCIAL = re.compile(r":([a-z0-9_+\-]+)$")
+PATRON_COMPLETO = re.compile(r":([a-z0-9_+\-]+):$")
+
+_catalogo = None  # [(codigo, emoji)] con los códigos cortos primero
+_por_codigo = None
+_trie = None
+
+
+class TriePrefijos:
+    """Trie de códigos. Cada nodo guarda ya sus primeras completaciones, así que
+    buscar un prefijo cuesta lo que mide el prefijo."""
+
+    def __init__(self, limite=MAX_SUGERENCIAS):
+        self.raiz = {}
+        self.limite = limite
+
+    def insertar(self, codigo, valor):
+        nodo = self.raiz
+        for letra in codigo:
+            nodo = nodo.setdefault(letra, {})
+            mejores = nodo.setdefault("", [])  # "" nunca choca con una letra
+            if len(mejores) < self.limite:
+                mejores.append((codigo, valor))
+
+    def buscar(self, prefijo):
+        nodo = self.raiz
+        for letra in prefijo:
+            nodo = nodo.get(letra)
+            if nodo is None:
+                return []
+        return list(nodo.get("", []))
+
+
+def cargar_catalogo():
+    """Carga emojis.tsv y construye el índice la primera vez que se necesita."""
+    global _catalogo, _por_codigo, _trie
+    if _catalogo is None:
+        por_codigo = {}
+        try:
+            with open(RUTA_CATALOGO, encoding="utf-8") as f:
+                for linea in f:
+                    emoji, _, codigo = linea.rstrip("\n").partition("\t")
+                    if codigo:
+                        por_codigo[codigo] = emoji
+        except OSError as e:
+            print(f"[EMOJI] No se pudo cargar el catálogo: {e}")
+        por_codigo.update(EMOJIS)
+
+        catalogo = sorted(por_codigo.items(), key=lambda e: (len(e[0]), e[0]))
+        trie = TriePrefijos()
+        for codigo, emoji in catalogo:
+            trie.insertar(codigo, emoji)
+        _catalogo, _por_codigo, _trie = catalogo, por_codigo, trie
+    return _catalogo
+
+
 def get_emoji(name):
-    return EMOJIS.get(name, "")
+    cargar_catalogo()
+    return _por_codigo.get(name, "")
+
+
+def buscar_codigos(prefijo):
+    """[(codigo, emoji)] cuyos códigos empiezan por `prefijo`."""
+    cargar_catalogo()
+    return _trie.buscar(prefijo.lower())
+
 
 def insertar_emoji(cliente, name):
-    if name in EMOJIS.values():
-        emoji = name
-    else:
+    cargar_catalogo()
+    if name in _por_codigo:
         emoji = get_emoji(name)
+    else:
+        emoji = name
 
     if emoji:
         try:
-            cliente.entry_msg.insert(tk.END, emoji)
+            cliente.entry_msg.insert(tk.INSERT, emoji)
         except Exception:
             pass
 
-    # Cerrar la paleta si está abierta
+    # Ocultar la paleta (se reutiliza la próxima vez)
     try:
         if hasattr(cliente, 'paleta_emoji') and cliente.paleta_emoji:
-            cliente.paleta_emoji.destroy()
+            cliente.paleta_emoji.withdraw()
     except Exception:
         pass
 
     return cliente
 
+
 def mostrar_paleta_emojis(cliente):
-    """Crea y muestra la ventana Toplevel con los botones de emoji."""
-    cliente.paleta_emoji = tk.Toplevel(cliente.master)
-    cliente.paleta_emoji.title("Emojis")
-    cliente.paleta_emoji.geometry("150x120") 
-    cliente.paleta_emoji.transient(cliente.master) # Mantiene la paleta encima de la ventana principal
-    
-    fila = 0
-    columna = 0
-    
-    for nombre, caracter in EMOJIS.items():
-        btn = tk.Button(cliente.paleta_emoji, text=caracter, font=("Arial", 16),
-                        command=lambda c=caracter: insertar_emoji(cliente, c))
-        btn.grid(row=fila, column=columna, padx=2, pady=2)
-        
-        columna += 1
-        if columna >= 3: # 3 emojis por fila
-            columna = 0
-            fila += 1
\ No newline at end of file
+    """Muestra la paleta de emojis. La ventana se crea una sola vez y luego solo se
+    vuelve a mostrar."""
+    paleta = getattr(cliente, "paleta_emoji", None)
+    if paleta is None or not paleta.winfo_exists():
+        paleta = _crear_paleta(cliente)
+    paleta.deiconify()
+    paleta.lift()
+    paleta.buscador.focus_set()
+
+
+def _crear_paleta(cliente):
+    paleta = tk.Toplevel(cliente.master)
+    paleta.title("Emojis")
+    paleta.transient(cliente.master) # Mantiene la paleta encima de la ventana principal
+    paleta.protocol("WM_DELETE_WINDOW", paleta.withdraw)
+    cliente.paleta_emoji = paleta
+
+    paleta.buscador = tk.Entry(paleta)
+    paleta.buscador.grid(row=0, column=0, columnspan=COLUMNAS + 1, sticky="ew", padx=2, pady=2)
+
+    # Solo existen COLUMNAS x FILAS_VISIBLES botones; al desplazar cambia su texto
+    paleta.botones = []
+    for i in range(COLUMNAS * FILAS_VISIBLES):
+        btn = tk.Button(paleta, text="", font=("Arial", 16), width=2, relief="flat")
+        btn.grid(row=1 + i // COLUMNAS, column=i % COLUMNAS, padx=1, pady=1)
+        paleta.botones.append(btn)
+
+    paleta.barra = tk.Scrollbar(paleta, orient="vertical")
+    paleta.barra.grid(row=1, column=COLUMNAS, rowspan=FILAS_VISIBLES, sticky="ns")
+
+    paleta.lista = cargar_catalogo()
+    paleta.fila = 0
+
+    def total_filas():
+        return max(1, -(-len(paleta.lista) // COLUMNAS))
+
+    def pintar():
+        inicio = paleta.fila * COLUMNAS
+        for i, btn in enumerate(paleta.botones):
+            if inicio + i < len(paleta.lista):
+                codigo, emoji = paleta.lista[inicio + i]
+                btn.config(text=emoji, state="normal",
+                           command=lambda c=emoji: insertar_emoji(cliente, c))
+            else:
+                btn.config(text="", state="disabled", command="")
+        filas = total_filas()
+        paleta.barra.set(paleta.fila / filas, min(1.0, (paleta.fila + FILAS_VISIBLES) / filas))
+
+    def ir_a_fila(fila):
+        paleta.fila = max(0, min(int(fila), total_filas() - FILAS_VISIBLES))
+        pintar()
+
+    def desplazar(accion, cantidad, unidad=None):
+        if accion == "moveto":
+            ir_a_fila(float(cantidad) * total_filas())
+        elif unidad == "pages":
+            ir_a_fila(paleta.fila + int(cantidad) * FILAS_VISIBLES)
+        else:
+            ir_a_fila(paleta.fila + int(cantidad))
+
+    def filtrar(event=None):
+        texto = paleta.buscador.get().strip().lower().replace(" ", "_")
+        catalogo = cargar_catalogo()
+        paleta.lista = [e for e in catalogo if texto in e[0]] if texto else catalogo
+        ir_a_fila(0)
+
+    paleta.barra.config(command=desplazar)
+    paleta.buscador.bind("<KeyRelease>", filtrar)
+    paleta.bind("<MouseWheel>", lambda e: ir_a_fila(paleta.fila - (1 if e.delta > 0 else -1)))
+    paleta.bind("<Button-4>", lambda e: ir_a_fila(paleta.fila - 1))  # Linux
+    paleta.bind("<Button-5>", lambda e: ir_a_fila(paleta.fila + 1))
+    pintar()
+    return paleta
+
+
+class Autocompletado:
+    """Sugiere emojis al escribir ":codigo" en entry_msg. El popup de sugerencias
+    se crea una sola vez y se muestra/oculta según haga falta."""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self.entry = cliente.entry_msg
+        self.popup = None
+        self.lista = None
+        self.sugerencias = []
+        self.largo = 0  # caracteres de ":cod" que se reemplazarán
+
+        self.entry.bind("<KeyRelease>", self._al_escribir, add="+")
+        self.entry.bind("<Down>", lambda e: self._mover(1))
+        self.entry.bind("<Up>", lambda e: self._mover(-1))
+        self.entry.bind("<Tab>", lambda e: "break" if self.aceptar() else None)
+        self.entry.bind("<Escape>", lambda e: self.ocultar())
+        self.entry.bind("<FocusOut>", lambda e: self.entry.after(150, self.ocultar), add="+")
+
+    def visible(self):
+        return self.popup is not None and self.popup.winfo_viewable()
+
+    def _al_escribir(self, event):
+        if event.keysym in ("Up", "Down", "Tab", "Return", "Escape"):
+            return
+        texto = self.entry.get()
+        antes = texto[: self._cursor_en_texto(texto)]
+
+        # ":codigo:" completo -> se sustituye directamente
+        m = PATRON_COMPLETO.search(antes)
+        if m and get_emoji(m.group(1)):
+            self._reemplazar(len(m.group(0)), get_emoji(m.group(1)))
+            return
+
+        m = PATRON_PARCIAL.search(antes)
+        self.sugerencias = buscar_codigos(m.group(1)) if m else []
+        if not self.sugerencias:
+            self.ocultar()
+            return
+        self.largo = len(m.group(0))
+        self._mostrar()
+
+    def _cursor_en_texto(self, texto):
+        """Posición del cursor como índice de `texto` (Tk 8.6 cuenta los emojis
+        fuera del BMP como dos caracteres)."""
+        cursor = self.entry.index(tk.INSERT)
+        if self.entry.index(tk.END) == len(texto):
+            return cursor
+        unidades = 0
+        for i, c in enumerate(texto):
+            if unidades >= cursor:
+                return i
+            unidades += 2 if ord(c) > 0xFFFF else 1
+        return len(texto)
+
+    def _crear_popup(self):
+        self.popup = tk.Toplevel(self.cliente.master)
+        self.popup.overrideredirect(True)
+        self.popup.withdraw()
+        self.lista = tk.Listbox(self.popup, height=MAX_SUGERENCIAS, width=40, activestyle="none")
+        self.lista.pack()
+        self.lista.bind("<ButtonRelease-1>", lambda e: self.aceptar())
+
+    def _mostrar(self):
+        if self.popup is None:
+            self._crear_popup()
+        self.lista.delete(0, tk.END)
+        for codigo, emoji in self.sugerencias:
+            self.lista.insert(tk.END, f"{emoji}  :{codigo}:")
+        self.lista.config(height=len(self.sugerencias))
+        self.lista.selection_set(0)
+        x = self.entry.winfo_rootx()
+        y = self.entry.winfo_rooty() + self.entry.winfo_height()
+        self.popup.geometry(f"+{x}+{y}")
+        self.popup.deiconify()
+        self.popup.lift()
+
+    def _mover(self, paso):
+        if not self.visible():
+            return None
+        actual = self.lista.curselection()
+        nuevo = max(0, min((actual[0] if actual else 0) + paso, len(self.sugerencias) - 1))
+        self.lista.selection_clear(0, tk.END)
+        self.lista.selection_set(nuevo)
+        self.lista.see(nuevo)
+        return "break"
+
+    def aceptar(self):
+        """Inserta la sugerencia elegida. Devuelve True si había popup abierto."""
+        if not self.visible():
+            return False
+        seleccion = self.lista.curselection()
+        _, emoji = self.sugerencias[seleccion[0] if seleccion else 0]
+        self._reemplazar(self.largo, emoji)
+        return True
+
+    def _reemplazar(self, largo, emoji):
+        """Sustituye los `largo` caracteres (ASCII) antes del cursor por el emoji."""
+        cursor = self.entry.index(tk.INSERT)
+        self.entry.delete(cursor - largo, cursor)
+        self.entry.insert(cursor - largo, emoji)  # el cursor queda tras el emoji
+        self.ocultar()
+
+    def ocultar(self):
+        if self.popup is not None:
+            self.popup.withdraw()
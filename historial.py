@@ -0,0 +1,157 @@
+import queue
+import sqlite3
+import threading
+import time
+
+# Historial local de mensajes (SQLite en modo WAL con índice FTS5)
+RUTA_DB = "historial_chat.db"
+LOTE_MAX = 500  # filas por transacción como máximo
+ESPERA_LOTE = 0.05  # segundos que se espera a juntar más filas antes de escribir
+MAX_RESULTADOS = 200
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS mensajes (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    cuenta TEXT,
+    tipo TEXT NOT NULL,
+    remitente TEXT,
+    texto TEXT NOT NULL,
+    ruta TEXT,
+    hora TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS mensajes_fts USING fts5(
+    texto, remitente,
+    content='mensajes', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS mensajes_ai AFTER INSERT ON mensajes BEGIN
+    INSERT INTO mensajes_fts(rowid, texto, remitente) VALUES (new.id, new.texto, new.remitente);
+END;
+CREATE TRIGGER IF NOT EXISTS mensajes_ad AFTER DELETE ON mensajes BEGIN
+    INSERT INTO mensajes_fts(mensajes_fts, rowid, texto, remitente)
+    VALUES ('delete', old.id, old.texto, old.remitente);
+END;
+"""
+
+
+def _conectar(ruta):
+    con = sqlite3.connect(ruta, check_same_thread=False, timeout=5)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")  # en WAL sigue siendo consistente
+    return con
+
+
+def item_a_fila(item, cuenta=None, remitente=None, ts=None):
+    """Convierte un elemento de cola_mensajes (línea o tupla) en una fila."""
+    ts = time.time() if ts is None else ts
+    if isinstance(item, str):
+        return (ts, cuenta, "linea", remitente, item, None, None)
+    tipo, ruta, remitente, filename = item[:4]
+    hora = item[4] if len(item) > 4 else None
+    return (ts, cuenta, tipo, remitente, filename, ruta, hora)
+
+
+def fila_a_item(tipo, remitente, texto, ruta, hora):
+    """Inversa de item_a_fila: lo que procesar_colas sabe dibujar."""
+    if tipo == "linea":
+        return texto
+    if tipo == "file":
+        return ("file", ruta, remitente, texto, hora or "??:??")
+    return (tipo, ruta, remitente, texto)
+
+
+def consulta_fts(texto):
+    """Texto libre -> consulta FTS5: todas las palabras, la última como prefijo."""
+    palabras = ['"' + p.replace('"', '""') + '"' for p in texto.split()]
+    if not palabras:
+        return None
+    palabras[-1] += "*"
+    return " ".join(palabras)
+
+
+class Historial:
+    """Guarda los mensajes del chat en SQLite desde un hilo escritor.
+
+    guardar() solo encola (no bloquea al hilo de Tk); el hilo escritor agrupa lo
+    pendiente en una transacción por lote. Las lecturas (ultimos, buscar) usan
+    otra conexión, que en WAL no espera a las escrituras.
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or RUTA_DB
+        self.cuenta = None  # usuario con el que se guardan los mensajes nuevos
+        self._cola = queue.Queue()
+        self._lectura = _conectar(self.ruta)
+        self._lectura.executescript(ESQUEMA)
+        self._lectura_lock = threading.Lock()
+        self._hilo = threading.Thread(target=self._hilo_escritor, name="historial", daemon=True)
+        self._hilo.start()
+
+    def guardar(self, item, remitente=None):
+        self._cola.put(item_a_fila(item, self.cuenta, remitente))
+
+    def _hilo_escritor(self):
+        con = _conectar(self.ruta)
+        fin = False
+        while not fin:
+            fila = self._cola.get()
+            if fila is None:
+                break
+            lote = [fila]
+            # Juntar lo que llegue enseguida para escribirlo en una sola transacción
+            limite = time.monotonic() + ESPERA_LOTE
+            while len(lote) < LOTE_MAX:
+                try:
+                    fila = self._cola.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    break
+                if fila is None:
+                    fin = True
+                    break
+                lote.append(fila)
+            try:
+                with con:
+                    con.executemany(
+                        "INSERT INTO mensajes (ts, cuenta, tipo, remitente, texto, ruta, hora) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        lote,
+                    )
+            except sqlite3.Error as e:
+                print(f"[HISTORIAL] No se pudieron guardar {len(lote)} mensajes: {e}")
+        con.close()
+
+    def ultimos(self, n):
+        """Los últimos n elementos guardados, en orden, listos para dibujar."""
+        with self._lectura_lock:
+            filas = self._lectura.execute(
+                "SELECT tipo, remitente, texto, ruta, hora FROM mensajes ORDER BY id DESC LIMIT ?",
+                (n,),
+            ).fetchall()
+        return [fila_a_item(*f) for f in reversed(filas)]
+
+    def buscar(self, texto, limite=MAX_RESULTADOS):
+        """Busca en todo el historial. Devuelve [(ts, remitente, fragmento)] por relevancia."""
+        consulta = consulta_fts(texto)
+        if not consulta:
+            return []
+        with self._lectura_lock:
+            try:
+                return self._lectura.execute(
+                    "SELECT m.ts, m.remitente, "
+                    "snippet(mensajes_fts, 0, '«', '»', '…', 12) "
+                    "FROM mensajes_fts JOIN mensajes m ON m.id = mensajes_fts.rowid "
+                    "WHERE mensajes_fts MATCH ? "
+                    "ORDER BY bm25(mensajes_fts), m.id DESC LIMIT ?",
+                    (consulta, limite),
+                ).fetchall()
+            except sqlite3.Error as e:
+                print(f"[HISTORIAL] Búsqueda fallida: {e}")
+                return []
+
+    def cerrar(self):
+        """Escribe lo pendiente y cierra la base de datos."""
+        self._cola.put(None)
+        self._hilo.join(timeout=5)
+        with self._lectura_lock:
+            self._lectura.close()
@@ -0,0 +1,278 @@
+import hashlib
+import os
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# PIL (y medios, que trae numpy) se importan al usarse y casi siempre fuera
+# del hilo de Tk: la ventana se abre sin esperar a cargarlos
+
+# Parámetros de las miniaturas del chat
+MAX_WIDTH = 300
+CARPETA_MINIATURAS = "miniaturas_cache"
+MAX_FOTOS_MEMORIA = 64  # PhotoImage vivos como máximo (LRU)
+WORKERS = 2
+
+# Fotos que se reducen antes de enviarlas (opción del cliente)
+UMBRAL_REDUCIR = 1024 * 1024  # bytes; las más pequeñas se envían tal cual
+MAX_LADO_ENVIO = 1600
+CALIDAD_ENVIO = 85
+CALIDAD_PREVIA = 60
+EXTENSIONES_REDUCIBLES = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+CARPETA_ENVIOS = os.path.join(CARPETA_MINIATURAS, "envios")
+
+
+def hash_archivo(ruta, bloque=1 << 20):
+    """Hash del contenido del archivo (clave de la caché de miniaturas)."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(ruta, "rb") as f:
+        for parte in iter(lambda: f.read(bloque), b""):
+            h.update(parte)
+    return h.hexdigest()
+
+
+def generar_miniatura(ruta, carpeta=CARPETA_MINIATURAS, max_width=MAX_WIDTH, clave=None):
+    """Devuelve (clave, imagen PIL reducida). Pensada para ejecutarse en el pool.
+
+    Si la miniatura ya está en la caché de disco (generada aquí o llegada del
+    servidor, ver medios.guardar_miniatura) se carga desde ahí; si no, se
+    genera con Image.thumbnail (que usa draft() para decodificar los JPEG ya
+    reducidos) y se guarda como PNG. Con `clave` conocida no se lee el archivo.
+    """
+    from PIL import Image
+
+    clave = clave or hash_archivo(ruta)
+    ruta_cache = os.path.join(carpeta, f"{clave}_{max_width}.png")
+
+    for cacheada in (ruta_cache, os.path.join(carpeta, f"{clave}_{max_width}.jpg")):
+        if os.path.exists(cacheada):
+            img = Image.open(cacheada)
+            img.load()
+            return clave, img
+
+    img = Image.open(ruta)
+    if img.width > max_width:
+        alto = max(1, round(img.height * max_width / img.width))
+        img.thumbnail((max_width, alto))
+    else:
+        img.load()
+    if img.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+        img = img.convert("RGB")
+
+    os.makedirs(carpeta, exist_ok=True)
+    temporal = f"{ruta_cache}.{os.getpid()}.tmp"
+    img.save(temporal, format="PNG")
+    os.replace(temporal, ruta_cache)
+    return clave, img
+
+
+def _guardar(img, ruta, formato, calidad):
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    if formato == "JPEG":
+        img.save(temporal, format="JPEG", quality=calidad, optimize=True, progressive=True)
+    else:
+        img.save(temporal, format=formato, optimize=True)
+    os.replace(temporal, ruta)
+
+
+def preparar_envio(ruta, carpeta=CARPETA_ENVIOS, umbral=UMBRAL_REDUCIR):
+    """Reduce una foto antes de enviarla. Pensada para ejecutarse en el pool.
+
+    Devuelve (vista previa de MAX_WIDTH px, imagen de MAX_LADO_ENVIO px como
+    mucho), ambas en `carpeta`, o None si la foto no pasa del umbral o si
+    reducirla no la hace más pequeña.
+    """
+    tam = os.path.getsize(ruta)
+    if os.path.splitext(ruta)[1].lower() not in EXTENSIONES_REDUCIBLES or tam <= umbral:
+        return None
+
+    from PIL import Image, ImageOps
+
+    clave = hash_archivo(ruta)
+    img = Image.open(ruta)
+    transparente = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+    if img.mode == "RGBA" and img.getchannel("A").getextrema() == (255, 255):
+        transparente = False  # p. ej. capturas de pantalla: el alfa no se usa
+    formato, ext = ("PNG", ".png") if transparente else ("JPEG", ".jpg")
+    ruta_reducida = os.path.join(carpeta, f"{clave}_{MAX_LADO_ENVIO}{ext}")
+    ruta_previa = os.path.join(carpeta, f"{clave}_previa{ext}")
+
+    if not (os.path.exists(ruta_reducida) and os.path.exists(ruta_previa)):
+        img.draft("RGB", (MAX_LADO_ENVIO, MAX_LADO_ENVIO))  # JPEG: decodificar ya reducida
+        img = ImageOps.exif_transpose(img)  # fotos de móvil giradas con EXIF
+        img = img.convert("RGBA" if transparente else "RGB")
+        img.thumbnail((MAX_LADO_ENVIO, MAX_LADO_ENVIO))
+        os.makedirs(carpeta, exist_ok=True)
+        _guardar(img, ruta_reducida, formato, CALIDAD_ENVIO)
+        img.thumbnail((MAX_WIDTH, MAX_WIDTH))
+        _guardar(img, ruta_previa, formato, CALIDAD_PREVIA)
+
+    if os.path.getsize(ruta_reducida) >= tam:
+        return None
+    return ruta_previa, ruta_reducida
+
+
+class ImageManager:
+    def __init__(self, master):
+        """Gestiona las imágenes embebidas en el chat.
+
+        master: referencia al cliente GUI (usa master.text_chat y master.master)
+
+        Las imágenes se insertan como un Label de marcador y solo se decodifican
+        (en un pool de hilos) cuando entran en la zona visible de text_chat.
+        """
+        self.master = master
+        self.pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="miniaturas")
+
+        self.fotos = OrderedDict()  # clave -> PhotoImage, en orden LRU
+        self.entradas = []  # imágenes insertadas en el chat
+        self.por_clave = {}  # clave -> [entradas] que muestran esa imagen
+        self.reemplazos = {}  # ruta de una vista previa -> ruta de la imagen que la sustituye
+        self.medios = {}  # ruta -> {"clave" de la miniatura en caché, "ancho", "alto"} del servidor
+        self._revision_pendiente = False
+
+        # Revisar qué imágenes se ven cada vez que cambia la vista del chat
+        texto = master.text_chat
+        barra_set = texto.vbar.set
+
+        def on_scroll(primero, ultimo):
+            barra_set(primero, ultimo)
+            self.programar_revision()
+
+        texto.configure(yscrollcommand=on_scroll)
+        texto.bind("<Configure>", lambda e: self.programar_revision(), add="+")
+
+    def crear_label(self, ruta):
+        """Crea el Label (aún sin imagen) que se embebe en el chat."""
+        ruta = self.reemplazos.get(ruta, ruta)
+        texto = f"🖼 {os.path.basename(ruta)}"
+        medios = self.medios.get(ruta)
+        if medios and medios["ancho"]:
+            texto += f" ({medios['ancho']}×{medios['alto']})"
+        lbl = tk.Label(
+            self.master.text_chat,
+            text=texto,
+            cursor="hand2",
+            width=40,
+            height=3,
+            relief="groove",
+        )
+        lbl.bind("<Button-1>", lambda e, r=ruta: self.master._abrir_imagen(r))
+        self.entradas.append({"ruta": ruta, "label": lbl, "clave": None, "estado": "pendiente"})
+        self.programar_revision()
+        return lbl
+
+    def registrar_medios(self, ruta, medios):
+        """Guarda la miniatura que trajo el header para no decodificar `ruta`.
+        Se puede llamar desde cualquier hilo (solo escribe en disco)."""
+        from medios import guardar_miniatura
+
+        clave = guardar_miniatura(medios, CARPETA_MINIATURAS) if medios.get("miniatura") else None
+        self.medios[ruta] = {"clave": clave, "ancho": medios.get("ancho"), "alto": medios.get("alto")}
+
+    def actualizar_ruta(self, vieja, nueva):
+        """Las imágenes de `vieja` pasan a abrirse desde `nueva` (p. ej. llegó la
+        foto buena tras su vista previa). La miniatura ya mostrada se conserva."""
+        self.reemplazos[vieja] = nueva
+        for entrada in self.entradas:
+            if entrada["ruta"] == vieja:
+                entrada["ruta"] = nueva
+                entrada["label"].bind("<Button-1>", lambda e, r=nueva: self.master._abrir_imagen(r))
+
+    def programar_revision(self):
+        if self._revision_pendiente:
+            return
+        self._revision_pendiente = True
+        self.master.master.after_idle(self.revisar_visibles)
+
+    def _rango_visible(self):
+        """Líneas visibles de text_chat, con una pantalla de margen arriba y abajo."""
+        texto = self.master.text_chat
+        primera = int(texto.index("@0,0").split(".")[0])
+        ultima = int(texto.index(f"@0,{texto.winfo_height()}").split(".")[0])
+        margen = max(1, ultima - primera)
+        return primera - margen, ultima + margen
+
+    def revisar_visibles(self):
+        """Pide la miniatura de cada marcador que esté (casi) a la vista."""
+        self._revision_pendiente = False
+        texto = self.master.text_chat
+        try:
+            primera, ultima = self._rango_visible()
+        except tk.TclError:
+            return
+
+        for entrada in self.entradas:
+            if entrada["estado"] != "pendiente":
+                continue
+            try:
+                linea = int(texto.index(str(entrada["label"])).split(".")[0])
+            except tk.TclError:
+                continue  # todavía no está embebido
+            if not primera <= linea <= ultima:
+                continue
+
+            clave = entrada["clave"]
+            if clave in self.fotos:
+                self.fotos.move_to_end(clave)
+                self._mostrar(entrada, clave)
+                continue
+
+            entrada["estado"] = "cargando"
+            clave = self.medios.get(entrada["ruta"], {}).get("clave")
+            futuro = self.pool.submit(generar_miniatura, entrada["ruta"], clave=clave)
+            futuro.add_done_callback(lambda f, e=entrada: self._al_terminar(e, f))
+
+    def _al_terminar(self, entrada, futuro):
+        # Se ejecuta en un hilo del pool: pasar el resultado al hilo de Tk
+        try:
+            self.master.master.after(0, self._aplicar, entrada, futuro)
+        except (RuntimeError, tk.TclError):
+            pass
+
+    def _aplicar(self, entrada, futuro):
+        if entrada["estado"] != "cargando":
+            return  # el chat se limpió mientras se decodificaba
+        try:
+            clave, img = futuro.result()
+        except Exception as e:
+            entrada["estado"] = "error"
+            entrada["label"].config(text=f"[imagen no disponible] {os.path.basename(entrada['ruta'])}")
+            self.master._log_local(f"[ERROR] No se pudo mostrar la imagen: {e}\n")
+            return
+
+        if clave not in self.fotos:
+            from PIL import ImageTk
+
+            self.fotos[clave] = ImageTk.PhotoImage(img)
+            self._recortar_lru()
+        self.fotos.move_to_end(clave)
+        if entrada["clave"] is None:
+            entrada["clave"] = clave
+            self.por_clave.setdefault(clave, []).append(entrada)
+        self._mostrar(entrada, clave)
+
+    def _mostrar(self, entrada, clave):
+        entrada["label"].config(image=self.fotos[clave], width=0, height=0, relief="flat")
+        entrada["estado"] = "visible"
+
+    def _recortar_lru(self):
+        """Libera los PhotoImage menos usados; sus Labels vuelven a ser marcadores."""
+        while len(self.fotos) > MAX_FOTOS_MEMORIA:
+            clave, _ = self.fotos.popitem(last=False)
+            for entrada in self.por_clave.get(clave, []):
+                if entrada["estado"] == "visible":
+                    entrada["label"].config(image="", width=40, height=3, relief="groove")
+                    entrada["estado"] = "pendiente"
+        self.programar_revision()
+
+    def limpiar(self):
+        """Olvida todas las imágenes (el chat se vació)."""
+        for entrada in self.entradas:
+            entrada["estado"] = "descartada"
+        self.entradas.clear()
+        self.por_clave.clear()
+        self.fotos.clear()
+
+    def cerrar(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
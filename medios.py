@@ -0,0 +1,215 @@
+"""Vistas previas de imágenes y notas de voz calculadas en el servidor.
+
+El servidor pasa cada imagen o nota de voz que reenvía por un pool de procesos
+acotado (Procesador) y añade al header un resumen "medios":
+
+- imágenes: {"clave", "ancho", "alto", "miniatura", "formato"}; la miniatura
+  (base64) es la misma que generaría image_manager.generar_miniatura y
+  "clave" es el hash del contenido con el que el cliente la guarda en caché;
+- notas de voz: {"duracion", "onda"}; la onda (base64) es el resumen de
+  waveform.resumen_onda cuantizado a un byte por valor.
+
+Así cada cliente dibuja la vista previa sin decodificar el original, y la sala
+entera no repite N veces el mismo trabajo. Si el pool está ocupado o tarda
+demasiado el frame sale sin "medios" y el cliente la calcula como antes.
+"""
+import base64
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import threading
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+import numpy as np
+from PIL import Image
+
+import voice_codec
+import waveform
+
+EXTENSIONES_IMAGEN = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp")
+MAX_WIDTH = 300  # igual que image_manager.MAX_WIDTH
+CALIDAD_MINIATURA = 75
+MAX_MINIATURA = 64 * 1024  # bytes; una miniatura mayor no se adjunta
+MAX_TAM = 32 * 1024 * 1024  # payloads mayores se reenvían sin analizar
+FORMATOS_MINIATURA = ("png", "jpg")
+CLAVE_VALIDA = re.compile(r"[0-9a-f]{32}")  # blake2b de 16 bytes en hexadecimal
+
+WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+MAX_PENDIENTES = 2 * WORKERS  # análisis en curso o en espera; el resto se salta
+ESPERA = 1.0  # segundos que el reenvío espera al análisis como mucho
+
+
+# ==== Análisis (en los procesos del pool) ====
+
+def clave_contenido(datos) -> str:
+    """Mismo hash que image_manager.hash_archivo, sobre bytes en memoria."""
+    return hashlib.blake2b(datos, digest_size=16).hexdigest()
+
+
+def analizar_imagen(datos):
+    img = Image.open(io.BytesIO(datos))
+    ancho, alto = img.size
+    if img.width > MAX_WIDTH:
+        img.thumbnail((MAX_WIDTH, max(1, round(img.height * MAX_WIDTH / img.width))))
+    else:
+        img.load()
+    transparente = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+    salida = io.BytesIO()
+    if transparente:
+        img.convert("RGBA").save(salida, format="PNG", optimize=True)
+        formato = "png"
+    else:
+        img.convert("RGB").save(salida, format="JPEG", quality=CALIDAD_MINIATURA)
+        formato = "jpg"
+    medios = {"clave": clave_contenido(datos), "ancho": ancho, "alto": alto}
+    if salida.tell() <= MAX_MINIATURA:
+        medios["miniatura"] = base64.b64encode(salida.getvalue()).decode("ascii")
+        medios["formato"] = formato
+    return medios
+
+
+def analizar_audio(datos, codec=None):
+    if codec:
+        pcm, rate = voice_codec.decodificar(datos, codec)
+    else:
+        with wave.open(io.BytesIO(datos), "rb") as wf:
+            if wf.getsampwidth() != 2:
+                raise ValueError("Solo se soportan WAV de 16 bits")
+            canales, rate = wf.getnchannels(), wf.getframerate()
+            pcm = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+        if canales > 1:
+            pcm = pcm[::canales]
+    resumen = waveform.resumen_onda(pcm)
+    onda = np.round(np.clip(resumen, 0, 1) * 255).astype(np.uint8)
+    return {
+        "duracion": round(len(pcm) / rate, 2),
+        "onda": base64.b64encode(onda.tobytes()).decode("ascii"),
+    }
+
+
+def analizar(mtype, filename, datos, codec=None):
+    """Resumen "medios" de un archivo o nota de voz, o None si no aplica."""
+    if mtype == "audio":
+        return analizar_audio(datos, codec)
+    if os.path.splitext(filename)[1].lower() in EXTENSIONES_IMAGEN:
+        return analizar_imagen(datos)
+    return None
+
+
+def necesita_analisis(header: dict) -> bool:
+    mtype = header.get("type")
+    if not 0 < header.get("filesize", 0) <= MAX_TAM or "medios" in header:
+        return False
+    if mtype == "audio":
+        return True
+    if mtype != "file":
+        return False
+    if header.get("original") and not header.get("vista_previa"):
+        return False  # foto reducida: sustituye a su vista previa sin dibujarse
+    return os.path.splitext(header.get("filename", ""))[1].lower() in EXTENSIONES_IMAGEN
+
+
+# ==== Pool del servidor ====
+
+def _vigilar_servidor(pid_servidor):
+    """Inicializador de los procesos del pool: si el servidor muere sin cerrar
+    el pool (SIGTERM, kill -9) el proceso termina también."""
+
+    def vigilar():
+        while os.getppid() == pid_servidor:
+            time.sleep(1)
+        os._exit(0)
+
+    threading.Thread(target=vigilar, daemon=True).start()
+
+
+class Procesador:
+    """Pool de procesos acotado para analizar lo que reenvía el servidor.
+
+    Como mucho MAX_PENDIENTES análisis a la vez: si no hay hueco, o el
+    resultado tarda más de ESPERA, el frame se reenvía sin "medios". Solo
+    espera el hilo del remitente (así su orden se mantiene); el reenvío del
+    resto de usuarios no se detiene nunca.
+    """
+
+    def __init__(self, workers=WORKERS, max_pendientes=MAX_PENDIENTES, espera=ESPERA):
+        # spawn: el servidor tiene muchos hilos y fork con hilos no es seguro
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_vigilar_servidor,
+            initargs=(os.getpid(),),
+        )
+        self.huecos = threading.BoundedSemaphore(max_pendientes)
+        self.espera = espera
+        self.saltados = 0  # frames reenviados sin analizar por falta de hueco o tiempo
+        # Arrancar ya los procesos (e importar numpy y PIL en ellos): si no, el
+        # primer análisis no llegaría a tiempo
+        for _ in range(workers):
+            self.pool.submit(clave_contenido, b"")
+
+    def analizar(self, header: dict, payload):
+        """Devuelve el resumen "medios" para `header` o None."""
+        if not necesita_analisis(header):
+            return None
+        if not self.huecos.acquire(blocking=False):
+            self.saltados += 1
+            return None
+        try:
+            futuro = self.pool.submit(
+                analizar, header.get("type"), header.get("filename", ""), bytes(payload), header.get("codec")
+            )
+        except RuntimeError:
+            self.huecos.release()  # pool cerrado
+            return None
+        futuro.add_done_callback(lambda f: self.huecos.release())
+        try:
+            return futuro.result(timeout=self.espera)
+        except TimeoutError:
+            self.saltados += 1
+            return None
+        except Exception as e:
+            print(f"[MEDIOS] No se pudo analizar {header.get('filename')}: {e}")
+            return None
+
+    def cerrar(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ==== Uso en el cliente ====
+
+def guardar_miniatura(medios, carpeta):
+    """Escribe la miniatura recibida en la caché de image_manager. Devuelve su clave.
+
+    Lanza ValueError si la clave o el formato no son los que genera
+    analizar_imagen: forman el nombre del archivo y llegan por la red.
+    """
+    clave, formato = medios.get("clave"), medios.get("formato")
+    if not (isinstance(clave, str) and CLAVE_VALIDA.fullmatch(clave)) or formato not in FORMATOS_MINIATURA:
+        raise ValueError("Miniatura con clave o formato no válidos")
+    carpeta = os.path.realpath(carpeta)
+    ruta = os.path.realpath(os.path.join(carpeta, f"{clave}_{MAX_WIDTH}.{formato}"))
+    if os.path.dirname(ruta) != carpeta:
+        raise ValueError("Miniatura fuera de la carpeta de la caché")
+    if not os.path.exists(ruta):
+        os.makedirs(carpeta, exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(base64.b64decode(medios["miniatura"]))
+        os.replace(temporal, ruta)
+    return clave
+
+
+def resumen_onda(medios):
+    """Inversa de la cuantización de analizar_audio: array (2, bins) en 0..1."""
+    onda = np.frombuffer(base64.b64decode(medios["onda"]), dtype=np.uint8)
+    return (onda.reshape(2, -1) / 255.0).astype(np.float32)
+
+
+def guardar_onda(medios, ruta_wav):
+    """Deja el resumen recibido donde waveform.generar_preview lo busca."""
+    np.save(waveform.ruta_resumen(ruta_wav), resumen_onda(medios))
@@ -0,0 +1,93 @@
+import bisect
+import threading
+
+# Límites superiores (ms) de los cubos del histograma; el último cubo no tiene tope
+LIMITES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+ANCHO_BARRA = 30
+
+
+class Histograma:
+    """Histograma de latencias con cubos logarítmicos fijos (memoria constante)."""
+
+    def __init__(self):
+        self.cubos = [0] * (len(LIMITES_MS) + 1)
+        self.n = 0
+        self.suma = 0.0
+        self.minimo = None
+        self.maximo = None
+
+    def registrar(self, ms):
+        ms = max(0.0, ms)  # relojes desfasados pueden dar valores negativos
+        self.cubos[bisect.bisect_left(LIMITES_MS, ms)] += 1
+        self.n += 1
+        self.suma += ms
+        self.minimo = ms if self.minimo is None else min(self.minimo, ms)
+        self.maximo = ms if self.maximo is None else max(self.maximo, ms)
+
+    def percentil(self, p):
+        """Cota superior (ms) del cubo donde cae el percentil p (0-100)."""
+        if not self.n:
+            return None
+        objetivo = self.n * p / 100
+        acumulado = 0
+        for i, cuenta in enumerate(self.cubos):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return LIMITES_MS[i] if i < len(LIMITES_MS) else self.maximo
+        return self.maximo
+
+    def resumen(self):
+        if not self.n:
+            return "sin datos"
+        return (
+            f"n={self.n} media={self.suma / self.n:.1f} ms "
+            f"p50≤{self.percentil(50):.0f} p95≤{self.percentil(95):.0f} "
+            f"max={self.maximo:.1f} ms"
+        )
+
+    def texto(self):
+        """Dibuja el histograma con barras de texto."""
+        lineas = [self.resumen()]
+        mayor = max(self.cubos) or 1
+        for i, cuenta in enumerate(self.cubos):
+            if not cuenta:
+                continue
+            desde = LIMITES_MS[i - 1] if i else 0
+            rango = f"{desde}-{LIMITES_MS[i]}" if i < len(LIMITES_MS) else f">{desde}"
+            barra = "█" * max(1, round(cuenta * ANCHO_BARRA / mayor))
+            lineas.append(f"  {rango:>10} ms | {barra} {cuenta}")
+        return "\n".join(lineas)
+
+
+class Metricas:
+    """Histogramas por nombre y contadores, seguros entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histogramas = {}
+        self.contadores = {}
+
+    def registrar(self, nombre, ms):
+        with self._lock:
+            self.histogramas.setdefault(nombre, Histograma()).registrar(ms)
+
+    def contar(self, nombre, cantidad=1):
+        with self._lock:
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + cantidad
+
+    def reiniciar(self):
+        with self._lock:
+            self.histogramas.clear()
+            self.contadores.clear()
+
+    def texto(self):
+        with self._lock:
+            partes = [f"{nombre}:\n{h.texto()}" for nombre, h in sorted(self.histogramas.items())]
+            if self.contadores:
+                partes.append("  ".join(f"{k}={v}" for k, v in sorted(self.contadores.items())))
+        return "\n\n".join(partes) if partes else "Todavía no hay mediciones."
+
+    def resumen(self):
+        """Una línea por histograma (para el log del servidor)."""
+        with self._lock:
+            return [f"{nombre}: {h.resumen()}" for nombre, h in sorted(self.histogramas.items())]
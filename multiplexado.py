@@ -0,0 +1,170 @@
+"""Multiplexado de frames: los payloads grandes viajan en trozos intercalables.
+
+Un frame con payload de más de TAM_PARTE bytes se envía como:
+
+- el header original con "stream": <id> y "filesize", sin payload detrás;
+- frames {"type": "parte", "stream": <id>, "filesize": n} + n bytes, hasta
+  completar "filesize".
+
+Entre dos partes puede ir cualquier otro frame (textos, acks, listas de
+usuarios, partes de otros flujos), así que un archivo grande ya no retrasa el
+chat. Los ids de flujo son propios de cada conexión y de cada sentido.
+"""
+import hashlib
+import json
+import struct
+from collections import deque
+
+# Frames que llevan payload binario de "filesize" bytes tras el header
+TIPOS_CON_PAYLOAD = ("file", "audio", "audio_chunk", "parte")
+TAM_PARTE = 64 * 1024  # bytes de payload por parte
+
+
+def codificar_frame(header: dict) -> bytes:
+    """Longitud (4 bytes) + header JSON, listos para una sola escritura."""
+    header_bytes = json.dumps(header).encode("utf-8")
+    return struct.pack("!I", len(header_bytes)) + header_bytes
+
+
+def lleva_payload(header: dict) -> bool:
+    """True si tras este header vienen "filesize" bytes de payload."""
+    mtype = header.get("type")
+    if mtype not in TIPOS_CON_PAYLOAD or header.get("filesize", 0) <= 0:
+        return False
+    # La cabecera de un flujo no trae payload: llega después en partes (o, con
+    # "transfer", por conexiones de datos auxiliares)
+    return mtype == "parte" or ("stream" not in header and "transfer" not in header)
+
+
+def partir(payload):
+    """Trozos de TAM_PARTE bytes (vistas, sin copiar el payload)."""
+    vista = memoryview(payload)
+    return (vista[i : i + TAM_PARTE] for i in range(0, len(vista), TAM_PARTE))
+
+
+def codificar_parte(stream: int, bloque) -> bytes:
+    return codificar_frame({"type": "parte", "stream": stream, "filesize": len(bloque)}) + bloque
+
+
+class Planificador:
+    """Decide qué se escribe a continuación en una conexión (sin hilos ni locks).
+
+    Los frames cortos (texto, control, audio en vivo) salen en orden y siempre
+    antes que los datos de los flujos; los flujos se turnan de parte en parte.
+    Cada frame puede llevar una referencia `ref` que siguiente() devuelve con
+    lo enviado hasta el momento, para avisar del progreso y del final.
+    """
+
+    def __init__(self):
+        self.control = deque()  # (bytes codificados, ref, tamaño del payload)
+        self.flujos = deque()  # [stream, iterador de trozos, ref, enviado, total]
+        self._ultimo_stream = 0
+
+    def __len__(self):
+        return len(self.control) + len(self.flujos)
+
+    def agregar(self, header: dict, payload=b"", ref=None):
+        """payload: bytes o un iterador de trozos que suman header["filesize"]."""
+        if isinstance(payload, (bytes, bytearray, memoryview)):
+            total = len(payload)
+            trozos = partir(payload) if total > TAM_PARTE else None
+        else:
+            total = header.get("filesize", 0)
+            trozos = payload
+            if total <= TAM_PARTE:
+                payload, trozos = b"".join(trozos), None
+        if trozos is None:
+            self.control.append((codificar_frame(header) + payload, ref, total))
+            return
+        self._ultimo_stream += 1
+        stream = self._ultimo_stream
+        self.control.append((codificar_frame(dict(header, stream=stream, filesize=total)), None, 0))
+        self.flujos.append([stream, trozos, ref, 0, total])
+
+    def siguiente(self, limite=TAM_PARTE):
+        """(bytes a escribir ahora, [(ref, enviado, total)]) o (None, []) si no
+        queda nada. Junta frames cortos seguidos hasta `limite` bytes."""
+        if self.control:
+            datos, hechos, tam = [], [], 0
+            while self.control and (not datos or tam + len(self.control[0][0]) <= limite):
+                frame, ref, total = self.control.popleft()
+                datos.append(frame)
+                tam += len(frame)
+                if ref is not None:
+                    hechos.append((ref, total, total))
+            return b"".join(datos), hechos
+        while self.flujos:
+            flujo = self.flujos.popleft()
+            stream, trozos, ref = flujo[:3]
+            try:
+                bloque = next(trozos, None)
+            except Exception:
+                self.flujos.appendleft(flujo)  # que vaciar() lo siga encontrando
+                raise
+            if bloque is None:
+                continue  # flujo terminado
+            flujo[3] += len(bloque)
+            if flujo[3] < flujo[4]:
+                self.flujos.append(flujo)
+            hechos = [(ref, flujo[3], flujo[4])] if ref is not None else []
+            return codificar_parte(stream, bloque), hechos
+        return None, []
+
+    def vaciar(self):
+        """Descarta lo pendiente y devuelve las refs que no llegaron a enviarse."""
+        refs = [ref for _, ref, _ in self.control if ref is not None]
+        refs += [flujo[2] for flujo in self.flujos if flujo[2] is not None]
+        self.control.clear()
+        self.flujos.clear()
+        return refs
+
+
+def hash_contenido():
+    """Mismo hash que image_manager.hash_archivo y medios.clave_contenido."""
+    return hashlib.blake2b(digest_size=16)
+
+
+class Ensamblador:
+    """Reconstruye los frames que llegan partidos en flujos.
+
+    Con hashear=True los frames de archivo y audio salen con "contenido", el
+    hash del payload, calculado parte a parte según llegan (nunca el que
+    traiga el header del remitente).
+    """
+
+    def __init__(self, hashear=False):
+        self.hashear = hashear
+        self.flujos = {}  # stream -> (header, bytearray, hash o None)
+
+    def _con_hash(self, header):
+        return self.hashear and header.get("type") in ("file", "audio")
+
+    def recibir(self, header: dict, payload=b""):
+        """Devuelve (header, payload) cuando hay un frame completo, si no None."""
+        stream = header.get("stream")
+        if stream is None:
+            if self._con_hash(header):
+                h = hash_contenido()
+                h.update(payload)
+                header = dict(header, contenido=h.hexdigest())
+            return header, payload
+        if header.get("type") != "parte":
+            header = dict(header)
+            del header["stream"]
+            header.pop("contenido", None)
+            self.flujos[stream] = (header, bytearray(), hash_contenido() if self._con_hash(header) else None)
+            return None
+
+        abierto = self.flujos.get(stream)
+        if abierto is None:
+            raise ValueError(f"Parte de un flujo desconocido: {stream}")
+        header, datos, h = abierto
+        datos += payload
+        if h is not None:
+            h.update(payload)
+        if len(datos) < header.get("filesize", 0):
+            return None
+        del self.flujos[stream]
+        if h is not None:
+            header["contenido"] = h.hexdigest()
+        return header, bytes(datos)
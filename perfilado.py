@@ -0,0 +1,248 @@
+"""Perfilado opcional del servidor y del cliente.
+
+Se activa con --perfil (o la variable CHAT_PERFIL) y una lista separada por
+comas de modos ("todo" = todos):
+
+- cprofile: cProfile del hilo principal y de los hilos marcados con en_hilo().
+  Cada hilo se suma al terminar; el .prof acumulado (snakeviz,
+  `python -m pstats`) se vuelca cada intervalo y al salir, con el hilo
+  principal incluido solo en el último.
+- muestreo: muestrea las pilas de todos los hilos cada CHAT_PERFIL_MUESTREO_MS
+  y vuelca cada intervalo un .folded (flamegraph.pl, speedscope, inferno).
+- memoria: tracemalloc; cada intervalo un .snap (tracemalloc.Snapshot.load) y
+  un .txt con los que más memoria reservan y lo que creció desde el anterior.
+- tiempos: duración de cada llamada a las funciones con @cronometrar, como
+  trazas JSON de Chrome (chrome://tracing, Perfetto) y un resumen en .txt.
+
+Los archivos van a --perfil-dir (CHAT_PERFIL_DIR, por defecto "perfiles") y se
+vuelcan cada CHAT_PERFIL_INTERVALO segundos.
+"""
+import atexit
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from metricas import Metricas
+
+MODOS = ("cprofile", "muestreo", "memoria", "tiempos")
+CARPETA_DEFECTO = os.environ.get("CHAT_PERFIL_DIR", "perfiles")
+INTERVALO = float(os.environ.get("CHAT_PERFIL_INTERVALO", "60"))
+MUESTREO_MS = float(os.environ.get("CHAT_PERFIL_MUESTREO_MS", "5"))
+TOP_MEMORIA = 25
+MAX_EVENTOS = 200_000  # trazas guardadas entre volcados (las demás se descartan)
+
+activos = set()
+_nombre = "chat"
+_carpeta = CARPETA_DEFECTO
+_lock = threading.Lock()
+_stats = None  # pstats.Stats acumulado de los hilos perfilados que terminaron
+_perfil_principal = None
+_muestras = Counter()
+_eventos = []
+_tiempos = Metricas()
+_snapshot_anterior = None
+_detener = threading.Event()
+
+
+def modos_desde_texto(texto):
+    modos = {m.strip().lower() for m in (texto or "").split(",") if m.strip()}
+    if "todo" in modos:
+        return set(MODOS)
+    desconocidos = modos - set(MODOS)
+    if desconocidos:
+        raise ValueError(f"Modos de perfilado desconocidos: {', '.join(sorted(desconocidos))}")
+    return modos
+
+
+def agregar_argumentos(parser):
+    """Añade --perfil y --perfil-dir a un argparse.ArgumentParser."""
+    parser.add_argument(
+        "--perfil",
+        default=os.environ.get("CHAT_PERFIL", ""),
+        help=f"modos de perfilado separados por comas: {', '.join(MODOS)} o todo",
+    )
+    parser.add_argument("--perfil-dir", default=CARPETA_DEFECTO, help="carpeta de salida")
+
+
+def iniciar(nombre, modos, carpeta=CARPETA_DEFECTO):
+    """Activa los modos pedidos. Llamar desde el hilo principal al arrancar."""
+    global _nombre, _carpeta, _perfil_principal
+    modos = modos_desde_texto(modos) if isinstance(modos, str) else set(modos)
+    if not modos:
+        return
+    _nombre, _carpeta = nombre, carpeta
+    os.makedirs(carpeta, exist_ok=True)
+    activos.update(modos)
+
+    if "cprofile" in activos:
+        _perfil_principal = cProfile.Profile()
+        _perfil_principal.enable()
+    if "memoria" in activos:
+        tracemalloc.start(10)
+    if "muestreo" in activos:
+        threading.Thread(target=_hilo_muestreo, name="perfil-muestreo", daemon=True).start()
+    threading.Thread(target=_hilo_volcado, name="perfil-volcado", daemon=True).start()
+    atexit.register(terminar)
+    print(f"[PERFIL] Activo: {', '.join(sorted(activos))} -> {os.path.abspath(carpeta)}")
+
+
+def terminar():
+    """Vuelca todo lo pendiente (se registra con atexit)."""
+    if _detener.is_set():
+        return
+    _detener.set()
+    if _perfil_principal is not None:
+        _perfil_principal.disable()
+        _acumular(_perfil_principal)
+    volcar()
+
+
+def _ruta(tipo, extension):
+    ahora = time.time()
+    marca = time.strftime("%Y%m%d-%H%M%S", time.localtime(ahora)) + f"{ahora % 1:.3f}"[1:]
+    return os.path.join(_carpeta, f"{_nombre}-{os.getpid()}-{tipo}-{marca}.{extension}")
+
+
+# ==== cProfile por hilo ====
+
+def en_hilo(func):
+    """Envuelve el destino de un hilo para perfilarlo con su propio cProfile."""
+    @functools.wraps(func)
+    def envoltura(*args, **kwargs):
+        if "cprofile" not in activos:
+            return func(*args, **kwargs)
+        perfil = cProfile.Profile()
+        perfil.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            perfil.disable()
+            _acumular(perfil)
+    return envoltura
+
+
+def _acumular(perfil):
+    global _stats
+    with _lock:
+        if _stats is None:
+            _stats = pstats.Stats(perfil)
+        else:
+            _stats.add(perfil)
+
+
+# ==== Muestreo de pilas ====
+
+def _hilo_muestreo():
+    propio = threading.get_ident()
+    nombres = {}
+    while not _detener.wait(MUESTREO_MS / 1000):
+        for ident, frame in sys._current_frames().items():
+            if ident == propio:
+                continue
+            pila = []
+            while frame is not None:
+                codigo = frame.f_code
+                pila.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if ident not in nombres:
+                nombres = {t.ident: t.name for t in threading.enumerate()}
+            pila.append(nombres.get(ident, str(ident)))
+            with _lock:
+                _muestras[";".join(reversed(pila))] += 1
+
+
+# ==== Temporizadores ====
+
+def cronometrar(func):
+    """Mide cada llamada a `func` cuando el modo "tiempos" está activo."""
+    nombre = func.__qualname__
+
+    @functools.wraps(func)
+    def envoltura(*args, **kwargs):
+        if "tiempos" not in activos:
+            return func(*args, **kwargs)
+        inicio = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            fin = time.perf_counter()
+            _tiempos.registrar(nombre, (fin - inicio) * 1000)
+            if len(_eventos) < MAX_EVENTOS:
+                _eventos.append((nombre, inicio, fin, threading.get_ident()))
+    return envoltura
+
+
+# ==== Volcados ====
+
+def _hilo_volcado():
+    while not _detener.wait(INTERVALO):
+        volcar()
+
+
+def volcar():
+    try:
+        if "cprofile" in activos:
+            with _lock:
+                if _stats is not None:
+                    _stats.dump_stats(_ruta("cprofile", "prof"))
+        if "muestreo" in activos:
+            _volcar_muestras()
+        if "memoria" in activos and tracemalloc.is_tracing():
+            _volcar_memoria()
+        if "tiempos" in activos:
+            _volcar_tiempos()
+    except Exception as e:
+        print(f"[PERFIL] Error al volcar: {e}")
+
+
+def _volcar_muestras():
+    with _lock:
+        muestras = dict(_muestras)
+        _muestras.clear()
+    if not muestras:
+        return
+    with open(_ruta("muestras", "folded"), "w", encoding="utf-8") as f:
+        for pila, cuenta in sorted(muestras.items()):
+            f.write(f"{pila} {cuenta}\n")
+
+
+def _volcar_memoria():
+    global _snapshot_anterior
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    snapshot.dump(_ruta("memoria", "snap"))
+
+    actual, pico = tracemalloc.get_traced_memory()
+    lineas = [f"Memoria reservada: {actual / 1024:.0f} KiB (pico {pico / 1024:.0f} KiB)", "", "Top:"]
+    lineas += [f"  {s}" for s in snapshot.statistics("lineno")[:TOP_MEMORIA]]
+    if _snapshot_anterior is not None:
+        lineas += ["", "Crecimiento desde el volcado anterior:"]
+        lineas += [f"  {s}" for s in snapshot.compare_to(_snapshot_anterior, "lineno")[:TOP_MEMORIA]]
+    _snapshot_anterior = snapshot
+    with open(_ruta("memoria", "txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lineas) + "\n")
+
+
+def _volcar_tiempos():
+    global _eventos
+    eventos, _eventos = _eventos, []
+    if not eventos:
+        return
+    pid = os.getpid()
+    trazas = [
+        {"name": nombre, "ph": "X", "ts": inicio * 1e6, "dur": (fin - inicio) * 1e6, "pid": pid, "tid": tid}
+        for nombre, inicio, fin, tid in eventos
+    ]
+    with open(_ruta("tiempos", "json"), "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": trazas, "displayTimeUnit": "ms"}, f)
+    with open(_ruta("tiempos", "txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(_tiempos.resumen()) + "\n")
@@ -0,0 +1,102 @@
+import wave
+
+import numpy as np
+
+# Detector de voz por energía para notas de voz
+TRAMA_MS = 20
+UMBRAL_MIN_DB = -50.0  # por debajo de esto siempre es silencio (dBFS)
+UMBRAL_MAX_DB = -35.0  # por encima de esto siempre es voz (dBFS)
+MARGEN_DB = 12.0  # voz = energía por encima del ruido de fondo + margen
+HANGOVER_MS = 200  # margen que se conserva alrededor de la voz
+MIN_VOZ_MS = 100  # menos voz que esto = grabación en silencio
+MAX_PAUSA_MS = 600  # las pausas internas más largas se acortan a esto
+BLOQUE_TRAMAS = 500  # tramas leídas del WAV por iteración (~10 s)
+
+
+def energia_tramas(ruta_wav):
+    """Energía (dBFS) de cada trama de TRAMA_MS, leyendo el WAV por bloques."""
+    with wave.open(ruta_wav, "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError("Solo se soportan WAV de 16 bits")
+        canales = wf.getnchannels()
+        trama = max(1, wf.getframerate() * TRAMA_MS // 1000)
+        partes = []
+        while True:
+            data = wf.readframes(trama * BLOQUE_TRAMAS)
+            if not data:
+                break
+            pcm = np.frombuffer(data, dtype=np.int16)[::canales]
+            n = len(pcm) // trama
+            if n == 0:
+                break  # trama final incompleta: se ignora
+            x = pcm[: n * trama].reshape(n, trama)
+            potencia = np.einsum("ij,ij->i", x, x, dtype=np.float64) / trama
+            partes.append(10 * np.log10(potencia / 32768.0**2 + 1e-12))
+    energia = np.concatenate(partes) if partes else np.zeros(0)
+    return energia, trama
+
+
+def segmentos_voz(energia, comprimir_pausas=True):
+    """Devuelve [(trama_inicio, trama_fin)] a conservar, o [] si todo es silencio."""
+    if not len(energia):
+        return []
+    piso = np.percentile(energia, 10)
+    umbral = min(max(piso + MARGEN_DB, UMBRAL_MIN_DB), UMBRAL_MAX_DB)
+    voz = energia > umbral
+    if voz.sum() < MIN_VOZ_MS // TRAMA_MS:
+        return []
+
+    # Extender la voz HANGOVER_MS hacia ambos lados para no cortar sílabas
+    hang = HANGOVER_MS // TRAMA_MS
+    voz = np.convolve(voz, np.ones(2 * hang + 1))[hang : hang + len(voz)] > 0
+
+    # Tramos de voz: cambios 0->1 (inicio) y 1->0 (fin)
+    bordes = np.diff(np.concatenate(([0], voz.astype(np.int8), [0])))
+    inicios = np.flatnonzero(bordes == 1)
+    fines = np.flatnonzero(bordes == -1)
+
+    if not comprimir_pausas:
+        return [(int(inicios[0]), int(fines[-1]))]
+
+    # Las pausas largas se reducen a MAX_PAUSA_MS, mitad a cada lado
+    max_pausa = MAX_PAUSA_MS // TRAMA_MS
+    segmentos = [[int(inicios[0]), int(fines[0])]]
+    for ini, fin in zip(inicios[1:], fines[1:]):
+        pausa = ini - segmentos[-1][1]
+        if pausa <= max_pausa:
+            segmentos[-1][1] = int(fin)
+        else:
+            segmentos[-1][1] += max_pausa // 2
+            segmentos.append([int(ini) - max_pausa // 2, int(fin)])
+    return [tuple(s) for s in segmentos]
+
+
+def recortar_wav(ruta_in, ruta_out, comprimir_pausas=True):
+    """Copia a ruta_out solo la parte con voz de ruta_in.
+
+    Devuelve (segundos_originales, segundos_resultantes), o None si la grabación
+    es todo silencio (en ese caso no se escribe nada).
+    """
+    energia, trama = energia_tramas(ruta_in)
+    segmentos = segmentos_voz(energia, comprimir_pausas)
+    if not segmentos:
+        return None
+
+    with wave.open(ruta_in, "rb") as wi, wave.open(ruta_out, "wb") as wo:
+        wo.setparams(wi.getparams())
+        total = wi.getnframes()
+        escritos = 0
+        for ini, fin in segmentos:
+            desde = ini * trama
+            restante = min(fin * trama, total) - desde
+            wi.setpos(desde)
+            while restante > 0:
+                data = wi.readframes(min(restante, trama * BLOQUE_TRAMAS))
+                if not data:
+                    break
+                wo.writeframesraw(data)
+                leidos = len(data) // (wi.getsampwidth() * wi.getnchannels())
+                restante -= leidos
+                escritos += leidos
+        tasa = wi.getframerate()
+    return total / tasa, escritos / tasa
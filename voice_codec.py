@@ -0,0 +1,142 @@
+import wave
+
+import numpy as np
+
+# Codecs de voz soportados, en orden de preferencia
+CODECS = ("mulaw16k",)
+
+RATE_CODEC = 16000
+MU = 255
+TAPS = 31  # coeficientes del filtro anti-aliasing
+BLOQUE = 44100  # frames leídos del WAV por iteración al codificar
+
+# Tablas μ-law precalculadas: int16 -> byte y byte -> int16
+_y = np.arange(256) / 127.5 - 1.0
+_TABLA_DECODIFICAR = np.round(
+    np.sign(_y) * ((1.0 + MU) ** np.abs(_y) - 1.0) / MU * 32767
+).astype(np.int16)
+_x = np.arange(-32768, 32768) / 32768.0
+_TABLA_CODIFICAR = np.round(
+    (np.sign(_x) * np.log1p(MU * np.abs(_x)) / np.log1p(MU) + 1.0) * 127.5
+).astype(np.uint8)
+del _x, _y
+
+
+def _filtro_paso_bajo(rate_in, rate_out, taps=TAPS):
+    """FIR de sinc enventanada con corte algo por debajo de Nyquist de salida."""
+    fc = 0.45 * rate_out / rate_in
+    n = np.arange(taps) - (taps - 1) / 2
+    h = 2 * fc * np.sinc(2 * fc * n) * np.hamming(taps)
+    return h / h.sum()
+
+
+def mulaw_codificar(pcm):
+    """int16 -> bytes μ-law (1 byte por muestra)."""
+    return _TABLA_CODIFICAR[pcm.astype(np.int32) + 32768].tobytes()
+
+
+def mulaw_decodificar(datos):
+    """bytes μ-law -> int16."""
+    return _TABLA_DECODIFICAR[np.frombuffer(datos, dtype=np.uint8)]
+
+
+class Remuestreador:
+    """Remuestreo por bloques (filtro FIR + interpolación lineal) con estado
+    entre bloques, para poder procesar grabaciones largas en memoria constante."""
+
+    def __init__(self, rate_in, rate_out=RATE_CODEC):
+        self.paso = rate_in / rate_out
+        self.h = _filtro_paso_bajo(rate_in, rate_out) if rate_out < rate_in else np.array([1.0])
+        self._historia = np.zeros(len(self.h) - 1)
+        self._previa = None  # última muestra filtrada del bloque anterior
+        self._n = 0  # índice global de la primera muestra filtrada del bloque
+        self._k = 0  # índice de la próxima muestra de salida
+
+    def procesar(self, muestras):
+        buf = np.concatenate((self._historia, muestras.astype(np.float64)))
+        filtrado = np.convolve(buf, self.h, mode="valid")
+        self._historia = buf[len(buf) - (len(self.h) - 1):]
+        if not len(filtrado):
+            return np.zeros(0, dtype=np.int16)
+
+        if self._previa is None:
+            inicio, segmento = self._n, filtrado
+        else:
+            inicio, segmento = self._n - 1, np.concatenate(([self._previa], filtrado))
+        fin = self._n + len(filtrado) - 1
+
+        k_fin = int(np.floor(fin / self.paso)) + 1
+        posiciones = np.arange(self._k, k_fin) * self.paso
+        salida = np.interp(posiciones, np.arange(inicio, fin + 1), segmento)
+
+        self._k = max(self._k, k_fin)
+        self._previa = filtrado[-1]
+        self._n += len(filtrado)
+        return np.clip(np.round(salida), -32768, 32767).astype(np.int16)
+
+    def finalizar(self):
+        """Vacía el filtro (su retardo) al terminar la señal."""
+        return self.procesar(np.zeros((len(self.h) - 1) // 2))
+
+
+class CodificadorStream:
+    """Codifica PCM int16 (bytes) trozo a trozo, p. ej. para audio en vivo."""
+
+    def __init__(self, rate_in, codec="mulaw16k"):
+        if codec != "mulaw16k":
+            raise ValueError(f"Codec no soportado: {codec}")
+        self._r = Remuestreador(rate_in)
+
+    def codificar(self, datos):
+        return mulaw_codificar(self._r.procesar(np.frombuffer(datos, dtype=np.int16)))
+
+    def finalizar(self):
+        return mulaw_codificar(self._r.finalizar())
+
+
+def codificar(pcm, rate, codec="mulaw16k"):
+    """Codifica un array int16 mono completo (usado por benchmarks y pruebas)."""
+    if codec != "mulaw16k":
+        raise ValueError(f"Codec no soportado: {codec}")
+    r = Remuestreador(rate)
+    return mulaw_codificar(np.concatenate((r.procesar(pcm), r.finalizar())))
+
+
+def decodificar(datos, codec="mulaw16k"):
+    """Devuelve (pcm int16, rate) de un payload codificado."""
+    if codec != "mulaw16k":
+        raise ValueError(f"Codec no soportado: {codec}")
+    return mulaw_decodificar(datos), RATE_CODEC
+
+
+def codificar_archivo(ruta_wav, ruta_salida, codec="mulaw16k"):
+    """Codifica un WAV de 16 bits leyéndolo por bloques. Devuelve el tamaño escrito."""
+    if codec != "mulaw16k":
+        raise ValueError(f"Codec no soportado: {codec}")
+
+    escrito = 0
+    with wave.open(ruta_wav, "rb") as wf, open(ruta_salida, "wb") as out:
+        if wf.getsampwidth() != 2:
+            raise ValueError("Solo se pueden codificar WAV de 16 bits")
+        canales = wf.getnchannels()
+        r = Remuestreador(wf.getframerate())
+        while True:
+            data = wf.readframes(BLOQUE)
+            if not data:
+                break
+            pcm = np.frombuffer(data, dtype=np.int16)
+            if canales > 1:
+                pcm = pcm.reshape(-1, canales).mean(axis=1)
+            escrito += out.write(mulaw_codificar(r.procesar(pcm)))
+        escrito += out.write(mulaw_codificar(r.finalizar()))
+    return escrito
+
+
+def decodificar_a_wav(datos, ruta_wav, codec="mulaw16k"):
+    """Decodifica un payload recibido y lo guarda como WAV reproducible."""
+    pcm, rate = decodificar(datos, codec)
+    with wave.open(ruta_wav, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm.tobytes())
@@ -0,0 +1,74 @@
+import os
+import wave
+
+import numpy as np
+from PIL import Image
+
+# Tamaño de la vista previa de las notas de voz
+BINS = 160  # columnas (una por bin)
+ALTO = 32
+COLOR_PICO = (120, 160, 255, 255)
+COLOR_RMS = (40, 80, 200, 255)
+
+
+def ruta_resumen(ruta_wav):
+    return ruta_wav + ".onda.npy"
+
+
+def ruta_preview(ruta_wav):
+    return ruta_wav + ".onda.png"
+
+
+def resumen_onda(pcm, bins=BINS):
+    """Devuelve un array (2, bins) con pico y RMS normalizados (0..1) por bin."""
+    if len(pcm) < bins:
+        pcm = np.pad(pcm, (0, bins - len(pcm)))
+    por_bin = len(pcm) // bins
+    x = pcm[: por_bin * bins].reshape(bins, por_bin)
+
+    picos = np.maximum(x.max(axis=1).astype(np.int32), -x.min(axis=1).astype(np.int32))
+    rms = np.sqrt(np.einsum("ij,ij->i", x, x, dtype=np.float64) / por_bin)
+    return np.stack((picos / 32768.0, rms / 32768.0)).astype(np.float32)
+
+
+def leer_pcm(ruta_wav):
+    """Lee un WAV de 16 bits como int16 mono."""
+    with wave.open(ruta_wav, "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError("Solo se soportan WAV de 16 bits")
+        canales = wf.getnchannels()
+        pcm = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+    if canales > 1:
+        pcm = pcm[::canales]  # basta un canal para la vista previa
+    return pcm
+
+
+def dibujar_onda(resumen, alto=ALTO):
+    """Rasteriza el resumen a una imagen RGBA (picos claros, RMS oscuro)."""
+    picos, rms = resumen
+    # Escala un poco los valores para que las voces bajas también se vean
+    escala = 1.0 / max(float(picos.max()), 1e-3)
+    distancia = np.abs(np.arange(alto) - (alto - 1) / 2)[:, None]
+    mitad = alto / 2
+
+    img = np.zeros((alto, len(picos), 4), dtype=np.uint8)
+    img[distancia <= np.maximum(picos * escala * mitad, 0.5)] = COLOR_PICO
+    img[distancia <= rms * escala * mitad] = COLOR_RMS
+    return Image.fromarray(img, "RGBA")
+
+
+def generar_preview(ruta_wav):
+    """Calcula (o reutiliza) el resumen y la imagen junto al WAV. Devuelve la ruta del PNG."""
+    png = ruta_preview(ruta_wav)
+    if os.path.exists(png):
+        return png
+
+    npy = ruta_resumen(ruta_wav)
+    if os.path.exists(npy):
+        resumen = np.load(npy)
+    else:
+        resumen = resumen_onda(leer_pcm(ruta_wav))
+        np.save(npy, resumen)
+
+    dibujar_onda(resumen).save(png)
+    return png